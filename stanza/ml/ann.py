@@ -0,0 +1,241 @@
+"""
+Approximate nearest neighbor search in NumPy, with an inverted file (IVF) index.
+
+The vectors are clustered with k-means into `n_lists` lists. A query is only compared to the vectors of the
+`n_probe` lists whose centroids score highest against it, so recall and speed are traded off with `n_probe`:
+`n_probe = n_lists` is an exact search.
+
+Example:
+
+.. code-block:: python
+
+    index = IVFIndex(n_lists=1024).fit(data)
+    ids, scores = index.search(data, queries, k=10, n_probe=16)
+    index.save('vectors.ann.npz')
+    index = IVFIndex.load('vectors.ann.npz')
+"""
+import numpy as np
+
+
+def top_k(scores, k):
+    """Select the k highest scores of every row of a matrix.
+
+    :param (np.array) scores: matrix of shape `(n_rows, n_columns)`, with `k <= n_columns`
+    :param (int) k: number of scores to select
+
+    :return (tuple[np.array, np.array]): the columns and the values of the top scores of each row, both of shape
+        `(n_rows, k)`, in descending order
+    """
+    rows = np.arange(len(scores))[:, np.newaxis]
+    if k < scores.shape[1]:
+        columns = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        columns = np.tile(np.arange(scores.shape[1]), (len(scores), 1))
+    top = scores[rows, columns]
+    order = np.argsort(-top, axis=1, kind='mergesort')
+    return columns[rows, order], top[rows, order]
+
+
+def _normalize(vectors):
+    """L2-normalize the rows of a matrix in place. Rows of zeros stay zeros."""
+    norms = np.sqrt(np.einsum('ij,ij->i', vectors, vectors))
+    norms[norms == 0] = 1
+    vectors /= norms[:, np.newaxis]
+
+
+def assign_clusters(data, centroids, euclidean=False, chunk_size=None):
+    """Find the nearest centroid of every vector.
+
+    :param (np.array) data: matrix of shape `(n_vectors, dim)`
+    :param (np.array) centroids: matrix of shape `(n_clusters, dim)`
+    :param (bool) euclidean: whether nearest means the smallest Euclidean distance, rather than the highest inner
+        product
+    :param (int) chunk_size: number of vectors scored at a time. Defaults to as many as fit in a score matrix of
+        2 ** 18 elements, which stays in cache.
+
+    :return (np.array): the index of the nearest centroid of every vector
+    """
+    # |x - c|^2 = |x|^2 - 2 x.c + |c|^2, so the nearest centroid maximizes x.c - |c|^2 / 2
+    bias = -0.5 * np.einsum('ij,ij->i', centroids, centroids) if euclidean else 0
+    if chunk_size is None:
+        chunk_size = max(1, 2 ** 18 // len(centroids))
+    assignments = np.empty(len(data), dtype=np.int64)
+    for i in range(0, len(data), chunk_size):
+        scores = np.asarray(data[i:i + chunk_size]).dot(centroids.T)
+        scores += bias
+        assignments[i:i + chunk_size] = scores.argmax(axis=1)
+    return assignments
+
+
+def kmeans(sample, n_clusters, n_iter=10, rng=None, euclidean=False):
+    """Cluster vectors with Lloyd's algorithm, starting from randomly chosen vectors.
+
+    Clusters that end up empty are re-seeded with random vectors. Unless `euclidean` is set, vectors are assigned
+    by inner product and the centroids are L2-normalized after every update (spherical k-means), so that the
+    assignment doesn't favour centroids of larger norm.
+
+    :param (np.array) sample: matrix of shape `(n_vectors, dim)`, with at least n_clusters vectors
+    :param (int) n_clusters: number of clusters
+    :param (int) n_iter: number of iterations
+    :param (np.random.RandomState) rng: source of the random choices
+    :param (bool) euclidean: how vectors are assigned to centroids (see `assign_clusters`)
+
+    :return (np.array): the float32 centroids, of shape `(n_clusters, dim)`
+    """
+    rng = rng or np.random.RandomState(0)
+    sample = np.asarray(sample, dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), n_clusters, replace=False)].copy()
+    if not euclidean:
+        _normalize(centroids)
+    for _ in range(n_iter):
+        assignments = assign_clusters(sample, centroids, euclidean=euclidean)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        order = np.argsort(assignments, kind='mergesort')
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        nonempty = counts > 0
+        # sum the vectors of each cluster with one pass over the sample sorted by cluster
+        centroids[nonempty] = np.add.reduceat(sample[order], starts[nonempty]) / counts[nonempty, np.newaxis]
+        centroids[~nonempty] = sample[rng.choice(len(sample), (~nonempty).sum())]
+        if not euclidean:
+            _normalize(centroids)
+    return centroids
+
+
+class IVFIndex(object):
+    """
+    An inverted file index over a matrix of vectors, scored by inner product.
+
+    The lists are clusters of spherical k-means: vectors are assigned to the unit-norm centroid with the highest
+    inner product.
+
+    For cosine similarity, fit and search it with L2-normalized vectors (see `Embeddings.normalized_array`).
+    The index only stores the centroids and the ids of each list; the vectors are passed to `search`, so the
+    index is small to save and can be used with a memory-mapped matrix.
+    """
+
+    def __init__(self, n_lists=None, n_probe=8, n_iter=10, sample_size=None, seed=0):
+        """
+        Constructor.
+        :param (int) n_lists: number of lists (k-means clusters). Defaults to the square root of the number of
+            vectors.
+        :param (int) n_probe: default number of lists searched per query.
+        :param (int) n_iter: number of k-means iterations.
+        :param (int) sample_size: number of vectors k-means is trained on. Defaults to 64 per list.
+        :param (int) seed: seed of the k-means initialization.
+        """
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.sample_size = sample_size
+        self.seed = seed
+        self.centroids = None
+        self.ids = None
+        self.offsets = None
+
+    def fit(self, data):
+        """Cluster the vectors and build the lists.
+
+        :param (np.array) data: matrix of shape `(n_vectors, dim)`
+        :return (IVFIndex): this index
+        """
+        n = len(data)
+        n_lists = min(self.n_lists or max(1, int(np.sqrt(n))), n)
+        rng = np.random.RandomState(self.seed)
+        sample_size = min(self.sample_size or 64 * n_lists, n)
+        sample = np.asarray(data[np.sort(rng.choice(n, sample_size, replace=False))], dtype=np.float32)
+
+        centroids = kmeans(sample, n_lists, n_iter=self.n_iter, rng=rng)
+        assignments = assign_clusters(data, centroids)
+        self.centroids = centroids
+        self.ids = np.argsort(assignments, kind='mergesort')
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=n_lists))])
+        self.n_lists = n_lists
+        return self
+
+    def search(self, data, queries, k, n_probe=None):
+        """Find the approximate k nearest neighbors of each query, in terms of highest inner products.
+
+        :param (np.array) data: the matrix of vectors the index was fit on
+        :param (np.array) queries: matrix of query vectors, of shape `(n_queries, dim)`
+        :param (int) k: number of neighbors to return
+        :param (int) n_probe: number of lists to search per query. Defaults to the index's `n_probe`.
+
+        :return (tuple[np.array, np.array]): the ids and the scores of the neighbors, both of shape
+            `(n_queries, k)`, in descending order of score. If fewer than k vectors are found for a query, the
+            remaining ids are -1 and the scores -inf.
+        """
+        if self.centroids is None:
+            raise ValueError('the index has not been fit')
+        if self.offsets[-1] != len(data):
+            raise ValueError('the index was fit on {} vectors, not {}'.format(self.offsets[-1], len(data)))
+        queries = np.asarray(queries, dtype=np.float32)
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        k = min(k, len(data))
+
+        list_scores = queries.dot(self.centroids.T)
+        if n_probe < self.n_lists:
+            probes = np.argpartition(-list_scores, n_probe - 1, axis=1)[:, :n_probe]
+        else:
+            probes = np.tile(np.arange(self.n_lists), (len(queries), 1))
+
+        # visit every probed list once, scoring all the queries that probe it with one matrix product, and keep
+        # the top k of each (query, list) pair
+        probe_queries = np.repeat(np.arange(len(queries)), n_probe)
+        probe_lists = probes.ravel()
+        order = np.argsort(probe_lists, kind='mergesort')
+        probe_queries, probe_lists = probe_queries[order], probe_lists[order]
+        bounds = np.flatnonzero(np.diff(probe_lists)) + 1
+        found_queries, found_ids, found_scores = [], [], []
+        for group in np.split(np.arange(len(probe_lists)), bounds):
+            if not len(group):
+                continue
+            l = probe_lists[group[0]]
+            list_ids = self.ids[self.offsets[l]:self.offsets[l + 1]]
+            if not len(list_ids):
+                continue
+            group_queries = probe_queries[group]
+            group_scores = queries[group_queries].dot(np.asarray(data[list_ids]).T)
+            top, top_scores = top_k(group_scores, min(k, len(list_ids)))
+            found_queries.append(np.repeat(group_queries, top.shape[1]))
+            found_ids.append(list_ids[top].ravel())
+            found_scores.append(top_scores.ravel())
+
+        # merge the candidates of each query: sort them by query, then by descending score, and keep the first k
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        if found_queries:
+            found_queries = np.concatenate(found_queries)
+            found_ids = np.concatenate(found_ids)
+            found_scores = np.concatenate(found_scores)
+            order = np.lexsort((-found_scores, found_queries))
+            found_queries, found_ids, found_scores = found_queries[order], found_ids[order], found_scores[order]
+            starts = np.searchsorted(found_queries, np.arange(len(queries)))
+            ranks = np.arange(len(found_queries)) - starts[found_queries]
+            kept = ranks < k
+            ids[found_queries[kept], ranks[kept]] = found_ids[kept]
+            scores[found_queries[kept], ranks[kept]] = found_scores[kept]
+        return ids, scores
+
+    def save(self, path):
+        """Save the index to a `.npz` file.
+
+        :param (str) path: path of the file to write to, or a file object
+        """
+        np.savez(path, centroids=self.centroids, ids=self.ids, offsets=self.offsets,
+                 params=np.array([self.n_lists, self.n_probe, self.n_iter, self.seed]))
+
+    @classmethod
+    def load(cls, path, n_vectors=None):
+        """Load an index saved with `save`.
+
+        :param (str) path: file to read from
+        :param (int) n_vectors: if given, the number of vectors the index must have been fit on
+        :return (IVFIndex): the index
+        """
+        with np.load(path) as f:
+            n_lists, n_probe, n_iter, seed = f['params'].tolist()
+            index = cls(n_lists=n_lists, n_probe=n_probe, n_iter=n_iter, seed=seed)
+            index.centroids, index.ids, index.offsets = f['centroids'], f['ids'], f['offsets']
+        if n_vectors is not None and index.offsets[-1] != n_vectors:
+            raise ValueError('the index in {} was fit on {} vectors, not {}'.format(path, index.offsets[-1], n_vectors))
+        return index
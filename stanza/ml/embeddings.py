@@ -1,17 +1,56 @@
-from collections import Mapping
-from contextlib import contextmanager
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+from itertools import islice
 import logging
+import mmap
+import os
+import zlib
 import numpy as np
+from stanza.ml.ann import IVFIndex, top_k
+from stanza.ml.quantization import QuantizedMatrix, load_quantized, quantize
 from stanza.text import Vocab
+from stanza.text.embedding_parser import parse_lines
+from stanza.text.vocab import MappedVocab, invert_index_map
 
 
 __author__ = 'kelvinguu'
 
 
+def _fingerprint(array, chunk_size=65536):
+    """A string that identifies the contents of a matrix: its shape, dtype and the crc32 of its values.
+
+    :param (np.array) array: matrix, possibly memory-mapped or quantized
+    """
+    crc = 0
+    for i in range(0, len(array), chunk_size):
+        crc = zlib.crc32(np.ascontiguousarray(array[i:i + chunk_size]).data, crc)
+    return '{} {} {}'.format(array.dtype, array.shape, crc & 0xffffffff)
+
+
+def _normalize_rows(array, out=None, chunk_size=65536):
+    """L2-normalize the rows of a matrix, in chunks, as float32. Rows of zeros stay zeros.
+
+    :param (np.array) array: matrix to normalize
+    :param (np.array) out: float32 matrix of the same shape to write to. Defaults to a new array.
+
+    :return (np.array): the normalized matrix
+    """
+    if out is None:
+        out = np.empty(array.shape, dtype=np.float32)
+    for i in range(0, len(array), chunk_size):
+        chunk = np.asarray(array[i:i + chunk_size], dtype=np.float32)
+        norms = np.sqrt(np.einsum('ij,ij->i', chunk, chunk))
+        norms[norms == 0] = 1
+        out[i:i + chunk_size] = chunk / norms[:, np.newaxis]
+    return out
+
+
 class Embeddings(Mapping):
     """A map from strings to vectors.
 
-    Vectors are stored as a numpy array.
+    Vectors are stored as a numpy array, or as a compressed `QuantizedMatrix` (see `quantize`).
     Vectors are saved/loaded from disk using numpy.load, which is roughly 3-4 times faster
     than reading a text file.
     """
@@ -19,7 +58,7 @@ class Embeddings(Mapping):
     def __init__(self, array, vocab):
         """Create embeddings object.
 
-        :param (np.array) array: has shape (vocab_size, embed_dim)
+        :param (np.array) array: has shape (vocab_size, embed_dim). It may also be a `QuantizedMatrix`.
         :param (Vocab) vocab: a Vocab object
         """
         assert len(array.shape) == 2
@@ -27,6 +66,32 @@ class Embeddings(Mapping):
 
         self.array = array
         self.vocab = vocab
+        self._normalized = None
+        self._normalized_path = None
+        self.ann_index = None
+        self._ann_path = None
+        self._mapped_prefix = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self._mapped_prefix is not None:
+            # mapped embeddings pickle as their paths, so that worker processes map the files instead of receiving
+            # copies. A normalized matrix that is held in memory is not sent.
+            del state['array'], state['vocab']
+            state['_normalized'] = None
+            if self._ann_path is not None:
+                state['ann_index'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if 'array' not in state:
+            self.array = self._load_array(self._mapped_prefix, mmap=True)
+            self.vocab = self._load_mapped_vocab(self._mapped_prefix)
+            if self._normalized_path is not None:
+                self._normalized = np.load(self._normalized_path, mmap_mode='r')
+            if self._ann_path is not None:
+                self.ann_index = IVFIndex.load(self._ann_path, n_vectors=len(self.array))
 
     def __getitem__(self, w):
         idx = self.vocab.word2index(w)
@@ -42,9 +107,12 @@ class Embeddings(Mapping):
         return item in self.vocab
 
     def subset(self, words):
-        sub_vocab = self.vocab.subset(words)
-        idxs = [self.vocab[w] for w in sub_vocab]
-        sub_array = self.array[idxs]
+        sub_vocab, old_to_new = self.vocab.subset(words, return_mapping=True)
+        indices = invert_index_map(old_to_new, len(sub_vocab))
+        if isinstance(self.array, QuantizedMatrix):
+            sub_array = self.array.take(indices)
+        else:
+            sub_array = self.array[indices]
         return self.__class__(sub_array, sub_vocab)
 
     def inner_products(self, vec):
@@ -74,41 +142,184 @@ class Embeddings(Mapping):
             w2s[self.vocab.index2word(ids[i])] = scores[i]
         return w2s
 
-    def k_nearest(self, vec, k):
-        """Get the k nearest neighbors of a vector (in terms of highest inner products).
+    METRICS = ('dot', 'cosine')
+
+    def normalized_array(self, mmap_path=None):
+        """Get a float32 copy of the embedding matrix with L2-normalized rows, for cosine similarity.
+
+        It is computed on first use and cached. Rows of zeros stay zeros. The cache assumes that `array` isn't
+        modified afterwards. If `array` is quantized, the normalized matrix is a `QuantizedMatrix` that shares its
+        codes and only stores new row scales, so it takes no float32 copy.
+
+        :param (str) mmap_path: if given, the normalized matrix is stored in this `.npy` file and memory-mapped
+            (read-only), instead of held in memory. A fingerprint of `array` is stored in `<mmap_path>.fingerprint`,
+            and an existing file is only reused if it was computed from a matrix with the same fingerprint. Ignored
+            if `array` is quantized.
+
+        :return (np.array): the normalized matrix
+        """
+        if self._normalized is None:
+            if isinstance(self.array, QuantizedMatrix):
+                self._normalized = self.array.normalized()
+            elif mmap_path is None:
+                self._normalized = _normalize_rows(self.array)
+            else:
+                fingerprint_path = mmap_path + '.fingerprint'
+                fingerprint = _fingerprint(self.array)
+                try:
+                    with open(fingerprint_path) as f:
+                        reuse = f.read() == fingerprint and os.path.isfile(mmap_path)
+                except IOError:
+                    reuse = False
+                if not reuse:
+                    if os.path.isfile(mmap_path):
+                        logging.warn('{} was computed from another matrix; rebuilding it'.format(mmap_path))
+                    if os.path.isfile(fingerprint_path):
+                        os.remove(fingerprint_path)
+                    out = np.lib.format.open_memmap(mmap_path, mode='w+', dtype=np.float32, shape=self.array.shape)
+                    _normalize_rows(self.array, out)
+                    out.flush()
+                    del out
+                    # written last, so that an interrupted run isn't reused
+                    with open(fingerprint_path, 'w') as f:
+                        f.write(fingerprint)
+                self._normalized = np.load(mmap_path, mmap_mode='r')
+                self._normalized_path = mmap_path
+        return self._normalized
+
+    def _metric_array(self, metric):
+        if metric not in self.METRICS:
+            raise ValueError('metric must be one of {}, not {!r}'.format(self.METRICS, metric))
+        return self.normalized_array() if metric == 'cosine' else self.array
+
+    def k_nearest(self, vec, k, metric='dot'):
+        """Get the k nearest neighbors of a vector (by default, in terms of highest inner products).
 
         :param (np.array) vec: query vector
         :param (int) k: number of top neighbors to return
+        :param (str) metric: 'dot' for inner products, or 'cosine' for cosine similarity
 
         :return (list[tuple[str, float]]): a list of (word, score) pairs, in descending order
         """
-        nbr_score_pairs = self.inner_products(vec)
-        return sorted(nbr_score_pairs.items(), key=lambda x: x[1], reverse=True)[:k]
+        ids, scores = self.k_nearest_batch(np.asarray(vec)[np.newaxis], k, metric=metric)
+        return [(self.vocab.index2word(i), s) for i, s in zip(ids[0], scores[0])]
+
+    def k_nearest_batch(self, queries, k, chunk_size=None, metric='dot'):
+        """Get the k nearest neighbors of each of a batch of vectors (by default, in terms of highest inner products).
+
+        Scores are computed for a chunk of queries at a time, and the top k of each query are selected with
+        `np.argpartition`, so only the k results are sorted.
+
+        :param (np.array) queries: matrix of query vectors, of shape `(n_queries, embed_dim)`
+        :param (int) k: number of top neighbors to return
+        :param (int) chunk_size: number of queries scored at a time. Defaults to as many as fit in a score
+            matrix of about 2 ** 24 elements.
+        :param (str) metric: 'dot' for inner products, or 'cosine' for cosine similarity, which uses the cached
+            `normalized_array`
+
+        :return (tuple[np.array, np.array]): the ids and the scores of the neighbors, both of shape
+            `(n_queries, k)`, in descending order of score
+        """
+        array = self._metric_array(metric)
+        queries = np.asarray(queries)
+        if metric == 'cosine':
+            queries = _normalize_rows(queries)
+        k = min(k, len(array))
+        if chunk_size is None:
+            chunk_size = max(1, 2 ** 24 // max(len(array), 1))
+        ids = np.empty((len(queries), k), dtype=np.int64)
+        scores = np.empty((len(queries), k), dtype=np.result_type(array.dtype, queries.dtype))
+        for i in range(0, len(queries), chunk_size):
+            chunk_scores = array.dot(queries[i:i + chunk_size].T).T
+            ids[i:i + chunk_size], scores[i:i + chunk_size] = top_k(chunk_scores, k)
+        return ids, scores
+
+    def pairwise_similarity(self, words=None, other=None, other_words=None, metric='cosine', chunk_size=1024):
+        """Get the similarity between every pair of words from two lists.
+
+        The rows are words of these embeddings, and the columns words of `other` (by default, these embeddings
+        too). The matrix is computed `chunk_size` rows at a time.
+
+        :param (list[str]) words: words of the rows. Defaults to every word, in index order.
+        :param (Embeddings) other: embeddings of the columns. Defaults to these embeddings.
+        :param (list[str]) other_words: words of the columns. Defaults to every word of `other`, in index order.
+        :param (str) metric: 'cosine' for cosine similarity, or 'dot' for inner products
+        :param (int) chunk_size: number of rows computed at a time
+
+        :return (np.array): a float32 matrix of shape `(len(words), len(other_words))`
+        """
+        other = self if other is None else other
+        array = self._metric_array(metric)
+        other_array = other._metric_array(metric)
+        if words is not None:
+            array = array[np.array(self.vocab.words2indices(words), dtype=np.int64)]
+        if other_words is not None:
+            other_array = other_array[np.array(other.vocab.words2indices(other_words), dtype=np.int64)]
+
+        result = np.empty((len(array), len(other_array)), dtype=np.float32)
+        for i in range(0, len(array), chunk_size):
+            result[i:i + chunk_size] = other_array.dot(np.asarray(array[i:i + chunk_size]).T).T
+        return result
+
+    def build_ann_index(self, n_lists=None, n_probe=8, **kwargs):
+        """Build the approximate nearest neighbor index used by `k_nearest_approx`.
+
+        It is an `IVFIndex` over `normalized_array`, so it searches by cosine similarity. It is saved with
+        `to_file_path` and loaded back by `from_file_path`.
+
+        :param (int) n_lists: number of lists of the index. Defaults to the square root of the vocab size.
+        :param (int) n_probe: default number of lists searched per query. Higher is slower, with better recall.
+        :param kwargs: other arguments of `IVFIndex`
+
+        :return (IVFIndex): the index, also stored as `ann_index`
+        """
+        self.ann_index = IVFIndex(n_lists=n_lists, n_probe=n_probe, **kwargs).fit(self.normalized_array())
+        self._ann_path = None
+        return self.ann_index
+
+    def k_nearest_approx_batch(self, queries, k, n_probe=None):
+        """Get the approximate k nearest neighbors of each of a batch of vectors (in terms of cosine similarity).
 
-    def _init_lsh_forest(self):
-        """Construct an LSH forest for nearest neighbor search."""
-        import sklearn.neighbors
-        lshf = sklearn.neighbors.LSHForest()
-        lshf.fit(self.array)
-        return lshf
+        The index is built with default settings on first use, unless `build_ann_index` was called.
 
-    def k_nearest_approx(self, vec, k):
+        :param (np.array) queries: matrix of query vectors, of shape `(n_queries, embed_dim)`
+        :param (int) k: number of top neighbors to return
+        :param (int) n_probe: number of lists of the index to search. Defaults to the index's `n_probe`.
+
+        :return (tuple[np.array, np.array]): the ids and the scores of the neighbors, both of shape
+            `(n_queries, k)`, in descending order of score. Missing neighbors have id -1.
+        """
+        if self.ann_index is None:
+            self.build_ann_index()
+        queries = _normalize_rows(np.asarray(queries))
+        return self.ann_index.search(self.normalized_array(), queries, k, n_probe=n_probe)
+
+    def k_nearest_approx(self, vec, k, n_probe=None):
         """Get the k nearest neighbors of a vector (in terms of cosine similarity).
 
         :param (np.array) vec: query vector
         :param (int) k: number of top neighbors to return
+        :param (int) n_probe: number of lists of the index to search (see `k_nearest_approx_batch`)
 
         :return (list[tuple[str, float]]): a list of (word, cosine similarity) pairs, in descending order
         """
-        if not hasattr(self, 'lshf'):
-            self.lshf = self._init_lsh_forest()
+        ids, scores = self.k_nearest_approx_batch(np.asarray(vec)[np.newaxis], k, n_probe=n_probe)
+        return [(self.vocab.index2word(i), s) for i, s in zip(ids[0], scores[0]) if i >= 0]
 
-        # TODO(kelvin): make this inner product score, to be consistent with k_nearest
-        distances, neighbors = self.lshf.kneighbors([vec], n_neighbors=k, return_distance=True)
-        scores = np.subtract(1, distances)
-        nbr_score_pairs = self._word_to_score(np.squeeze(neighbors), np.squeeze(scores))
+    def quantize(self, mode, **kwargs):
+        """Compress the embedding matrix.
 
-        return sorted(nbr_score_pairs.items(), key=lambda x: x[1], reverse=True)
+        Rows are decoded to float32 on lookup, and every search uses the approximate products of the quantized
+        matrix. For the cosine metric and `build_ann_index`, `normalized_array` rescales the quantized rows, so no
+        float32 copy of the matrix is made.
+
+        :param (str) mode: 'float16' (2 bytes per value), 'int8' (1 byte per value, plus a scale per row) or 'pq'
+            (product quantization, `n_subspaces` bytes per row)
+        :param kwargs: arguments of the format, e.g. `n_subspaces` for 'pq' (see `stanza.ml.quantization`)
+
+        :return (Embeddings): new embeddings with the same vocab
+        """
+        return self.__class__(quantize(self.array, mode, **kwargs), self.vocab)
 
     def to_dict(self):
         """Convert to dictionary.
@@ -133,53 +344,246 @@ class Embeddings(Mapping):
         array = np.array(vecs)
         return cls(array, vocab)
 
-    def to_files(self, array_file, vocab_file):
+    @classmethod
+    def _from_rows(cls, words, array, unk, vocab_cls):
+        """Create embeddings from a list of words and an array whose row `i + 1` is the vector of `words[i]`.
+
+        Row 0 of the array is spare: it becomes the vector of UNK, which is copied from the rows if UNK is one
+        of the words, and zeros otherwise. Only the first row of a repeated word is kept. If no row is dropped,
+        the array is used in place.
+        """
+        vocab = vocab_cls(unk)
+        keep = [0]
+        for i, w in enumerate(words, 1):
+            if w not in vocab:
+                vocab.add(w)
+                keep.append(i)
+        unk_vec = array[words.index(unk) + 1].copy() if unk in words else 0
+        if len(keep) < len(array):
+            array = array[keep]
+        array[0] = unk_vec
+        return cls(array, vocab)
+
+    @classmethod
+    def from_word2vec_binary(cls, path, unk=u'***UNK***', words=None, limit=None, vocab_cls=Vocab):
+        """Load embeddings from a file in the binary format of the word2vec tool, such as the GoogleNews vectors.
+
+        The file is memory-mapped. Words are found with a sequential scan, since they have variable lengths, and
+        the raw bytes of the vectors of the kept words are then copied out of the map, through `np.frombuffer`, into
+        a preallocated array.
+
+        :param (str) path: path of the file
+        :param (unicode) unk: string to represent UNK at index 0. If it isn't in the file, its vector is zeros.
+        :param (set[unicode]) words: if given, only load the vectors of these words.
+        :param (int) limit: if given, only read the first `limit` vectors of the file.
+        :param (type) vocab_cls: class of the vocab, e.g. `Vocab` or `CompactVocab` (which is faster to build
+            for millions of words).
+
+        :return (Embeddings): an Embeddings object with a float32 array
+        """
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            header_end = mm.find(b'\n')
+            n, n_dim = [int(x) for x in mm[:header_end].split()]
+            if limit is not None:
+                n = min(n, limit)
+            row_bytes = 4 * n_dim
+
+            kept_words, starts = [], []
+            pos = header_end + 1
+            find = mm.find
+            for _ in range(n):
+                space = find(b' ', pos)
+                if space == -1:
+                    raise ValueError('{} ends before its last vector'.format(path))
+                # vectors may or may not be followed by a newline
+                word = mm[pos:space].lstrip(b'\n').decode('utf-8', 'replace')
+                pos = space + 1
+                if words is None or word in words:
+                    kept_words.append(word)
+                    starts.append(pos)
+                pos += row_bytes
+            if pos > len(mm):
+                raise ValueError('{} ends before its last vector'.format(path))
+
+            data = np.frombuffer(mm, dtype=np.uint8)
+            array = np.empty((len(starts) + 1, n_dim), dtype='<f4')
+            rows = array.view(np.uint8).reshape(len(starts) + 1, row_bytes)
+            for i, start in enumerate(starts, 1):
+                rows[i] = data[start:start + row_bytes]
+            del data, rows
+        finally:
+            mm.close()
+        return cls._from_rows(kept_words, array, unk, vocab_cls)
+
+    @classmethod
+    def from_vec_text(cls, path, unk=u'***UNK***', words=None, limit=None, vocab_cls=Vocab, chunk_size=10000):
+        """Load embeddings from a text file with a `<count> <dim>` header line, such as fastText `.vec` files.
+
+        Lines are parsed in chunks, with one vectorized `np.fromstring` call per chunk.
+
+        :param (str) path: path of the file
+        :param (unicode) unk: string to represent UNK at index 0. If it isn't in the file, its vector is zeros.
+        :param (set[unicode]) words: if given, only load the vectors of these words.
+        :param (int) limit: if given, only read the first `limit` vectors of the file.
+        :param (type) vocab_cls: class of the vocab, e.g. `Vocab` or `CompactVocab`.
+        :param (int) chunk_size: number of lines parsed at a time.
+
+        :return (Embeddings): an Embeddings object with a float32 array
+        """
+        if words is not None:
+            words = set(w.encode('utf-8') for w in words)
+        kept_words = []
+        with open(path, 'rb') as f:
+            n_dim = int(f.readline().split()[1])
+            arrays = [np.zeros((1, n_dim), dtype=np.float32)]
+            lines = (line for line in islice(f, limit) if line.strip())
+            while True:
+                chunk = list(islice(lines, chunk_size))
+                if not chunk:
+                    break
+                if words is not None:
+                    chunk = [line for line in chunk if line.partition(b' ')[0] in words]
+                chunk_words, vectors = parse_lines(chunk, n_dim)
+                kept_words.extend(chunk_words)
+                arrays.append(vectors)
+        return cls._from_rows(kept_words, np.concatenate(arrays), unk, vocab_cls)
+
+    def to_files(self, array_file, vocab_file, quant_file=None):
         """Write the embedding matrix and the vocab to files.
 
-        :param (file) array_file: file to write array to
+        :param (file) array_file: file to write array to (the codes, if the matrix is quantized)
         :param (file) vocab_file: file to write vocab to
+        :param (file) quant_file: file to write the format and parameters of a quantized matrix to
         """
         logging.info('Writing array...')
-        np.save(array_file, self.array)
+        if isinstance(self.array, QuantizedMatrix):
+            if quant_file is None:
+                raise ValueError('a quant_file is needed to write a quantized matrix')
+            self.array.save(array_file, quant_file)
+        else:
+            np.save(array_file, self.array)
         logging.info('Writing vocab...')
         self.vocab.to_file(vocab_file)
 
     @classmethod
-    def from_files(cls, array_file, vocab_file):
+    def from_files(cls, array_file, vocab_file, quant_file=None, vocab_cls=Vocab):
         """Load the embedding matrix and the vocab from files.
 
         :param (file) array_file: file to read array from
         :param (file) vocab_file: file to read vocab from
+        :param (file) quant_file: if the matrix is quantized, file to read its format and parameters from
+        :param (type) vocab_cls: class whose `from_file` reads the vocab, e.g. `Vocab`, `CompactVocab` or
+            `HashedVocab`
 
         :return (Embeddings): an Embeddings object
         """
         logging.info('Loading array...')
         array = np.load(array_file)
+        if quant_file is not None:
+            array = load_quantized(array, quant_file)
         logging.info('Loading vocab...')
-        vocab = Vocab.from_file(vocab_file)
+        vocab = vocab_cls.from_file(vocab_file)
         return cls(array, vocab)
 
-    @staticmethod
-    @contextmanager
-    def _path_prefix_to_files(path_prefix, mode):
-        array_path = path_prefix + '.npy'
-        vocab_path = path_prefix + '.vocab'
-        with open(array_path, mode) as array_file, open(vocab_path, mode) as vocab_file:
-            yield array_file, vocab_file
-
     def to_file_path(self, path_prefix):
         """Write the embedding matrix and the vocab to <path_prefix>.npy and <path_prefix>.vocab.
 
+        If the matrix is quantized, <path_prefix>.npy holds its codes and <path_prefix>.quant.npz its format and
+        parameters. If an approximate nearest neighbor index was built, it is written to <path_prefix>.ann.npz.
+
+        The files are written under temporary names and renamed into place once they are all complete, so files
+        that are memory-mapped, e.g. by `from_file_path(path_prefix, mmap=True)`, are replaced rather than
+        truncated, and a failure leaves the old files as they were.
+
         :param (str) path_prefix: path prefix of the saved files
         """
-        with self._path_prefix_to_files(path_prefix, 'w') as (array_file, vocab_file):
-            self.to_files(array_file, vocab_file)
+        quantized = isinstance(self.array, QuantizedMatrix)
+        names = ['.npy', '.vocab']
+        if quantized:
+            names.append('.quant.npz')
+        if self.ann_index is not None:
+            names.append('.ann.npz')
+        tmp_paths = {name: '{}{}.{}.tmp'.format(path_prefix, name, os.getpid()) for name in names}
+        try:
+            with open(tmp_paths['.npy'], 'wb') as array_file, open(tmp_paths['.vocab'], 'wb') as vocab_file:
+                if quantized:
+                    with open(tmp_paths['.quant.npz'], 'wb') as quant_file:
+                        self.to_files(array_file, vocab_file, quant_file)
+                else:
+                    self.to_files(array_file, vocab_file)
+            if self.ann_index is not None:
+                with open(tmp_paths['.ann.npz'], 'wb') as ann_file:
+                    self.ann_index.save(ann_file)
+            for name in names:
+                os.rename(tmp_paths[name], path_prefix + name)
+        finally:
+            for path in tmp_paths.values():
+                if os.path.isfile(path):
+                    os.remove(path)
+        # the files of a matrix that is no longer quantized, or of an index that no longer exists
+        for name in ('.quant.npz', '.ann.npz'):
+            if name not in names and os.path.isfile(path_prefix + name):
+                os.remove(path_prefix + name)
+
+    @staticmethod
+    def _load_array(path_prefix, mmap=False):
+        """Load the matrix of <path_prefix>.npy, which is quantized if <path_prefix>.quant.npz exists."""
+        array = np.load(path_prefix + '.npy', mmap_mode='r' if mmap else None)
+        if os.path.isfile(path_prefix + '.quant.npz'):
+            array = load_quantized(array, path_prefix + '.quant.npz')
+        return array
+
+    @staticmethod
+    def _load_mapped_vocab(path_prefix):
+        """Map <path_prefix>.vocab.bin, first converting <path_prefix>.vocab to it if it is missing or older."""
+        vocab_path = path_prefix + '.vocab'
+        mapped_path = vocab_path + '.bin'
+        if not os.path.isfile(mapped_path) or os.path.getmtime(mapped_path) < os.path.getmtime(vocab_path):
+            with open(vocab_path, 'r') as vocab_file:
+                vocab = Vocab.from_file(vocab_file)
+            # other processes may be converting the same file: write to a file of our own and rename it
+            tmp_path = '{}.{}.tmp'.format(mapped_path, os.getpid())
+            MappedVocab.write(vocab, tmp_path)
+            os.rename(tmp_path, mapped_path)
+        return MappedVocab(mapped_path)
 
     @classmethod
-    def from_file_path(cls, path_prefix):
+    def from_file_path(cls, path_prefix, mmap=False, vocab_cls=Vocab):
         """Load the embedding matrix and the vocab from <path_prefix>.npy and <path_prefix>.vocab.
 
+        A quantized matrix is loaded if <path_prefix>.quant.npz exists, and the approximate nearest neighbor
+        index if <path_prefix>.ann.npz exists.
+
+        With `mmap=True`, the matrix is memory-mapped read-only instead of read into memory. Rows are read from
+        disk as they are used, and processes that map the same file share its pages in the OS page cache, so every
+        extra worker process does not hold its own copy. The vocab is a `MappedVocab` of <path_prefix>.vocab.bin,
+        which is written from <path_prefix>.vocab the first time: it is mapped too, so no word is read until it is
+        looked up. Both are read-only, and the embeddings pickle as their paths, so they can be passed to worker
+        processes cheaply: the matrix and the vocab are mapped again, and so are a normalized matrix stored with
+        `normalized_array(mmap_path)` and the index of <path_prefix>.ann.npz.
+
         :param (str) path_prefix: path prefix of the saved files
+        :param (bool) mmap: whether to memory-map the matrix and the vocab
+        :param (type) vocab_cls: class whose `from_file` reads the vocab, e.g. `Vocab`, `CompactVocab` or
+            `HashedVocab`. Only `Vocab` files can be memory-mapped.
         """
-        with cls._path_prefix_to_files(path_prefix, 'r') as (array_file, vocab_file):
-            return cls.from_files(array_file, vocab_file)
+        if mmap and vocab_cls is not Vocab:
+            raise ValueError('only Vocab files can be memory-mapped, not {}'.format(vocab_cls.__name__))
+        logging.info('Loading array...')
+        array = cls._load_array(path_prefix, mmap=mmap)
+        logging.info('Loading vocab...')
+        if mmap:
+            vocab = cls._load_mapped_vocab(path_prefix)
+        else:
+            with open(path_prefix + '.vocab', 'r') as vocab_file:
+                vocab = vocab_cls.from_file(vocab_file)
+        embeddings = cls(array, vocab)
+        if mmap:
+            embeddings._mapped_prefix = path_prefix
+        ann_path = path_prefix + '.ann.npz'
+        if os.path.isfile(ann_path):
+            embeddings.ann_index = IVFIndex.load(ann_path, n_vectors=len(array))
+            embeddings._ann_path = ann_path
+        return embeddings
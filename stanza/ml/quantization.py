@@ -0,0 +1,383 @@
+"""
+Compressed storage for embedding matrices.
+
+A quantized matrix stores its rows in a compact form and decodes them to float32 when they are indexed. It
+supports the subset of the `np.ndarray` interface that `Embeddings` uses: `shape`, `dtype`, `len`, indexing
+by row and `dot`. Three formats are available:
+
+- `float16`: half precision, 2 bytes per value.
+- `int8`: one byte per value, with a float32 scale per row.
+- `pq`: product quantization. The columns are split into subspaces, and each row stores, for every subspace, the
+  index of the nearest of 256 centroids: one byte per subspace. Inner products with a query are computed from a
+  table of the products of the query with every centroid, without decoding the rows.
+
+`normalized` L2-normalizes the rows of any format by storing a new scale per row with the same codes, so cosine
+similarity doesn't need a float32 copy of the matrix.
+
+Example:
+
+.. code-block:: python
+
+    quantized = quantize(array, 'pq', n_subspaces=75)
+    row = quantized[42]  # float32
+    scores = quantized.dot(query)
+"""
+from abc import ABCMeta, abstractmethod
+
+import numpy as np
+import six
+
+from stanza.ml.ann import assign_clusters, kmeans, top_k
+
+
+@six.add_metaclass(ABCMeta)
+class QuantizedMatrix(object):
+    """Base class of quantized matrices.
+
+    Subclasses store the encoded rows in `codes`, implement the abstract `encode`, `_decode`, `_with` and
+    `_from_params` (and `_params`, if they have parameters), and register themselves in `FORMATS`. Every format may also have a float32 scale per row, `scales`, which multiplies the
+    decoded rows: `normalized` sets it, so that normalizing a matrix shares its codes.
+    """
+
+    FORMAT = None
+    dtype = np.dtype(np.float32)
+
+    def __init__(self, codes, n_dim, scales=None):
+        self.codes = codes
+        self.n_dim = n_dim
+        self.scales = scales
+
+    @property
+    def shape(self):
+        return len(self.codes), self.n_dim
+
+    @property
+    def ndim(self):
+        return 2
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def nbytes(self):
+        """Bytes used by the codes and the parameters."""
+        return self.codes.nbytes + sum(p.nbytes for p in self._all_params().values())
+
+    def __getitem__(self, key):
+        """Decode rows, selected by an index, a slice or an array of indices, to float32."""
+        rows = self._decode(key)
+        if self.scales is not None:
+            rows *= self.scales[key][..., np.newaxis]
+        return rows
+
+    def dot(self, other, chunk_size=4096):
+        """Multiply the decoded matrix by a vector or a matrix, decoding `chunk_size` rows at a time.
+
+        :param (np.array) other: vector of shape `(n_dim,)` or matrix of shape `(n_dim, n_columns)`
+
+        :return (np.array): a float32 array of shape `(n_rows,)` or `(n_rows, n_columns)`
+        """
+        other = np.asarray(other, dtype=np.float32)
+        result = np.empty((len(self),) + other.shape[1:], dtype=np.float32)
+        for i in range(0, len(self), chunk_size):
+            result[i:i + chunk_size] = self[i:i + chunk_size].dot(other)
+        return result
+
+    def normalized(self, chunk_size=4096):
+        """L2-normalize the decoded rows, for cosine similarity. Rows of zeros stay zeros.
+
+        :return (QuantizedMatrix): a matrix of the same format that shares the codes, with new scales
+        """
+        norms = np.empty(len(self), dtype=np.float32)
+        for i in range(0, len(self), chunk_size):
+            rows = self[i:i + chunk_size]
+            norms[i:i + chunk_size] = np.sqrt(np.einsum('ij,ij->i', rows, rows))
+        norms[norms == 0] = 1
+        return self._with(self.codes, (1 if self.scales is None else self.scales) / norms)
+
+    def take(self, indices):
+        """Select rows, without decoding them.
+
+        :param (np.array) indices: indices of the rows
+        :return (QuantizedMatrix): a matrix of the same format
+        """
+        return self._with(self.codes[indices], None if self.scales is None else self.scales[indices])
+
+    @classmethod
+    @abstractmethod
+    def encode(cls, array, **kwargs):
+        """Quantize a matrix.
+
+        :param (np.array) array: matrix of shape `(n_rows, n_dim)`, possibly memory-mapped
+        :return (QuantizedMatrix): the quantized matrix
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def _decode(self, key):
+        """Decode rows to a new float32 array, before scaling."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def _with(self, codes, scales):
+        """A matrix of the same format and parameters, with other codes and scales."""
+        raise NotImplementedError
+
+    def _params(self):
+        """The arrays, other than the codes and the scales, needed to decode the rows."""
+        return {}
+
+    def _all_params(self):
+        params = self._params()
+        if self.scales is not None:
+            params['scales'] = self.scales
+        return params
+
+    def save(self, codes_file, params_file):
+        """Write the codes to a `.npy` file and the format and parameters to a `.npz` file.
+
+        :param (file) codes_file: file to write the codes to
+        :param (file) params_file: file to write the parameters to
+        """
+        np.save(codes_file, self.codes)
+        np.savez(params_file, format=np.array(self.FORMAT), n_dim=np.array(self.n_dim), **self._all_params())
+
+    @classmethod
+    @abstractmethod
+    def _from_params(cls, codes, n_dim, params):
+        """A matrix with the given codes, loaded from the parameters written by `save`."""
+        raise NotImplementedError
+
+
+class Float16Matrix(QuantizedMatrix):
+    """Rows stored in half precision."""
+
+    FORMAT = 'float16'
+
+    def __init__(self, codes, scales=None):
+        super(Float16Matrix, self).__init__(codes, codes.shape[1], scales)
+
+    @classmethod
+    def encode(cls, array, chunk_size=65536):
+        codes = np.empty(array.shape, dtype=np.float16)
+        for i in range(0, len(array), chunk_size):
+            codes[i:i + chunk_size] = array[i:i + chunk_size]
+        return cls(codes)
+
+    def _decode(self, key):
+        return self.codes[key].astype(np.float32)
+
+    def _with(self, codes, scales):
+        return Float16Matrix(codes, scales)
+
+    @classmethod
+    def _from_params(cls, codes, n_dim, params):
+        return cls(codes, params.get('scales'))
+
+
+class Int8Matrix(QuantizedMatrix):
+    """Rows stored as int8, each with a float32 scale: row `i` is decoded as `codes[i] * scales[i]`.
+
+    The scale of a row is its largest absolute value divided by 127, so the error of every value is at most half
+    a scale.
+    """
+
+    FORMAT = 'int8'
+
+    def __init__(self, codes, scales):
+        super(Int8Matrix, self).__init__(codes, codes.shape[1], scales)
+
+    @classmethod
+    def encode(cls, array, chunk_size=65536):
+        codes = np.empty(array.shape, dtype=np.int8)
+        scales = np.empty(len(array), dtype=np.float32)
+        for i in range(0, len(array), chunk_size):
+            chunk = np.asarray(array[i:i + chunk_size], dtype=np.float32)
+            chunk_scales = np.abs(chunk).max(axis=1) / 127
+            chunk_scales[chunk_scales == 0] = 1
+            codes[i:i + chunk_size] = np.rint(chunk / chunk_scales[:, np.newaxis])
+            scales[i:i + chunk_size] = chunk_scales
+        return cls(codes, scales)
+
+    def _decode(self, key):
+        return self.codes[key].astype(np.float32)
+
+    def _with(self, codes, scales):
+        return Int8Matrix(codes, scales)
+
+    @classmethod
+    def _from_params(cls, codes, n_dim, params):
+        return cls(codes, params['scales'])
+
+
+class PQMatrix(QuantizedMatrix):
+    """Rows stored with product quantization.
+
+    The columns are split into `n_subspaces` contiguous groups, and every group has a codebook of up to 256
+    centroids, learned with k-means. A row is stored as the index of the nearest centroid of each of its groups.
+    """
+
+    FORMAT = 'pq'
+
+    def __init__(self, codes, codebooks, bounds, scales=None):
+        """
+        :param (np.array) codes: uint8 matrix of shape `(n_rows, n_subspaces)`
+        :param (np.array) codebooks: float32 array of shape `(n_subspaces, n_centroids, max_subspace_dim)`. The
+            centroids of subspace `j` are `codebooks[j, :, :bounds[j + 1] - bounds[j]]`.
+        :param (np.array) bounds: the first column of every subspace, and the number of columns
+        :param (np.array) scales: if given, the scale of every row
+        """
+        super(PQMatrix, self).__init__(codes, int(bounds[-1]), scales)
+        self.codebooks = codebooks
+        self.bounds = bounds
+
+    def _codebook(self, j):
+        return self.codebooks[j, :, :self.bounds[j + 1] - self.bounds[j]]
+
+    @classmethod
+    def encode(cls, array, n_subspaces=None, n_iter=10, sample_size=None, seed=0, chunk_size=65536):
+        """Quantize a matrix.
+
+        :param (np.array) array: matrix of shape `(n_rows, n_dim)`, possibly memory-mapped
+        :param (int) n_subspaces: number of subspaces, i.e. bytes per row. Defaults to a quarter of the columns.
+        :param (int) n_iter: number of k-means iterations
+        :param (int) sample_size: number of rows the codebooks are learned from. Defaults to 64 per centroid.
+        :param (int) seed: seed of the sample and the k-means initialization
+        :param (int) chunk_size: number of rows encoded at a time
+
+        :return (PQMatrix): the quantized matrix
+        """
+        n, n_dim = array.shape
+        n_subspaces = min(n_subspaces or max(1, n_dim // 4), n_dim)
+        n_centroids = min(256, n)
+        bounds = np.array([n_dim * j // n_subspaces for j in range(n_subspaces + 1)])
+        rng = np.random.RandomState(seed)
+        sample_size = min(sample_size or 64 * n_centroids, n)
+        sample = np.asarray(array[np.sort(rng.choice(n, sample_size, replace=False))], dtype=np.float32)
+
+        codebooks = np.zeros((n_subspaces, n_centroids, np.diff(bounds).max()), dtype=np.float32)
+        for j in range(n_subspaces):
+            begin, end = bounds[j], bounds[j + 1]
+            codebooks[j, :, :end - begin] = kmeans(sample[:, begin:end], n_centroids, n_iter=n_iter, rng=rng,
+                                                   euclidean=True)
+        pq = cls(np.empty((n, n_subspaces), dtype=np.uint8), codebooks, bounds)
+        for i in range(0, n, chunk_size):
+            chunk = np.asarray(array[i:i + chunk_size], dtype=np.float32)
+            for j in range(n_subspaces):
+                pq.codes[i:i + chunk_size, j] = assign_clusters(chunk[:, bounds[j]:bounds[j + 1]], pq._codebook(j),
+                                                                euclidean=True)
+        return pq
+
+    def _decode(self, key):
+        codes = self.codes[key]
+        return np.concatenate([self._codebook(j)[codes[..., j]] for j in range(len(self.bounds) - 1)], axis=-1)
+
+    def dot(self, other, chunk_size=4096):
+        """Multiply the decoded matrix by a vector or a matrix.
+
+        For a vector, or a matrix of fewer columns than subspaces, the products are summed from a table of the
+        products of every centroid with `other`, without decoding the rows. Larger matrices are multiplied in
+        decoded chunks.
+
+        :param (np.array) other: vector of shape `(n_dim,)` or matrix of shape `(n_dim, n_columns)`
+
+        :return (np.array): a float32 array of shape `(n_rows,)` or `(n_rows, n_columns)`
+        """
+        other = np.asarray(other, dtype=np.float32)
+        n_subspaces = len(self.bounds) - 1
+        if other.ndim == 2 and other.shape[1] >= n_subspaces:
+            return super(PQMatrix, self).dot(other, chunk_size)
+        # row j * n_centroids + c of the table holds the products of centroid c of subspace j with other
+        table = np.concatenate([self._codebook(j).dot(other[self.bounds[j]:self.bounds[j + 1]])
+                                for j in range(n_subspaces)])
+        table = table.reshape(len(table), -1)
+        offsets = np.arange(n_subspaces) * self.codebooks.shape[1]
+        result = np.empty((len(self), table.shape[1]), dtype=np.float32)
+        for i in range(0, len(self), chunk_size):
+            result[i:i + chunk_size] = table[self.codes[i:i + chunk_size] + offsets].sum(axis=1)
+        if self.scales is not None:
+            result *= self.scales[:, np.newaxis]
+        return result.reshape((len(self),) + other.shape[1:])
+
+    def _with(self, codes, scales):
+        return PQMatrix(codes, self.codebooks, self.bounds, scales)
+
+    def _params(self):
+        return {'codebooks': self.codebooks, 'bounds': self.bounds}
+
+    @classmethod
+    def _from_params(cls, codes, n_dim, params):
+        return cls(codes, params['codebooks'], params['bounds'], params.get('scales'))
+
+
+FORMATS = {cls.FORMAT: cls for cls in (Float16Matrix, Int8Matrix, PQMatrix)}
+
+
+def quantize(array, mode, **kwargs):
+    """Quantize a matrix.
+
+    :param (np.array) array: matrix of shape `(n_rows, n_dim)`, possibly memory-mapped
+    :param (str) mode: 'float16', 'int8' or 'pq'
+    :param kwargs: arguments of the `encode` method of the format, e.g. `n_subspaces` for 'pq'
+
+    :return (QuantizedMatrix): the quantized matrix
+    """
+    if mode not in FORMATS:
+        raise ValueError('mode must be one of {}, not {!r}'.format(sorted(FORMATS), mode))
+    return FORMATS[mode].encode(array, **kwargs)
+
+
+def load_quantized(codes, params_file):
+    """Load a quantized matrix written by `QuantizedMatrix.save`.
+
+    :param (np.array) codes: the codes, as loaded from the `.npy` file (possibly memory-mapped)
+    :param (file) params_file: the `.npz` file of parameters, or its path
+
+    :return (QuantizedMatrix): the quantized matrix
+    """
+    with np.load(params_file) as f:
+        params = {name: f[name] for name in f.files}
+    cls = FORMATS[str(params.pop('format'))]
+    return cls._from_params(codes, int(params.pop('n_dim')), params)
+
+
+def quantization_report(array, quantized, queries, k=10, pairs=None):
+    """Measure the memory saved and the accuracy lost by quantizing a matrix.
+
+    :param (np.array) array: the original matrix
+    :param (QuantizedMatrix) quantized: the quantized matrix
+    :param (np.array) queries: matrix of query vectors, of shape `(n_queries, n_dim)`, for the nearest neighbor
+        search
+    :param (int) k: number of neighbors compared
+    :param (np.array) pairs: array of shape `(n_pairs, 2)` of row indices whose cosine similarities are compared.
+        Defaults to 1000 random pairs.
+
+    :return (dict): `compression`, the ratio of the bytes of the original matrix to those of the quantized one;
+        `recall`, the fraction of the top k inner products with every query that the quantized matrix also ranks
+        in its top k; `dot_error`, the mean absolute error of those top k inner products, relative to their mean
+        absolute value; and `cosine_error`, the mean absolute error of the cosine similarities of the pairs.
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    k = min(k, len(array))
+    exact_ids, exact_scores = top_k(np.asarray(array, dtype=np.float32).dot(queries.T).T, k)
+    all_approx_scores = quantized.dot(queries.T).T
+    approx_ids, _ = top_k(all_approx_scores, k)
+    recall = np.mean([len(set(a) & set(b)) / float(k) for a, b in zip(exact_ids, approx_ids)])
+    approx_scores = all_approx_scores[np.arange(len(queries))[:, np.newaxis], exact_ids]
+    dot_error = np.abs(approx_scores - exact_scores).mean() / np.abs(exact_scores).mean()
+
+    if pairs is None:
+        pairs = np.random.RandomState(0).randint(len(array), size=(1000, 2))
+
+    def cosines(a, b):
+        norms = np.sqrt((a * a).sum(axis=1) * (b * b).sum(axis=1))
+        norms[norms == 0] = 1
+        return (a * b).sum(axis=1) / norms
+
+    exact_cosines = cosines(np.asarray(array[pairs[:, 0]], dtype=np.float32),
+                            np.asarray(array[pairs[:, 1]], dtype=np.float32))
+    approx_cosines = cosines(quantized[pairs[:, 0]], quantized[pairs[:, 1]])
+    return {'compression': array.nbytes / float(quantized.nbytes),
+            'recall': recall,
+            'dot_error': dot_error,
+            'cosine_error': np.abs(approx_cosines - exact_cosines).mean()}
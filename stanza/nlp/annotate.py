@@ -0,0 +1,235 @@
+"""
+A resumable bulk annotation job runner over `CoreNLPClient`.
+
+The input manifest lists one document path per line. Documents are processed in shards of
+`shard_size` documents; each shard is written to its own file of length-delimited Document protos
+(`shard-00000.pb`, ...) in the output directory, and its name is then appended to `completed.txt`.
+Re-running the same job skips completed shards, so a crashed or preempted job resumes where it stopped.
+Shards are identified by their position, so `job.json` records the shard size and a hash of the manifest, and
+a run with a different shard size or manifest refuses to resume from the same directory.
+
+Usage::
+
+    python -m stanza.nlp.annotate manifest.txt out/ --server http://localhost:9000 --workers 4
+
+Read the results back with `read_documents`.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+from functools import partial
+from multiprocessing import Pool
+
+from google.protobuf.internal.decoder import _DecodeVarint
+from google.protobuf.internal.encoder import _VarintBytes
+
+from . import CoreNLP_pb2
+from .corenlp import CoreNLPClient
+from ..util.unicode import uopen
+
+
+def write_documents(path, doc_pbs):
+    """Write Document protos to a file, each prefixed with its length as a varint.
+
+    The file is written under a temporary name and renamed into place, so that `path` either
+    doesn't exist or holds every document.
+
+    :param (str) path: file to write to
+    :param (iterable[CoreNLP_pb2.Document]) doc_pbs: documents to write
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        for doc_pb in doc_pbs:
+            buf = doc_pb.SerializeToString()
+            f.write(_VarintBytes(len(buf)))
+            f.write(buf)
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(tmp_path, path)
+
+
+def read_documents(path):
+    """Read Document protos written by `write_documents`.
+
+    :param (str) path: file to read from
+    :return (generator[CoreNLP_pb2.Document]): the documents, in order
+    """
+    with open(path, 'rb') as f:
+        buf = f.read()
+    pos = 0
+    while pos < len(buf):
+        size, pos = _DecodeVarint(buf, pos)
+        doc_pb = CoreNLP_pb2.Document()
+        doc_pb.ParseFromString(buf[pos:pos + size])
+        pos += size
+        yield doc_pb
+
+
+# The client of each worker process, created once by `_init_worker`.
+_worker_client = None
+
+
+def _init_worker(client_factory):
+    global _worker_client
+    _worker_client = client_factory()
+
+
+def _annotate_shard(args):
+    """Annotate the documents of one shard and write them to the shard's output file.
+
+    :return (str): name of the completed shard
+    """
+    shard_name, output_path, doc_paths, annotators = args
+    doc_pbs = []
+    for doc_path in doc_paths:
+        with uopen(doc_path) as f:
+            text = f.read()
+        doc_pb = _worker_client.annotate_proto(text, annotators)
+        doc_pb.docID = doc_path
+        doc_pbs.append(doc_pb)
+    write_documents(output_path, doc_pbs)
+    return shard_name
+
+
+class AnnotationJob(object):
+    """
+    Annotates the documents of a manifest in shards, recording completed shards so that it can resume.
+    """
+
+    COMPLETED_FILE = 'completed.txt'
+    JOB_FILE = 'job.json'
+
+    def __init__(self, doc_paths, output_dir, client_factory=CoreNLPClient, annotators=None, shard_size=100,
+                 workers=1):
+        """
+        Constructor.
+        :param (list[str]) doc_paths: paths of the documents to annotate, in order.
+        :param (str) output_dir: directory that shard files and the list of completed shards are written to.
+        :param (callable) client_factory: called with no arguments in each worker to create its client,
+            e.g. `functools.partial(CoreNLPClient, server)`. It must be picklable if `workers` > 1.
+        :param (list[str]) annotators: annotators to run; defaults to those of the client.
+        :param (int) shard_size: number of documents per shard.
+        :param (int) workers: number of worker processes, each with its own client.
+        """
+        self.doc_paths = doc_paths
+        self.output_dir = output_dir
+        self.client_factory = client_factory
+        self.annotators = annotators
+        self.shard_size = shard_size
+        self.workers = workers
+
+    @property
+    def shards(self):
+        """
+        :return (list[tuple[str, list[str]]]): the name and document paths of every shard
+        """
+        return [('shard-{:05d}'.format(i // self.shard_size), self.doc_paths[i:i + self.shard_size])
+                for i in range(0, len(self.doc_paths), self.shard_size)]
+
+    def shard_path(self, shard_name):
+        return os.path.join(self.output_dir, shard_name + '.pb')
+
+    def completed_shards(self):
+        """
+        :return (set[str]): names of the shards that have already been written
+        """
+        path = os.path.join(self.output_dir, self.COMPLETED_FILE)
+        if not os.path.exists(path):
+            return set()
+        with open(path) as f:
+            return set(line.strip() for line in f if line.strip())
+
+    def job_state(self):
+        """
+        :return (dict): what the shards depend on: the shard size and a hash of the document paths
+        """
+        manifest = u'\n'.join(self.doc_paths).encode('utf-8')
+        return {'shard_size': self.shard_size, 'manifest_sha1': hashlib.sha1(manifest).hexdigest()}
+
+    def _check_job_state(self):
+        """Record the job state in a new output directory, or check that it matches the recorded one.
+
+        :raise ValueError: if the output directory holds the shards of another job
+        """
+        path = os.path.join(self.output_dir, self.JOB_FILE)
+        state = self.job_state()
+        if os.path.exists(path):
+            with open(path) as f:
+                recorded = json.load(f)
+            if recorded != state:
+                raise ValueError('{} holds the shards of another job ({}), not of this one ({}); use a new output '
+                                 'directory'.format(self.output_dir, recorded, state))
+        elif os.path.exists(os.path.join(self.output_dir, self.COMPLETED_FILE)):
+            raise ValueError('{} holds shards, but no {} to check that they are of this job; use a new output '
+                             'directory'.format(self.output_dir, self.JOB_FILE))
+        else:
+            with open(path + '.tmp', 'w') as f:
+                json.dump(state, f)
+            os.rename(path + '.tmp', path)
+
+    def run(self):
+        """Annotate every shard that has not been completed yet.
+
+        :return (int): the number of shards annotated by this run
+        :raise ValueError: if `output_dir` holds the shards of a job with another shard size or manifest
+        """
+        if not os.path.isdir(self.output_dir):
+            os.makedirs(self.output_dir)
+        self._check_job_state()
+        completed = self.completed_shards()
+        todo = [(name, self.shard_path(name), paths, self.annotators)
+                for name, paths in self.shards if name not in completed]
+        logging.info('%d of %d shards already completed', len(completed), len(self.shards))
+        if not todo:
+            return 0
+
+        if self.workers > 1:
+            pool = Pool(self.workers, initializer=_init_worker, initargs=(self.client_factory,))
+            results = pool.imap_unordered(_annotate_shard, todo)
+        else:
+            pool = None
+            _init_worker(self.client_factory)
+            results = (_annotate_shard(args) for args in todo)
+
+        try:
+            with open(os.path.join(self.output_dir, self.COMPLETED_FILE), 'a') as f:
+                for i, name in enumerate(results):
+                    f.write(name + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+                    logging.info('Completed %s (%d of %d)', name, i + 1, len(todo))
+        finally:
+            if pool is not None:
+                pool.terminate()
+        return len(todo)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Annotate the documents listed in a manifest with CoreNLP.',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('manifest', help='file listing the path of one document per line.')
+    parser.add_argument('output_dir', help='directory to write shards of annotated documents to.')
+    parser.add_argument('--server', default='http://localhost:9000', help='url of the CoreNLP server.')
+    parser.add_argument('--annotators', default=','.join(CoreNLPClient.DEFAULT_ANNOTATORS),
+                        help='comma-separated list of annotators to run.')
+    parser.add_argument('--keep_fields', default=None,
+                        help='if given, a comma-separated list of fields to prune the documents to.')
+    parser.add_argument('--shard_size', type=int, default=100, help='number of documents per shard.')
+    parser.add_argument('--workers', type=int, default=1, help='number of parallel clients.')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    with open(args.manifest) as f:
+        doc_paths = [line.strip() for line in f if line.strip()]
+    annotators = args.annotators.split(',')
+    keep_fields = args.keep_fields.split(',') if args.keep_fields else None
+    client_factory = partial(CoreNLPClient, args.server, annotators, keep_fields)
+
+    job = AnnotationJob(doc_paths, args.output_dir, client_factory, annotators, args.shard_size, args.workers)
+    job.run()
+
+
+if __name__ == '__main__':
+    main()
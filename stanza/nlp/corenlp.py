@@ -11,6 +11,7 @@ from ..text import to_unicode
 from . import CoreNLP_pb2
 from .data import Document, Sentence, Token, Entity
 from .protobuf_json import pb2json, json2pb
+from .prune import prune
 
 __author__ = 'kelvinguu, vzhong, wmonroe4, chaganty'
 
@@ -32,6 +33,56 @@ class TimeoutException(AnnotationException):
     pass
 
 
+def _align_tokens(text, toks, offset=0):
+    """Locate tokens in text, left to right.
+
+    Each token is found with `str.find` from the end of the previous one, so
+    the characters in between are skipped in bulk rather than one at a time.
+
+    :param (str) text: text containing the tokens
+    :param (list[str]) toks: tokens, in order
+    :param (int) offset: added to every returned span
+    :return (list[tuple[int, int]]): the (begin, end) character span of each token
+    """
+    spans = []
+    find = text.find
+    end = 0
+    for tok in toks:
+        begin = find(tok, end)
+        if begin < 0:
+            raise ValueError(u"text did not match token {}".format(tok))
+        end = begin + len(tok)
+        spans.append((begin + offset, end + offset))
+    return spans
+
+def add_token_pbs(sentence_pb, doc_text, spans, char_idx=0, token_pb=None):
+    """Append Token protos for the given character spans of doc_text to sentence_pb.
+
+    :param (CoreNLP_pb2.Sentence) sentence_pb: sentence to add tokens to
+    :param (str) doc_text: full text that tokens, `before` and `after` are taken from
+    :param (list[tuple[int, int]]) spans: (begin, end) of each token in doc_text
+    :param (int) char_idx: end of the previous token in doc_text
+    :param (CoreNLP_pb2.Token) token_pb: previous token, whose `after` is filled in
+    :return (tuple[int, CoreNLP_pb2.Token]): end of the last token and its proto,
+        so that alignment can continue with the next sentence
+    """
+    for begin, end in spans:
+        gap = doc_text[char_idx:begin]
+        if token_pb: token_pb.after = gap
+        token_pb = sentence_pb.token.add()
+        token_pb.before = gap
+
+        token_pb.beginChar = begin
+        token_pb.endChar = end
+        # TODO(chaganty): potentially handle -LRB-?
+        tok = doc_text[begin:end]
+        token_pb.value = tok
+        token_pb.word = tok
+        token_pb.originalText = tok
+        char_idx = end
+    return char_idx, token_pb
+
+
 class CoreNLPClient(object):
     """
     A CoreNLP client to the Stanford CoreNLP server.
@@ -39,13 +90,16 @@ class CoreNLPClient(object):
 
     DEFAULT_ANNOTATORS = "tokenize ssplit lemma pos ner depparse".split()
 
-    def __init__(self, server='http://localhost:9000', default_annotators=DEFAULT_ANNOTATORS):
+    def __init__(self, server='http://localhost:9000', default_annotators=DEFAULT_ANNOTATORS, keep_fields=None):
         """
         Constructor.
         :param (str) server: url of the CoreNLP server.
+        :param (list[str]) keep_fields: if given, protos returned by the server are pruned to these fields
+            (see `stanza.nlp.prune.prune`).
         """
         self.server = server
         self.default_annotators = default_annotators
+        self.keep_fields = keep_fields
         assert requests.get(self.server).ok, 'Stanford CoreNLP server was not found at location {}'.format(self.server)
 
     def _request(self, text, properties, retries=0):
@@ -95,19 +149,21 @@ class CoreNLPClient(object):
         doc = self.annotate(text, annotators)
         return doc.json
 
-    def annotate_proto(self, text, annotators=None):
+    def annotate_proto(self, text, annotators=None, properties=None):
         """Return a Document protocol buffer from the CoreNLP server, containing annotations of the text.
 
         :param (str) text: text to be annotated
         :param (list[str]) annotators: a list of annotator names
+        :param (dict) properties: additional properties to send to the server, e.g. `{'ssplit.eolonly': 'true'}`
 
         :return (CoreNLP_pb2.Document): a Document protocol buffer
         """
-        properties = {
+        properties = dict(properties or {})
+        properties.update({
             'annotators': ','.join(annotators or self.default_annotators),
             'outputFormat': 'serialized',
             'serializer': 'edu.stanford.nlp.pipeline.ProtobufAnnotationSerializer'
-        }
+        })
         r = self._request(text, properties)
         buffer = r.content  # bytes
 
@@ -115,6 +171,9 @@ class CoreNLPClient(object):
         buffer = buffer[pos:(pos + size)]
         doc = CoreNLP_pb2.Document()
         doc.ParseFromString(buffer)
+        if self.keep_fields is not None:
+            saved = prune(doc, self.keep_fields)
+            logging.debug('Pruning saved %d bytes', saved)
         return doc
 
     def annotate(self, text, annotators=None):
@@ -284,6 +343,38 @@ class AnnotatedDocument(Document, ProtobufBacked):
             text.append(after(sent))
         return ''.join(text)
 
+    @classmethod
+    def from_tokenized(cls, texts, token_lists, sep=u' '):
+        """
+        Construct an AnnotatedDocument from pre-tokenized sentences, without the server.
+        The document text is the sentence texts joined by `sep`; sentence and token offsets,
+        as well as `before` and `after`, are computed relative to it.
+        :param (list[str]) texts -- full text of each sentence.
+        :param (list[list[str]]) token_lists -- tokens of each sentence.
+        :param (str) sep -- separator placed between sentences.
+        """
+        assert len(texts) == len(token_lists), "texts and token_lists must have the same length"
+        doc_pb = CoreNLP_pb2.Document()
+        doc_text = sep.join(texts)
+        doc_pb.text = doc_text
+
+        offset, tok_offset = 0, 0
+        char_idx, token_pb = 0, None
+        for i, (text, toks) in enumerate(izip(texts, token_lists)):
+            sentence_pb = doc_pb.sentence.add()
+            sentence_pb.characterOffsetBegin = offset
+            sentence_pb.characterOffsetEnd = offset + len(text)
+            sentence_pb.sentenceIndex = i
+            sentence_pb.tokenOffsetBegin = tok_offset
+            sentence_pb.tokenOffsetEnd = tok_offset + len(toks)
+            spans = _align_tokens(text, toks, offset)
+            char_idx, token_pb = add_token_pbs(sentence_pb, doc_text, spans, char_idx, token_pb)
+
+            offset += len(text) + len(sep)
+            tok_offset += len(toks)
+        if token_pb: token_pb.after = doc_text[char_idx:]
+        return cls.from_pb(doc_pb)
+
     @property
     def doc_id(self):
         return self.pb.docID
@@ -369,38 +460,8 @@ class AnnotatedSentence(Sentence, ProtobufBacked):
         sentence_pb.tokenOffsetBegin = 0
         sentence_pb.tokenOffsetEnd = len(toks)
 
-        # Track progress in sentence and tokens.
-        char_idx = 0
-        tok_idx = 0
-
-        buf = ""
-        token_pb = None
-        while char_idx < len(text):
-            tok = toks[tok_idx]
-            # Scan to the beginning of the token.
-            if text[char_idx] != tok[0]:
-                buf += text[char_idx]
-                char_idx += 1
-            # Aha! we have found the token. Assert that they match.
-            else:
-                assert text[char_idx:char_idx+len(tok)] == tok, "text did not match a token"
-                # Create a new Token from this text.
-                if token_pb: token_pb.after = buf
-                token_pb = sentence_pb.token.add()
-                token_pb.before = buf
-
-                token_pb.beginChar = char_idx
-                token_pb.endChar = char_idx + len(tok)
-                # TODO(chaganty): potentially handle -LRB-?
-                token_pb.value = tok
-                token_pb.word = tok
-                token_pb.originalText = text[char_idx:char_idx+len(tok)]
-
-                buf = ""
-                char_idx += len(tok)
-                tok_idx += 1
-        if token_pb: token_pb.after = buf
-        assert tok_idx == len(toks), "text does not match all tokens"
+        char_idx, token_pb = add_token_pbs(sentence_pb, text, _align_tokens(text, toks))
+        if token_pb: token_pb.after = text[char_idx:]
         return AnnotatedSentence.from_pb(sentence_pb)
 
     @property
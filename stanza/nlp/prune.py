@@ -0,0 +1,59 @@
+"""
+Pruning of CoreNLP Document protocol buffers to a subset of their fields.
+
+Example:
+
+.. code-block:: python
+
+    doc_pb = client.annotate_proto(text)
+    saved = prune(doc_pb, keep=['word', 'lemma', 'ner'])
+"""
+from google.protobuf.descriptor import FieldDescriptor as FD
+
+from . import CoreNLP_pb2
+
+# Fields that hold the document structure together; these are never pruned.
+STRUCTURAL_FIELDS = frozenset(['sentence', 'token'])
+
+
+def _fields_to_clear(descriptor, keep):
+    """Names of the fields of a message type that are neither kept, structural nor required."""
+    return frozenset(f.name for f in descriptor.fields
+                     if f.name not in keep and f.name not in STRUCTURAL_FIELDS and f.label != FD.LABEL_REQUIRED)
+
+
+def _prune_pb(pb, clear, drop_defaults):
+    """Clear the set fields of pb that are in `clear`, and optionally those set to their default value."""
+    for field, value in pb.ListFields():
+        if field.name in clear:
+            pb.ClearField(field.name)
+        elif drop_defaults and field.label == FD.LABEL_OPTIONAL and field.type != FD.TYPE_MESSAGE \
+                and value == field.default_value:
+            pb.ClearField(field.name)
+
+
+def prune(document, keep, drop_defaults=True):
+    """Strip every field that is not in `keep` from a Document, its Sentences and their Tokens, in place.
+
+    Names in `keep` apply to whichever message type has a field by that name, e.g.
+    `['word', 'lemma', 'ner', 'basicDependencies']`. Dependency modes are Sentence fields
+    (`<mode>Dependencies`) and are dropped unless listed. Required fields and the
+    `sentence` and `token` lists are always kept.
+
+    :param (CoreNLP_pb2.Document) document: the document to prune
+    :param (list[str]) keep: names of the fields to keep
+    :param (bool) drop_defaults: also clear optional fields that are explicitly set to their default value
+    :return (int): number of serialized bytes saved
+    """
+    keep = frozenset(keep)
+    doc_clear = _fields_to_clear(CoreNLP_pb2.Document.DESCRIPTOR, keep)
+    sent_clear = _fields_to_clear(CoreNLP_pb2.Sentence.DESCRIPTOR, keep)
+    tok_clear = _fields_to_clear(CoreNLP_pb2.Token.DESCRIPTOR, keep)
+
+    size = document.ByteSize()
+    _prune_pb(document, doc_clear, drop_defaults)
+    for sentence in document.sentence:
+        _prune_pb(sentence, sent_clear, drop_defaults)
+        for token in sentence.token:
+            _prune_pb(token, tok_clear, drop_defaults)
+    return size - document.ByteSize()
@@ -0,0 +1,175 @@
+"""
+Sentence-level caching of CoreNLP annotations.
+
+Web corpora repeat the same sentences (footers, disclaimers, quoted text) many times. For annotators
+that only look at one sentence at a time, the annotations of a sentence don't depend on the document
+it appears in, so they can be computed once and reused.
+
+Example:
+
+.. code-block:: python
+
+    client = SentenceCachingClient(CoreNLPClient(), annotators=['tokenize', 'ssplit', 'pos', 'lemma'])
+    for text in corpus:
+        doc = client.annotate(text)
+    print(client.hits, client.misses)
+"""
+from collections import OrderedDict
+
+import six
+
+from . import CoreNLP_pb2
+from .corenlp import AnnotatedDocument, AnnotationException
+from .tokenizer import RegexTokenizer
+from ..text import to_unicode
+
+
+DEPENDENCY_FIELDS = ('basicDependencies', 'collapsedDependencies', 'collapsedCCProcessedDependencies',
+                     'alternativeDependencies', 'enhancedDependencies', 'enhancedPlusPlusDependencies')
+
+
+def _rebase_sentence_pb(sentence_pb, char_offset, token_offset, sentence_index):
+    """Shift the character and token offsets of a sentence, in place, and set its index.
+
+    :param (CoreNLP_pb2.Sentence) sentence_pb: sentence to rebase
+    :param (int) char_offset: added to every character offset
+    :param (int) token_offset: added to every document-level token offset
+    :param (int) sentence_index: new index of the sentence in its document
+    """
+    sentence_pb.characterOffsetBegin += char_offset
+    sentence_pb.characterOffsetEnd += char_offset
+    sentence_pb.tokenOffsetBegin += token_offset
+    sentence_pb.tokenOffsetEnd += token_offset
+    sentence_pb.sentenceIndex = sentence_index
+    for token_pb in sentence_pb.token:
+        token_pb.beginChar += char_offset
+        token_pb.endChar += char_offset
+        if token_pb.HasField('tokenBeginIndex'):
+            token_pb.tokenBeginIndex += token_offset
+            token_pb.tokenEndIndex += token_offset
+    for field in DEPENDENCY_FIELDS:
+        if sentence_pb.HasField(field):
+            for node in getattr(sentence_pb, field).node:
+                node.sentenceIndex = sentence_index
+    for mention in sentence_pb.mentions:
+        if mention.HasField('sentenceIndex'):
+            mention.sentenceIndex = sentence_index
+
+
+class SentenceCachingClient(object):
+    """
+    Annotates documents one sentence at a time, looking every sentence up in a cache first.
+
+    Documents are split into sentences locally (with `RegexTokenizer`); only sentences that are not
+    in the cache are sent to the server, once each, and the Document proto is then reassembled with
+    offsets rebased to the original text. Sentence boundaries therefore come from the local splitter,
+    while tokens and all other annotations come from the server.
+
+    Only sentence-local annotators (see `SENTENCE_LOCAL_ANNOTATORS`) are supported.
+    """
+
+    SENTENCE_LOCAL_ANNOTATORS = frozenset(['tokenize', 'ssplit', 'pos', 'lemma', 'ner', 'depparse', 'parse',
+                                           'sentiment', 'truecase', 'regexner'])
+
+    def __init__(self, client, annotators=None, cache=None, splitter=None):
+        """
+        Constructor.
+        :param (CoreNLPClient) client: client used for sentences that are not in the cache.
+        :param (list[str]) annotators: default annotators; defaults to those of the client.
+        :param (MutableMapping) cache: maps keys (native strings) to serialized Sentence protos. Defaults to a
+            new dict; a persistent mapping such as a `shelve` can be passed in to share the cache across runs.
+        :param (RegexTokenizer) splitter: splits documents into sentences.
+        """
+        self.client = client
+        self.default_annotators = annotators or client.default_annotators
+        self.cache = cache if cache is not None else {}
+        self.splitter = splitter or RegexTokenizer()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(annotators, sentence):
+        """The cache key of a sentence: a native string, as `shelve` requires (bytes on Python 2, text on 3)."""
+        key = u'{}\t{}'.format(','.join(annotators), sentence)
+        return key.encode('utf-8') if six.PY2 else key
+
+    def _annotate_sentences(self, sentences, annotators):
+        """Annotate sentences with the server, one sentence per line, and return their serialized protos.
+
+        The protos are normalized as if each sentence were a document of its own.
+        """
+        # newlines inside a sentence must not be taken as sentence breaks.
+        lines = [sentence.replace(u'\n', u' ').replace(u'\r', u' ') for sentence in sentences]
+        doc_pb = self.client.annotate_proto(u'\n'.join(lines), annotators, properties={'ssplit.eolonly': 'true'})
+        if len(doc_pb.sentence) != len(sentences):
+            raise AnnotationException('expected {} sentences from the server, but got {}'.format(
+                len(sentences), len(doc_pb.sentence)))
+
+        serialized = []
+        char_offset = 0
+        for sentence, sentence_pb in zip(sentences, doc_pb.sentence):
+            _rebase_sentence_pb(sentence_pb, -char_offset, -sentence_pb.tokenOffsetBegin, 0)
+            if len(sentence_pb.token) > 0:
+                sentence_pb.token[0].before = u''
+                sentence_pb.token[-1].after = u''
+            serialized.append(sentence_pb.SerializeToString())
+            char_offset += len(sentence) + 1
+        return serialized
+
+    def annotate_proto(self, text, annotators=None):
+        """Return a Document protocol buffer containing annotations of the text.
+
+        :param (str) text: text to be annotated
+        :param (list[str]) annotators: a list of sentence-local annotator names
+
+        :return (CoreNLP_pb2.Document): a Document protocol buffer
+        """
+        annotators = annotators or self.default_annotators
+        unsupported = set(annotators) - self.SENTENCE_LOCAL_ANNOTATORS
+        if unsupported:
+            raise ValueError('annotators are not sentence-local: {}'.format(', '.join(sorted(unsupported))))
+
+        text = to_unicode(text)
+        spans = self.splitter.sentence_spans(text)
+        keys = [self._key(annotators, text[begin:end]) for begin, end in spans]
+
+        # send each unseen sentence to the server once.
+        missing = OrderedDict()
+        for key, (begin, end) in zip(keys, spans):
+            if key not in missing and key not in self.cache:
+                missing[key] = text[begin:end]
+        self.misses += len(missing)
+        self.hits += len(keys) - len(missing)
+        if missing:
+            annotated = self._annotate_sentences(list(missing.values()), annotators)
+            for key, sentence_str in zip(missing, annotated):
+                self.cache[key] = sentence_str
+
+        doc_pb = CoreNLP_pb2.Document()
+        doc_pb.text = text
+        tok_offset = 0
+        char_idx, token_pb = 0, None
+        for i, (key, (begin, end)) in enumerate(zip(keys, spans)):
+            sentence_pb = doc_pb.sentence.add()
+            sentence_pb.MergeFromString(self.cache[key])
+            _rebase_sentence_pb(sentence_pb, begin, tok_offset, i)
+            tok_offset = sentence_pb.tokenOffsetEnd
+
+            if len(sentence_pb.token) > 0:
+                gap = text[char_idx:sentence_pb.token[0].beginChar]
+                if token_pb: token_pb.after = gap
+                sentence_pb.token[0].before = gap
+                token_pb = sentence_pb.token[-1]
+                char_idx = token_pb.endChar
+        if token_pb: token_pb.after = text[char_idx:]
+        return doc_pb
+
+    def annotate(self, text, annotators=None):
+        """Return an AnnotatedDocument containing annotations of the text.
+
+        :param (str) text: text to be annotated
+        :param (list[str]) annotators: a list of sentence-local annotator names
+
+        :return (AnnotatedDocument): an annotated document
+        """
+        return AnnotatedDocument.from_pb(self.annotate_proto(text, annotators))
@@ -0,0 +1,172 @@
+"""
+A local, regular-expression based tokenizer and sentence splitter.
+
+It produces CoreNLP Document protocol buffers (with `beginChar`, `endChar`, `before`, `after`
+and sentence offsets filled in), so that tokenize/ssplit-only workloads don't need to round-trip
+through the CoreNLP server. The tokenization approximates CoreNLP's PTB tokenizer; it is not exact.
+
+Example:
+
+.. code-block:: python
+
+    tokenizer = RegexTokenizer()
+    doc = tokenizer.annotate("Mr. Smith didn't come. He was ill!")
+    print([sentence.words for sentence in doc])
+    # [['Mr.', 'Smith', 'did', "n't", 'come', '.'], ['He', 'was', 'ill', '!']]
+"""
+import re
+
+from . import CoreNLP_pb2
+from .corenlp import AnnotatedDocument, add_token_pbs
+from ..text import to_unicode
+
+
+class RegexTokenizer(object):
+    """
+    Splits text into tokens and sentences with regular expressions.
+
+    Its `annotate_proto` and `annotate` methods mirror those of `CoreNLPClient` for the
+    `tokenize` and `ssplit` annotators.
+    """
+
+    ANNOTATORS = ('tokenize', 'ssplit')
+
+    ABBREVIATIONS = ('Mr', 'Mrs', 'Ms', 'Dr', 'Prof', 'Sr', 'Jr', 'St', 'Mt', 'vs', 'etc', 'Inc', 'Corp', 'Ltd', 'Co',
+                     'Jan', 'Feb', 'Mar', 'Apr', 'Jun', 'Jul', 'Aug', 'Sep', 'Sept', 'Oct', 'Nov', 'Dec')
+
+    TOKEN_PATTERN = u"""
+          (?:https?://|www\\.)\\S+[^\\s.,;:!?'")\\]]     # urls
+        | (?:[^\\W\\d_]\\.){{2,}}                       # acronyms: U.S., e.g.
+        | \\b(?:{abbreviations})\\.                     # common abbreviations
+        | \\w+(?=[nN]'[tT]\\b)                          # do|n't
+        | [nN]'[tT]\\b
+        | \\w+(?='(?:[sSdDmM]|re|RE|ve|VE|ll|LL)\\b)    # John|'s
+        | '(?:[sSdDmM]|re|RE|ve|VE|ll|LL)\\b
+        | [-+]?\\d+(?:[.,:/]\\d+)+                      # numbers, times and dates
+        | \\w+(?:[-'\u2019]\\w+)*                      # words
+        | \\.\\.\\.+ | --+ | ``|''                       # multi-character punctuation
+        | [!?]+
+        | \\S                                           # anything else
+    """
+
+    SENTENCE_FINAL = frozenset([u'.', u'!', u'?'])
+    CLOSING = frozenset([u'"', u"'", u"''", u')', u']', u'}', u'\u201d', u'\u2019'])
+
+    def __init__(self, split_paragraphs=True):
+        """
+        Constructor.
+        :param (bool) split_paragraphs: whether a blank line always ends a sentence.
+        """
+        self.split_paragraphs = split_paragraphs
+        pattern = self.TOKEN_PATTERN.format(abbreviations='|'.join(self.ABBREVIATIONS))
+        self._token_re = re.compile(pattern, re.UNICODE | re.VERBOSE)
+
+    def tokenize(self, text):
+        """Return the (begin, end) character span of every token in text.
+
+        :param (str) text: text to tokenize
+        :return (list[tuple[int, int]]): token spans
+        """
+        return [m.span() for m in self._token_re.finditer(to_unicode(text))]
+
+    def split_sentences(self, text):
+        """Tokenize text and group its tokens into sentences.
+
+        A sentence ends after a run of sentence-final punctuation (and any closing quotes or brackets),
+        or, if `split_paragraphs` is set, at a blank line.
+
+        :param (str) text: text to split
+        :return (list[list[tuple[int, int]]]): the token spans of each sentence
+        """
+        text = to_unicode(text)
+        sentences = []
+        current = []
+        ended = False
+        char_idx = 0
+        for begin, end in self.tokenize(text):
+            tok = text[begin:end]
+            gap = text[char_idx:begin]
+            paragraph_break = self.split_paragraphs and gap.count(u'\n') >= 2
+            if current and (paragraph_break or (ended and tok not in self.CLOSING)):
+                sentences.append(current)
+                current = []
+                ended = False
+            current.append((begin, end))
+            if tok in self.SENTENCE_FINAL or tok[0] in u'!?':
+                ended = True
+            char_idx = end
+        if current:
+            sentences.append(current)
+        return sentences
+
+    def sentence_spans(self, text):
+        """Return the (begin, end) character span of every sentence in text.
+
+        :param (str) text: text to split
+        :return (list[tuple[int, int]]): sentence spans
+        """
+        return [(sentence[0][0], sentence[-1][1]) for sentence in self.split_sentences(text)]
+
+    def chunk(self, text, max_length):
+        """Split text into chunks of whole sentences, each at most max_length characters long where possible.
+
+        This is useful for breaking up long documents before sending them to the CoreNLP server.
+        A single sentence longer than max_length becomes a chunk of its own.
+
+        :param (str) text: text to chunk
+        :param (int) max_length: maximum number of characters in a chunk
+        :return (list[tuple[int, str]]): the character offset of each chunk in text, and its text
+        """
+        text = to_unicode(text)
+        chunks = []
+        begin = end = None
+        for sent_begin, sent_end in self.sentence_spans(text):
+            if begin is not None and sent_end - begin > max_length:
+                chunks.append((begin, text[begin:end]))
+                begin = None
+            if begin is None:
+                begin = sent_begin
+            end = sent_end
+        if begin is not None:
+            chunks.append((begin, text[begin:end]))
+        return chunks
+
+    def annotate_proto(self, text, annotators=None):
+        """Return a Document protocol buffer containing the tokens and sentences of text.
+
+        :param (str) text: text to be annotated
+        :param (list[str]) annotators: a list of annotator names; only `tokenize` and `ssplit` are supported
+
+        :return (CoreNLP_pb2.Document): a Document protocol buffer
+        """
+        unsupported = set(annotators or self.ANNOTATORS) - set(self.ANNOTATORS)
+        if unsupported:
+            raise ValueError('RegexTokenizer does not support annotators: {}'.format(', '.join(sorted(unsupported))))
+
+        text = to_unicode(text)
+        doc_pb = CoreNLP_pb2.Document()
+        doc_pb.text = text
+
+        tok_offset = 0
+        char_idx, token_pb = 0, None
+        for i, spans in enumerate(self.split_sentences(text)):
+            sentence_pb = doc_pb.sentence.add()
+            sentence_pb.characterOffsetBegin = spans[0][0]
+            sentence_pb.characterOffsetEnd = spans[-1][1]
+            sentence_pb.sentenceIndex = i
+            sentence_pb.tokenOffsetBegin = tok_offset
+            sentence_pb.tokenOffsetEnd = tok_offset + len(spans)
+            char_idx, token_pb = add_token_pbs(sentence_pb, text, spans, char_idx, token_pb)
+            tok_offset += len(spans)
+        if token_pb: token_pb.after = text[char_idx:]
+        return doc_pb
+
+    def annotate(self, text, annotators=None):
+        """Return an AnnotatedDocument containing the tokens and sentences of text.
+
+        :param (str) text: text to be annotated
+        :param (list[str]) annotators: a list of annotator names; only `tokenize` and `ssplit` are supported
+
+        :return (AnnotatedDocument): an annotated document
+        """
+        return AnnotatedDocument.from_pb(self.annotate_proto(text, annotators))
@@ -3,5 +3,5 @@ Tools to facilitate NLP and ML experiments.
 """
 
 from stanza.text.dataset import Dataset
-from stanza.text.vocab import Vocab, SennaVocab, GloveVocab
+from stanza.text.vocab import Vocab, CompactVocab, SennaVocab, GloveVocab
 from stanza.text.utils import to_unicode
\ No newline at end of file
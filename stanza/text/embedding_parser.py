@@ -0,0 +1,147 @@
+"""
+A parallel parser for text embedding files, such as GloVe's `glove.840B.300d.txt`.
+
+The file is split into byte ranges that end at newlines. Worker processes first count the rows of every range,
+so that a float32 `.npy` matrix of the right shape can be preallocated, and then parse their ranges with one
+vectorized `np.fromstring` call each, writing the vectors straight into the memory-mapped matrix.
+
+Example:
+
+.. code-block:: python
+
+    words = parse_embedding_file('glove.840B.300d.txt', 'glove.840B.300d.npy', n_dim=300, workers=8)
+    E = np.load('glove.840B.300d.npy', mmap_mode='r')
+"""
+from multiprocessing import Pool
+import os
+
+import numpy as np
+
+
+def chunk_ranges(path, chunk_bytes, start=0):
+    """Split a file into byte ranges that end at newlines.
+
+    :param path: path of the file.
+    :param chunk_bytes: approximate size of each range.
+    :param start: offset at which the first range starts.
+
+    :return: a list of `(begin, end)` byte offsets
+    """
+    size = os.path.getsize(path)
+    boundaries = [start]
+    with open(path, 'rb') as f:
+        while boundaries[-1] < size:
+            f.seek(boundaries[-1] + chunk_bytes)
+            f.readline()
+            boundaries.append(min(f.tell(), size))
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def _read_lines(path, begin, end):
+    with open(path, 'rb') as f:
+        f.seek(begin)
+        data = f.read(end - begin)
+    return [line for line in data.split(b'\n') if line.strip()]
+
+
+def _count_rows(args):
+    path, begin, end = args
+    return len(_read_lines(path, begin, end))
+
+
+def parse_lines(lines, n_dim, has_words=True):
+    """Parse lines of a text embedding file with one vectorized call.
+
+    Words are split off at the first space; if that doesn't leave n_dim values on every line, because some words
+    contain spaces, the lines are split from the right instead.
+
+    :param lines: a list of non-empty byte strings.
+    :param n_dim: dimension of the vectors.
+    :param has_words: whether lines start with a word.
+
+    :return: the decoded words of the lines (None if `has_words` is False), and a float32 array of shape
+        `(len(lines), n_dim)`
+    """
+    if not has_words:
+        words, vectors = None, np.fromstring(b' '.join(lines), dtype=np.float32, sep=' ')
+    else:
+        words, values = [], []
+        for line in lines:
+            word, _, rest = line.partition(b' ')
+            words.append(word)
+            values.append(rest)
+        vectors = np.fromstring(b' '.join(values), dtype=np.float32, sep=' ')
+        if vectors.size != len(lines) * n_dim:
+            words = [line.rstrip().rsplit(b' ', n_dim)[0] for line in lines]
+            values = [line[len(word) + 1:] for word, line in zip(words, lines)]
+            vectors = np.fromstring(b' '.join(values), dtype=np.float32, sep=' ')
+        words = [w.decode('utf-8', 'replace') for w in words]
+    if vectors.size != len(lines) * n_dim:
+        raise ValueError('expected {} values per line'.format(n_dim))
+    return words, vectors.reshape(len(lines), n_dim)
+
+
+def _parse_chunk(args):
+    """Parse the rows of a byte range and write them into the output matrix, starting at row `offset`.
+
+    :return: the words of the rows, or None if the file has no words
+    """
+    path, begin, end, out_path, offset, n_dim, has_words = args
+    try:
+        words, vectors = parse_lines(_read_lines(path, begin, end), n_dim, has_words)
+    except ValueError as e:
+        raise ValueError('{} in bytes {}-{} of {}'.format(e, begin, end, path))
+
+    out = np.load(out_path, mmap_mode='r+')
+    out[offset:offset + len(vectors)] = vectors
+    out.flush()
+    del out
+    return words
+
+
+def parse_embedding_file(path, out_path, n_dim, has_words=True, skip_header=False, workers=None,
+                         chunk_bytes=64 * 1024 ** 2):
+    """Parse a text embedding file into a float32 `.npy` matrix, in parallel.
+
+    Each non-empty line holds a word (unless `has_words` is False) followed by n_dim space-separated numbers.
+    The matrix is written under a temporary name and renamed to `out_path` when complete; if parsing fails, the
+    temporary file is removed.
+
+    :param path: path of the text file, uncompressed.
+    :param out_path: path of the `.npy` file to write.
+    :param n_dim: dimension of the vectors.
+    :param has_words: whether lines start with a word. Senna, for instance, keeps its words in a separate file.
+    :param skip_header: whether to skip the first line, such as the `<count> <dim>` header of word2vec `.vec` files.
+    :param workers: number of worker processes. Defaults to the number of CPUs; 1 parses in this process.
+    :param chunk_bytes: approximate size of the byte range parsed by each task.
+
+    :return: the word of every row, in order, or None if `has_words` is False
+    """
+    start = 0
+    if skip_header:
+        with open(path, 'rb') as f:
+            f.readline()
+            start = f.tell()
+    ranges = chunk_ranges(path, chunk_bytes, start)
+
+    tmp_path = out_path + '.tmp'
+    pool = Pool(workers) if workers != 1 else None
+    try:
+        map_fn = pool.map if pool else lambda fn, args: [fn(a) for a in args]
+        counts = map_fn(_count_rows, [(path, begin, end) for begin, end in ranges])
+        offsets = np.concatenate([[0], np.cumsum(counts, dtype=np.int64)])
+        if offsets[-1] == 0:
+            raise ValueError('no embeddings found in {}'.format(path))
+
+        out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=(int(offsets[-1]), n_dim))
+        del out
+        args = [(path, begin, end, tmp_path, int(offset), n_dim, has_words)
+                for (begin, end), offset in zip(ranges, offsets)]
+        chunk_words = map_fn(_parse_chunk, args)
+        os.rename(tmp_path, out_path)
+    finally:
+        if pool:
+            pool.terminate()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return [w for words in chunk_words for w in words] if has_words else None
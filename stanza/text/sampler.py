@@ -0,0 +1,120 @@
+"""
+Sampling words by frequency, for negative sampling and frequency subsampling.
+
+Example:
+
+.. code-block:: python
+
+    sampler = vocab.sampler(power=0.75)
+    negatives = sampler.sample((batch_size, 5))
+    keep = sampler.subsample_mask(batch)  # batch is an int-encoded array, e.g. from `vocab.encode_batch`
+"""
+import numpy as np
+
+
+def _alias_table(probs):
+    """Build the tables of Vose's alias method for a discrete distribution.
+
+    :param probs: probabilities of each outcome, summing to 1.
+
+    :return: an array of acceptance probabilities and an array of aliases. Outcome `i` is drawn by picking a
+        column `j` uniformly and returning `j` with probability `accept[j]`, and `alias[j]` otherwise.
+    """
+    n = len(probs)
+    scaled = np.asarray(probs, dtype=np.float64) * n
+    accept = np.ones(n, dtype=np.float64)
+    alias = np.arange(n, dtype=np.int64)
+    small = np.flatnonzero(scaled < 1.0).tolist()
+    large = np.flatnonzero(scaled >= 1.0).tolist()
+    scaled = scaled.tolist()
+    while small and large:
+        s = small.pop()
+        l = large[-1]
+        accept[s] = scaled[s]
+        alias[s] = l
+        scaled[l] -= 1.0 - scaled[s]
+        if scaled[l] < 1.0:
+            small.append(large.pop())
+    # whatever is left is 1 up to rounding error
+    return accept, alias
+
+
+class UnigramSampler(object):
+    """Draws word indices from the unigram distribution raised to a power, in O(1) per draw.
+
+    Words are drawn with probability proportional to `count ** power`, using an alias table.
+    """
+
+    def __init__(self, counts, power=0.75, rng=None):
+        """
+        :param counts: the count of every word, as an array indexed by word index. Counts may be fractional or
+            exceed the int64 range; they are kept as float64.
+        :param power: exponent applied to the counts. 0.75 is the word2vec choice for negative sampling;
+            1 samples by raw frequency.
+        :param rng: a `np.random.RandomState`. Defaults to the one from `stanza.research.rng.get_rng`.
+        """
+        self.counts = np.asarray(counts, dtype=np.float64)
+        weights = self.counts ** power
+        weights[self.counts <= 0] = 0.0
+        total = weights.sum()
+        if total <= 0:
+            raise ValueError('cannot sample from a vocab with no counts')
+        self.probs = weights / total
+        self._accept, self._alias = _alias_table(self.probs)
+        if rng is None:
+            from ..research.rng import get_rng
+            rng = get_rng()
+        self.rng = rng
+        self._keep_probs = {}
+
+    def __len__(self):
+        return len(self.probs)
+
+    def sample(self, size=None):
+        """Draw word indices.
+
+        :param size: shape of the output, as for `np.random`. If None, draw a single index.
+
+        :return: an int64 array of word indices, or a single index
+        """
+        columns = self.rng.randint(len(self.probs), size=size)
+        coins = self.rng.random_sample(size=size)
+        samples = np.where(coins < self._accept[columns], columns, self._alias[columns])
+        return int(samples) if size is None else samples
+
+    def keep_probs(self, threshold=1e-3):
+        """The probability of keeping an occurrence of each word when subsampling frequent words.
+
+        This is the word2vec formula: a word with relative frequency `f` is kept with probability
+        `(sqrt(f / threshold) + 1) * threshold / f`, capped at 1. Words with no counts are always kept.
+        The probabilities are computed once per threshold and cached.
+
+        :param threshold: relative frequency above which words start being discarded.
+
+        :return: a read-only array of probabilities indexed by word index
+        """
+        probs = self._keep_probs.get(threshold)
+        if probs is None:
+            freqs = self.counts / max(self.counts.sum(), 1.0)
+            probs = np.ones(len(freqs), dtype=np.float64)
+            seen = freqs > 0
+            probs[seen] = (np.sqrt(freqs[seen] / threshold) + 1) * threshold / freqs[seen]
+            probs = np.minimum(probs, 1.0)
+            probs.flags.writeable = False
+            self._keep_probs[threshold] = probs
+        return probs
+
+    def subsample_mask(self, batch, threshold=1e-3, pad_index=None):
+        """Decide which tokens of an int-encoded batch to keep when subsampling frequent words.
+
+        :param batch: an integer array of word indices, of any shape.
+        :param threshold: relative frequency above which words start being discarded (see `keep_probs`).
+        :param pad_index: if given, positions holding this index are never kept.
+
+        :return: a boolean array of the same shape as batch, True for the tokens to keep
+        """
+        batch = np.asarray(batch)
+        mask = self.rng.random_sample(batch.shape) < self.keep_probs(threshold)[batch]
+        if pad_index is not None:
+            mask &= batch != pad_index
+        return mask
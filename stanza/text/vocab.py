@@ -5,9 +5,23 @@ __author__ = 'victor, kelvinguu'
 
 from abc import ABCMeta, abstractmethod
 from collections import Counter, namedtuple, OrderedDict
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
 import numpy as np
 from copy import copy
+import itertools
+import logging
+import mmap
+import os
+import struct
 import zipfile
+import zlib
+from six.moves import zip as izip
+import stanza
+from .embedding_parser import parse_embedding_file
+from .sampler import UnigramSampler
 from ..util.resource import get_data_or_download
 
 
@@ -42,6 +56,156 @@ class BaseVocab(object):
         """
         return [self.index2word(i) for i in indices]
 
+    def _count_array(self):
+        """The count of every word, as an array indexed by word index."""
+        return self.counts
+
+    @classmethod
+    def merge(cls, vocabs):
+        """Merge vocabs, e.g. counted over different shards of a corpus, by summing their counts.
+
+        :param vocabs: an iterable of vocabs with the same UNK, of any class with counts.
+
+        :return: a new vocab of this class, ordered as in its `from_counts`.
+        """
+        counts = Counter()
+        unk = None
+        for v in vocabs:
+            if unk is not None and v._unk != unk:
+                raise ValueError('cannot merge vocabs with different unks: {} and {}'.format(unk, v._unk))
+            unk = v._unk
+            for w, c in izip(v, v._count_array().tolist()):
+                counts[w] += c
+        if unk is None:
+            raise ValueError('no vocabs to merge')
+        return cls.from_counts(counts, unk)
+
+    def sampler(self, power=0.75, include_unk=False, rng=None):
+        """Get a sampler that draws word indices with probability proportional to `count ** power`.
+
+        The counts are copied, so the sampler is not affected by later updates to this vocab.
+
+        :param power: exponent applied to the counts; 0.75 is the usual choice for negative sampling.
+        :param include_unk: whether UNK can be drawn.
+        :param rng: a `np.random.RandomState`. Defaults to the one from `stanza.research.rng.get_rng`.
+
+        :return (UnigramSampler): the sampler
+        """
+        counts = np.array(self._count_array(), dtype=np.float64)
+        if not include_unk:
+            counts[0] = 0
+        return UnigramSampler(counts, power=power, rng=rng)
+
+    def encode_batch(self, sequences, max_len=None, pad_index=0, dtype=np.int32, pad_left=False,
+                     truncate_left=False, memo=False):
+        """
+        Convert a batch of word sequences into a padded matrix of indices, in one pass.
+
+        :param sequences: a list of sequences of words.
+        :param max_len: number of columns of the matrix. Longer sequences are truncated.
+            Defaults to the length of the longest sequence.
+        :param pad_index: the value of padded cells.
+        :param dtype: type of the matrix.
+        :param pad_left: whether to pad on the left (as `Dataset.pad` does) instead of the right.
+        :param truncate_left: whether to drop words from the start of long sequences instead of the end.
+        :param memo: whether to memoize lookups within the batch, which helps when words repeat often.
+
+        :return: a `(len(sequences), max_len)` matrix of indices, and the length of each (truncated) sequence.
+        """
+        lengths = np.array([len(s) for s in sequences], dtype=np.int64)
+        if max_len is None:
+            max_len = lengths.max() if len(sequences) else 0
+        lengths = np.minimum(lengths, max_len)
+
+        lookup = self.word2index
+        if memo:
+            cache = {}
+
+            def lookup(w):
+                try:
+                    return cache[w]
+                except KeyError:
+                    idx = cache[w] = self.word2index(w)
+                    return idx
+
+        if truncate_left:
+            kept = (s[len(s) - n:] if n else [] for s, n in zip(sequences, lengths))
+        else:
+            kept = (s[:n] for s, n in zip(sequences, lengths))
+        flat = [lookup(w) for s in kept for w in s]
+
+        matrix = np.full((len(sequences), max_len), pad_index, dtype=dtype)
+        columns = np.arange(max_len)
+        if pad_left:
+            mask = columns >= (max_len - lengths)[:, np.newaxis]
+        else:
+            mask = columns < lengths[:, np.newaxis]
+        matrix[mask] = flat  # row-major order of the mask matches the order of flat
+        return matrix, lengths.astype(dtype)
+
+
+def _order_by_count(counts, unk):
+    """Order words by decreasing count, breaking ties by the word itself, with UNK first.
+
+    :param counts: a mapping from words to counts.
+    :param unk: the string representing UNK.
+    :return: a list of words.
+    """
+    words = sorted((w for w in counts if w != unk), key=lambda w: (-counts[w], w))
+    return [unk] + words
+
+
+def invert_index_map(old_to_new, size):
+    """Invert an old-to-new index mapping returned by `Vocab.subset`, `prune_rares` or `sort_by_decreasing_count`.
+
+    The result maps every new index to the old index it came from, so that rows of an embedding matrix
+    can be remapped with one fancy-index: `new_array = old_array[invert_index_map(old_to_new, len(new_vocab))]`.
+
+    :param old_to_new: array mapping old indices to new ones, with dropped words mapped to UNK (0).
+    :param size: size of the new vocabulary.
+    :return: an int64 array of length `size`.
+    """
+    new_to_old = np.zeros(size, dtype=np.int64)
+    kept = np.flatnonzero(old_to_new)  # UNK (0) stays at 0
+    new_to_old[old_to_new[kept]] = kept
+    return new_to_old
+
+
+BINARY_MAGIC = b'STZVOCB1'
+
+
+def _write_binary(f, words, counts):
+    """Write words and counts in the binary vocab format.
+
+    Format: a magic string, then the UTF-8 byte length of every word and the counts as two `.npy` arrays,
+    then all the words as one UTF-8 blob, separated by NUL bytes.
+    """
+    encoded = [w.encode('utf-8') if not isinstance(w, bytes) else w for w in words]
+    f.write(BINARY_MAGIC)
+    np.save(f, np.array([len(b) for b in encoded], dtype=np.uint32))
+    np.save(f, np.asarray(counts))
+    f.write(b'\0'.join(encoded))
+
+
+def _read_binary(f):
+    """Read words and counts written by `_write_binary`.
+
+    :return: a list of words and an array of counts.
+    """
+    if f.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+        raise ValueError('not a binary vocab file')
+    lengths = np.load(f)
+    counts = np.load(f)
+    words = f.read().decode('utf-8').split(u'\0')
+    if len(words) != len(lengths):
+        # some words contain NUL; fall back to the lengths, which count the bytes of each word
+        f.seek(-sum(int(n) for n in lengths) - len(lengths) + 1, 2)
+        blob = f.read()
+        offsets = np.zeros(len(lengths), dtype=np.int64)
+        np.cumsum(lengths[:-1] + 1, out=offsets[1:])
+        words = [blob[a:a + n].decode('utf-8') for a, n in zip(offsets.tolist(), lengths.tolist())]
+    return words, counts
+
 
 class Vocab(BaseVocab, OrderedDict):
     """A mapping between words and numerical indices. This class is used to facilitate the creation of word embedding matrices.
@@ -133,21 +297,52 @@ class Vocab(BaseVocab, OrderedDict):
         """
         return self._counts[w]
 
-    def subset(self, words):
+    def _from_indices(self, indices, unk_count=None):
+        """Get a new Vocab with the words at the given indices (after UNK), keeping their counts.
+
+        :param indices: indices of the words to keep, in their new order, excluding UNK.
+        :param unk_count: count of UNK in the new Vocab. Defaults to the count in this Vocab.
+
+        :return: the new Vocab, and an array mapping old indices to new ones (see `subset`).
+        """
+        index2word = self._index2word
+        v = self.__class__(unk=self._unk)
+        new_words = [index2word[i] for i in indices]
+        set_item = OrderedDict.__setitem__
+        for new_idx, w in enumerate(new_words, 1):
+            set_item(v, w, new_idx)
+        counts = self._counts
+        v._counts = Counter({w: counts[w] for w in new_words})
+        v._counts[self._unk] = self.count(self._unk) if unk_count is None else unk_count
+
+        old_to_new = np.zeros(len(self), dtype=np.int64)
+        old_to_new[np.asarray(indices, dtype=np.int64)] = np.arange(1, len(v), dtype=np.int64)
+        return v, old_to_new
+
+    def _count_array(self):
+        """The count of every word, as an array indexed by word index."""
+        counts = self._counts
+        return np.array([counts[w] for w in self._index2word])
+
+    def subset(self, words, return_mapping=False):
         """Get a new Vocab containing only the specified subset of words.
 
         If w is in words, but not in the original vocab, it will NOT be in the subset vocab.
         Indices will be in the order of `words`. Counts from the original vocab are preserved.
 
-        :return (Vocab): a new Vocab object
+        :param return_mapping: whether to also return an array mapping the index of every word in this Vocab to
+            its index in the new one. Words that are not in the new Vocab are mapped to UNK (0), so that
+            int-encoded data can be remapped with `old_to_new[data]`; see `invert_index_map` for remapping
+            rows of an embedding matrix.
+
+        :return (Vocab): a new Vocab object, and the mapping if `return_mapping` is set
         """
-        v = self.__class__(unk=self._unk)
         unique = lambda seq: len(set(seq)) == len(seq)
         assert unique(words)
-        for w in words:
-            if w in self:
-                v.add(w, count=self.count(w))
-        return v
+        indices = [self[w] for w in words if w in self and w != self._unk]
+        unk_count = self.count(self._unk) if self._unk in words else 0
+        v, old_to_new = self._from_indices(indices, unk_count)
+        return (v, old_to_new) if return_mapping else v
 
     @property
     def _index2word(self):
@@ -173,33 +368,53 @@ class Vocab(BaseVocab, OrderedDict):
 
         return self._index2word_cache
 
-    def prune_rares(self, cutoff=2):
+    def prune_rares(self, cutoff=2, return_mapping=False):
         """
         returns a **new** `Vocab` object that is similar to this one but with rare words removed.
         Note that the indices in the new `Vocab` will be remapped (because rare words will have been removed).
 
         :param cutoff: words occuring less than this number of times are removed from the vocabulary.
+        :param return_mapping: whether to also return an array mapping old indices to new ones (see `subset`).
 
-        :return: A new, pruned, vocabulary.
+        :return: A new, pruned, vocabulary, and the mapping if `return_mapping` is set.
 
         NOTE: UNK is never pruned.
         """
-        keep = lambda w: self.count(w) >= cutoff or w == self._unk
-        return self.subset([w for w in self if keep(w)])
+        indices = np.flatnonzero(self._count_array()[1:] >= cutoff) + 1
+        v, old_to_new = self._from_indices(indices)
+        return (v, old_to_new) if return_mapping else v
 
-    def sort_by_decreasing_count(self):
+    def sort_by_decreasing_count(self, return_mapping=False):
         """Return a **new** `Vocab` object that is ordered by decreasing count.
 
         The word at index 1 will be most common, the word at index 2 will be
-        next most common, and so on.
+        next most common, and so on. Ties keep their original order.
+
+        :param return_mapping: whether to also return an array mapping old indices to new ones (see `subset`).
 
-        :return: A new vocabulary sorted by decreasing count.
+        :return: A new vocabulary sorted by decreasing count, and the mapping if `return_mapping` is set.
 
         NOTE: UNK will remain at index 0, regardless of its frequency.
         """
-        words = [w for w, ct in self._counts.most_common()]
-        v = self.subset(words)
-        return v
+        indices = np.argsort(-self._count_array()[1:], kind='mergesort') + 1
+        v, old_to_new = self._from_indices(indices)
+        return (v, old_to_new) if return_mapping else v
+
+    @classmethod
+    def from_counts(cls, counts, unk):
+        """Create a Vocab from word counts, ordered by decreasing count and then by word.
+
+        The order depends only on the counts, so it is the same however they were computed.
+
+        :param counts: a mapping from words to counts.
+        :param unk: string to represent the unknown word (UNK). It is always assigned the 0 index.
+
+        :return: a created vocab object.
+        """
+        vocab = cls(unk=unk)
+        for w in _order_by_count(counts, unk):
+            vocab.add(w, count=counts.get(w, 0))
+        return vocab
 
     @classmethod
     def from_dict(cls, word2index, unk, counts=None):
@@ -279,6 +494,304 @@ class Vocab(BaseVocab, OrderedDict):
                 unk = word
         return cls.from_dict(word2index, unk, counts)
 
+    def to_binary_file(self, f):
+        """Write vocab to a file in binary format, which loads much faster than the text format of `to_file`.
+
+        :param (file) f: a file object opened in binary mode
+        """
+        _write_binary(f, self._index2word, self._count_array())
+
+    @classmethod
+    def from_binary_file(cls, f):
+        """Load vocab from a file written by `to_binary_file`.
+
+        :param (file) f: a file object opened in binary mode
+        :return: a vocab object
+        """
+        words, counts = _read_binary(f)
+        vocab = cls(unk=words[0])
+        set_item = OrderedDict.__setitem__
+        for i in range(1, len(words)):
+            set_item(vocab, words[i], i)
+        if len(vocab) != len(words):
+            raise ValueError('duplicate words in vocab file')
+        vocab._counts = Counter(dict(izip(words, counts.tolist())))
+        return vocab
+
+
+class CompactVocab(BaseVocab, Mapping):
+    """A compact, array-backed alternative to `Vocab` with the same interface.
+
+    Words are stored in a plain dict from word to index and an append-only list from index to word,
+    and counts in a growable NumPy int64 array. Unlike `Vocab`, `index2word` never copies the key list,
+    so `add` and `index2word` can be interleaved cheaply, and per-word overhead is much lower.
+
+    Example:
+
+    .. code-block:: python
+
+        v = CompactVocab('***UNK***')
+        indices = v.update("I'm a list of words".split())
+
+    NOTE: UNK is always represented by the 0 index.
+    """
+
+    def __init__(self, unk):
+        """Construct a CompactVocab object.
+
+        :param unk: string to represent the unknown word (UNK). It is always represented by the 0 index.
+        """
+        self._word2index = {}
+        self._index2word = []
+        self._counts = np.zeros(16, dtype=np.int64)
+        self._unk = unk
+
+        # assign an index for UNK
+        self.add(self._unk, count=0)
+
+    def __getitem__(self, word):
+        """Get the index for a word.
+
+        If the word is unknown, the index for UNK is returned.
+        """
+        return self._word2index.get(word, 0)
+
+    def get(self, word, default=None):
+        """Get the index for a word, or default if the word is unknown (as for `Vocab`)."""
+        return self._word2index.get(word, default)
+
+    def __contains__(self, word):
+        return word in self._word2index
+
+    def __iter__(self):
+        return iter(self._index2word)
+
+    def __len__(self):
+        return len(self._index2word)
+
+    def __str__(self):
+        return 'CompactVocab(%d words)' % len(self)
+
+    def __eq__(self, other):
+        if isinstance(other, CompactVocab):
+            return self._index2word == other._index2word
+        return False
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def _reserve(self, n):
+        """Grow the counts array, by doubling, so that it holds at least n entries."""
+        capacity = len(self._counts)
+        if n > capacity:
+            while capacity < n:
+                capacity *= 2
+            counts = np.zeros(capacity, dtype=np.int64)
+            counts[:len(self._counts)] = self._counts
+            self._counts = counts
+
+    def add(self, word, count=1):
+        """Add a word to the vocabulary and return its index.
+
+        :param word: word to add to the dictionary.
+
+        :param count: how many times to add the word.
+
+        :return: index of the added word.
+        """
+        idx = self._word2index.get(word)
+        if idx is None:
+            idx = len(self._index2word)
+            self._word2index[word] = idx
+            self._index2word.append(word)
+            self._reserve(idx + 1)
+        self._counts[idx] += count
+        return idx
+
+    def update(self, words):
+        """
+        Add an iterable of words to the Vocabulary.
+
+        :param words: an iterable of words to add. Each word will be added once.
+
+        :return: the corresponding list of indices for each word.
+        """
+        word2index = self._word2index
+        index2word = self._index2word
+        indices = []
+        for w in words:
+            idx = word2index.get(w)
+            if idx is None:
+                idx = word2index[w] = len(index2word)
+                index2word.append(w)
+            indices.append(idx)
+        self._reserve(len(index2word))
+        np.add.at(self._counts, indices, 1)
+        return indices
+
+    def word2index(self, w):
+        return self._word2index.get(w, 0)
+
+    def index2word(self, i):
+        return self._index2word[i]
+
+    def freeze(self):
+        return FrozenVocab(self)
+
+    def count(self, w):
+        """Get the count for a word.
+
+        :param w: a string
+        """
+        idx = self._word2index.get(w)
+        return 0 if idx is None else int(self._counts[idx])
+
+    @property
+    def counts(self):
+        """The count of every word, as an int64 array indexed by word index.
+
+        WARNING: this is a view, which may go out-of-date when words are added.
+        """
+        return self._counts[:len(self)]
+
+    def _from_indices(self, indices, unk_count=None):
+        """Get a new CompactVocab with the words at the given indices (after UNK), keeping their counts.
+
+        :param indices: indices of the words to keep, in their new order, excluding UNK.
+        :param unk_count: count of UNK in the new CompactVocab. Defaults to the count in this CompactVocab.
+
+        :return: the new CompactVocab, and an array mapping old indices to new ones (see `Vocab.subset`).
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        v = self.__class__(unk=self._unk)
+        words = [self._index2word[i] for i in indices]
+        v._index2word.extend(words)
+        v._word2index.update((w, i) for i, w in enumerate(v._index2word))
+        v._reserve(len(v))
+        v._counts[0] = self._counts[0] if unk_count is None else unk_count
+        v._counts[1:len(v)] = self._counts[indices]
+
+        old_to_new = np.zeros(len(self), dtype=np.int64)
+        old_to_new[indices] = np.arange(1, len(v), dtype=np.int64)
+        return v, old_to_new
+
+    def subset(self, words, return_mapping=False):
+        """Get a new CompactVocab containing only the specified subset of words.
+
+        If w is in words, but not in the original vocab, it will NOT be in the subset vocab.
+        Indices will be in the order of `words`. Counts from the original vocab are preserved.
+
+        :param return_mapping: whether to also return an array mapping old indices to new ones (see `Vocab.subset`).
+
+        :return (CompactVocab): a new CompactVocab object, and the mapping if `return_mapping` is set
+        """
+        unique = lambda seq: len(set(seq)) == len(seq)
+        assert unique(words)
+        indices = [self._word2index[w] for w in words if w in self._word2index and w != self._unk]
+        unk_count = self._counts[0] if self._unk in words else 0
+        v, old_to_new = self._from_indices(indices, unk_count)
+        return (v, old_to_new) if return_mapping else v
+
+    def prune_rares(self, cutoff=2, return_mapping=False):
+        """
+        returns a **new** `CompactVocab` object that is similar to this one but with rare words removed.
+
+        :param cutoff: words occuring less than this number of times are removed from the vocabulary.
+        :param return_mapping: whether to also return an array mapping old indices to new ones (see `Vocab.subset`).
+
+        :return: A new, pruned, vocabulary, and the mapping if `return_mapping` is set.
+
+        NOTE: UNK is never pruned.
+        """
+        indices = np.flatnonzero(self.counts[1:] >= cutoff) + 1
+        v, old_to_new = self._from_indices(indices)
+        return (v, old_to_new) if return_mapping else v
+
+    def sort_by_decreasing_count(self, return_mapping=False):
+        """Return a **new** `CompactVocab` object that is ordered by decreasing count.
+
+        Ties keep their original order.
+
+        :param return_mapping: whether to also return an array mapping old indices to new ones (see `Vocab.subset`).
+
+        :return: A new vocabulary sorted by decreasing count, and the mapping if `return_mapping` is set.
+
+        NOTE: UNK will remain at index 0, regardless of its frequency.
+        """
+        indices = np.argsort(-self.counts[1:], kind='mergesort') + 1
+        v, old_to_new = self._from_indices(indices)
+        return (v, old_to_new) if return_mapping else v
+
+    @classmethod
+    def from_counts(cls, counts, unk):
+        """Create a CompactVocab from word counts, ordered by decreasing count and then by word.
+
+        :param counts: a mapping from words to counts.
+        :param unk: string to represent the unknown word (UNK). It is always assigned the 0 index.
+
+        :return: a created vocab object.
+        """
+        vocab = cls(unk=unk)
+        words = _order_by_count(counts, unk)
+        vocab._index2word = words
+        vocab._word2index = {w: i for i, w in enumerate(words)}
+        vocab._reserve(len(words))
+        vocab._counts[:len(words)] = [counts.get(w, 0) for w in words]
+        return vocab
+
+    def to_file(self, f):
+        """Write vocab to a file, in the same format as `Vocab.to_file`.
+
+        :param (file) f: a file object, e.g. as returned by calling `open`
+        """
+        for word, count in zip(self._index2word, self.counts):
+            f.write(u'{}\t{}\n'.format(word, count).encode('utf-8'))
+
+    @classmethod
+    def from_file(cls, f):
+        """Load vocab from a file written by `to_file` or `Vocab.to_file`.
+
+        :param (file) f: a file object, e.g. as returned by calling `open`
+        :return: a vocab object. The 0th line of the file is assigned to index 0, and so on...
+        """
+        vocab = None
+        for line in f:
+            word, count_str = line.split('\t')
+            word = word.decode('utf-8')
+            count = int(float(count_str))
+            if vocab is None:
+                vocab = cls(unk=word)
+                vocab._counts[0] = count
+            else:
+                if word in vocab:
+                    raise ValueError('duplicate word in vocab file: {}'.format(word))
+                vocab.add(word, count=count)
+        return vocab
+
+    def to_binary_file(self, f):
+        """Write vocab to a file in the binary format of `Vocab.to_binary_file`.
+
+        :param (file) f: a file object opened in binary mode
+        """
+        _write_binary(f, self._index2word, self.counts)
+
+    @classmethod
+    def from_binary_file(cls, f):
+        """Load vocab from a file written by `to_binary_file` or `Vocab.to_binary_file`.
+
+        :param (file) f: a file object opened in binary mode
+        :return: a vocab object
+        """
+        words, counts = _read_binary(f)
+        vocab = cls(unk=words[0])
+        vocab._index2word = words
+        vocab._word2index = dict(izip(words, itertools.count()))
+        if len(vocab._word2index) != len(words):
+            raise ValueError('duplicate words in vocab file')
+        vocab._reserve(len(words))
+        vocab._counts[:len(words)] = counts
+        return vocab
+
 
 class FrozenVocab(BaseVocab):
     def __init__(self, vocab):
@@ -294,6 +807,433 @@ class FrozenVocab(BaseVocab):
         return self._index2word[i]
 
 
+class MappedVocab(BaseVocab, Mapping):
+    """A read-only vocabulary backed by a memory-mapped binary file.
+
+    Loading maps the file instead of parsing it, so it takes milliseconds regardless of the vocabulary size,
+    and lookups go through a precomputed hash table in the file rather than a Python dict. Since the file is
+    mapped read-only, processes that load the same file share its pages. A MappedVocab pickles as its path,
+    so it can be passed cheaply to worker processes.
+
+    Example:
+
+    .. code-block:: python
+
+        MappedVocab.write(vocab, 'words.vocab.bin')
+        v = MappedVocab('words.vocab.bin')
+        v.words2indices(['a', 'cat'])
+
+    File format (little-endian)::
+
+        header: magic, version, number of words N, number of hash buckets B, blob length
+        offsets: uint64[N + 1] -- word i is blob[offsets[i]:offsets[i + 1]]
+        counts: int64[N]
+        table: int64[B] -- index of a word, or -1; open addressing with linear probing on crc32
+        blob: the UTF-8 encoded words, concatenated
+    """
+
+    MAGIC = b'STZVOCAB'
+    VERSION = 1
+    _header = struct.Struct('<8sQQQQ')
+
+    def __init__(self, path):
+        """Map a file written by `MappedVocab.write`.
+
+        :param path: path of the file
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n, n_buckets, blob_len = self._header.unpack_from(self._mmap, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise ValueError('{} is not a MappedVocab file'.format(path))
+
+        offset = self._header.size
+        self._offsets = np.frombuffer(self._mmap, dtype='<u8', count=n + 1, offset=offset)
+        offset += 8 * (n + 1)
+        self._counts = np.frombuffer(self._mmap, dtype='<i8', count=n, offset=offset)
+        offset += 8 * n
+        self._table = np.frombuffer(self._mmap, dtype='<i8', count=n_buckets, offset=offset)
+        offset += 8 * n_buckets
+        self._blob_offset = offset
+        self._mask = n_buckets - 1
+        self._len = n
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    @staticmethod
+    def _hash(word_bytes):
+        return zlib.crc32(word_bytes) & 0xffffffff
+
+    @classmethod
+    def write(cls, vocab, path):
+        """Write a vocabulary to a file that can be loaded as a MappedVocab.
+
+        :param vocab: a `Vocab`, `CompactVocab` or other vocab whose iteration order is its index order,
+            and which has a `count` method.
+        :param path: path of the file to write
+        """
+        cls.write_words(list(vocab), path, counts=[vocab.count(w) for w in vocab])
+
+    @classmethod
+    def write_words(cls, words, path, counts=None):
+        """Write a list of words to a file that can be loaded as a MappedVocab, word i getting index i.
+
+        If a word is repeated, lookups return its first index.
+
+        :param words: a list of words, starting with UNK.
+        :param path: path of the file to write
+        :param counts: the count of every word. Defaults to zeros.
+        """
+        encoded = [w.encode('utf-8') if not isinstance(w, bytes) else w for w in words]
+        n = len(encoded)
+        offsets = np.zeros(n + 1, dtype='<u8')
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        counts = np.zeros(n, dtype='<i8') if counts is None else np.asarray(counts, dtype='<i8')
+
+        n_buckets = 1
+        while n_buckets < 2 * n:
+            n_buckets *= 2
+        mask = n_buckets - 1
+        table = np.full(n_buckets, -1, dtype='<i8')
+        for i, b in enumerate(encoded):
+            h = cls._hash(b) & mask
+            while table[h] != -1:
+                h = (h + 1) & mask
+            table[h] = i
+
+        blob = b''.join(encoded)
+        with open(path, 'wb') as f:
+            f.write(cls._header.pack(cls.MAGIC, cls.VERSION, n, n_buckets, len(blob)))
+            f.write(offsets.tobytes())
+            f.write(counts.tobytes())
+            f.write(table.tobytes())
+            f.write(blob)
+
+    def _word_bytes(self, i):
+        start = self._blob_offset + int(self._offsets[i])
+        end = self._blob_offset + int(self._offsets[i + 1])
+        return self._mmap[start:end]
+
+    def _lookup(self, w):
+        """Return the index of w, or -1 if it is not in the vocabulary."""
+        b = w.encode('utf-8') if not isinstance(w, bytes) else w
+        h = self._hash(b) & self._mask
+        table = self._table
+        while True:
+            i = table[h]
+            if i == -1 or self._word_bytes(i) == b:
+                return int(i)
+            h = (h + 1) & self._mask
+
+    def __getitem__(self, word):
+        """Get the index for a word.
+
+        If the word is unknown, the index for UNK is returned.
+        """
+        return max(self._lookup(word), 0)
+
+    def get(self, word, default=None):
+        """Get the index for a word, or default if the word is unknown (as for `Vocab`)."""
+        i = self._lookup(word)
+        return default if i == -1 else i
+
+    def __contains__(self, word):
+        return self._lookup(word) != -1
+
+    def __iter__(self):
+        for i in range(self._len):
+            yield self.index2word(i)
+
+    def __len__(self):
+        return self._len
+
+    def __str__(self):
+        return 'MappedVocab(%d words)' % len(self)
+
+    def word2index(self, w):
+        return self[w]
+
+    def index2word(self, i):
+        if not 0 <= i < self._len:
+            raise IndexError('index {} out of range'.format(i))
+        return self._word_bytes(i).decode('utf-8')
+
+    def count(self, w):
+        """Get the count for a word.
+
+        :param w: a string
+        """
+        i = self._lookup(w)
+        return 0 if i == -1 else int(self._counts[i])
+
+    @property
+    def counts(self):
+        """The count of every word, as a read-only int64 array indexed by word index."""
+        return self._counts
+
+    @property
+    def _unk(self):
+        return self.index2word(0)
+
+    def subset(self, words, return_mapping=False):
+        """Get a new `Vocab` containing only the specified subset of words, as for `Vocab.subset`.
+
+        A MappedVocab is read-only, so the subset is an in-memory `Vocab`.
+
+        :param return_mapping: whether to also return an array mapping old indices to new ones (see `Vocab.subset`).
+
+        :return (Vocab): a new Vocab object, and the mapping if `return_mapping` is set
+        """
+        assert len(set(words)) == len(words)
+        indices = [i for i in (self._lookup(w) for w in words if w != self._unk) if i != -1]
+        v = Vocab(self._unk)
+        for i in indices:
+            v.add(self.index2word(i), count=int(self._counts[i]))
+        if self._unk in words:
+            v.add(self._unk, count=int(self._counts[0]))
+        old_to_new = np.zeros(len(self), dtype=np.int64)
+        old_to_new[np.asarray(indices, dtype=np.int64)] = np.arange(1, len(v), dtype=np.int64)
+        return (v, old_to_new) if return_mapping else v
+
+    def to_file(self, f):
+        """Write vocab to a file, in the same format as `Vocab.to_file`.
+
+        :param (file) f: a file object, e.g. as returned by calling `open`
+        """
+        for word, count in izip(self, self._counts.tolist()):
+            f.write(u'{}\t{}\n'.format(word, count).encode('utf-8'))
+
+
+class HashedVocab(BaseVocab):
+    """A vocabulary of fixed size that maps words into hash buckets, for streams with unbounded vocabularies.
+
+    Every word has an index, so nothing is sent to UNK and no per-word state is kept: memory depends only on
+    the number of buckets. Optionally, the most frequent words keep exact indices in a `front` vocab, and
+    only the remaining words are hashed. Indices are laid out as::
+
+        [0, F)      the words of the front vocab (F = len(front)), or just UNK if there is no front vocab
+        [F, F + B)  the B hash buckets
+
+    Words are hashed with crc32 of their UTF-8 encoding, so indices are the same across processes and runs.
+    `ngram_indices` also hashes the character n-grams of a word into the same buckets, fastText-style, so
+    that OOV words can be represented by a combination of their n-gram rows.
+
+    Example:
+
+    .. code-block:: python
+
+        builder = StreamingVocabBuilder()
+        builder.update(tokens)
+        v = HashedVocab(2 ** 20, front=builder.build('***UNK***', top_k=50000))
+        matrix, lengths = v.encode_batch(sentences)
+        emb = Embeddings(np.zeros((len(v), 100), dtype=np.float32), v)
+    """
+
+    BUCKET_FORMAT = u'<bucket {}>'
+
+    def __init__(self, num_buckets, front=None, unk=u'***UNK***'):
+        """
+        :param num_buckets: number of hash buckets.
+        :param front: an optional `Vocab`, `CompactVocab` or `MappedVocab` of words that keep exact indices.
+            It should not be modified afterwards.
+        :param unk: string to represent UNK at index 0 when there is no front vocab. UNK is never the index of
+            a word; it can be used for padding.
+        """
+        if num_buckets < 1:
+            raise ValueError('num_buckets must be positive')
+        self.num_buckets = num_buckets
+        self.front = front
+        self._unk = front.index2word(0) if front is not None else unk
+        self._offset = len(front) if front is not None else 1
+        # occurrences of every index, in fixed memory; see `update`.
+        self._counts = np.zeros(self._offset + num_buckets, dtype=np.int64)
+
+    def __len__(self):
+        return self._offset + self.num_buckets
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.index2word(i)
+
+    def __contains__(self, word):
+        """Every word has an index, so this is always True."""
+        return True
+
+    def __getitem__(self, word):
+        return self.word2index(word)
+
+    def __str__(self):
+        return 'HashedVocab(%d words, %d buckets)' % (self._offset, self.num_buckets)
+
+    def bucket(self, s):
+        """The index of the bucket that string s hashes to, ignoring the front vocab."""
+        b = s.encode('utf-8') if not isinstance(s, bytes) else s
+        return self._offset + (zlib.crc32(b) & 0xffffffff) % self.num_buckets
+
+    def is_hashed(self, i):
+        """Whether index i is a hash bucket rather than an exact word."""
+        return i >= self._offset
+
+    def word2index(self, w):
+        front = self.front
+        if front is not None and w in front:
+            return front[w]
+        return self.bucket(w)
+
+    def index2word(self, i):
+        """Convert integer to string. Buckets are named with `BUCKET_FORMAT`."""
+        if not 0 <= i < len(self):
+            raise IndexError('index {} out of range'.format(i))
+        if i >= self._offset:
+            return self.BUCKET_FORMAT.format(i - self._offset)
+        return self.front.index2word(i) if self.front is not None else self._unk
+
+    def ngram_indices(self, w, n_min=3, n_max=6, include_word=True):
+        """Get the bucket indices of the character n-grams of a word.
+
+        As in fastText, the word is wrapped in `<` and `>` before taking n-grams, so that prefixes and suffixes
+        are distinguished. Words of the front vocab only get their exact index.
+
+        :param w: a word
+        :param n_min: shortest n-gram
+        :param n_max: longest n-gram
+        :param include_word: whether to include the index of the word itself (its bucket, for an OOV word).
+
+        :return: a list of indices, possibly with repeats
+        """
+        front = self.front
+        if front is not None and w in front:
+            return [front[w]]
+        wrapped = u'<' + w + u'>'
+        indices = [self.bucket(w)] if include_word else []
+        for n in range(n_min, min(n_max, len(wrapped)) + 1):
+            indices.extend(self.bucket(wrapped[i:i + n]) for i in range(len(wrapped) - n + 1))
+        return indices
+
+    def freeze(self):
+        return self
+
+    def update(self, words):
+        """Count occurrences of words, in fixed memory.
+
+        Unlike `Vocab.update`, this never adds indices; words in the same bucket share their count.
+
+        :param words: an iterable of words
+        :return: the corresponding list of indices for each word.
+        """
+        indices = self.words2indices(words)
+        np.add.at(self._counts, np.asarray(indices, dtype=np.int64), 1)
+        return indices
+
+    def count(self, w):
+        """Get the count of the index of a word (shared by every word in its bucket).
+
+        :param w: a string
+        """
+        return int(self._counts[self.word2index(w)])
+
+    @property
+    def counts(self):
+        """The count of every index, as an int64 array; see `update`."""
+        return self._counts
+
+    def iteritems(self):
+        """Iterate over the (word, index) pairs of every index, as for `Vocab`. Buckets are named with
+        `BUCKET_FORMAT`."""
+        for i in range(len(self)):
+            yield self.index2word(i), i
+
+    def items(self):
+        return list(self.iteritems())
+
+    def subset(self, words, return_mapping=False):
+        """Get a new HashedVocab with the same buckets, whose front vocab only has the specified words.
+
+        Every word must still have an index, so all the buckets are kept, in order, after the new front vocab.
+        Words that are not in the front vocab are ignored. Counts are preserved, except that the count of UNK is
+        reset unless UNK is in `words`, as for `Vocab.subset`.
+
+        :param return_mapping: whether to also return an array mapping old indices to new ones (see `Vocab.subset`).
+
+        :return (HashedVocab): a new HashedVocab object, and the mapping if `return_mapping` is set
+        """
+        if self.front is not None:
+            front, front_map = self.front.subset(words, return_mapping=True)
+        else:
+            front, front_map = None, np.zeros(1, dtype=np.int64)
+        v = HashedVocab(self.num_buckets, front=front, unk=self._unk)
+        old_to_new = np.concatenate([front_map, np.arange(v._offset, len(v), dtype=np.int64)])
+        kept = np.flatnonzero(old_to_new)
+        v._counts[old_to_new[kept]] = self._counts[kept]
+        if self._unk in words:
+            v._counts[0] = self._counts[0]
+        return (v, old_to_new) if return_mapping else v
+
+    def to_file(self, f):
+        """Write vocab to a file, in the format of `Vocab.to_file`: one line per index, with the counts of `update`.
+        The buckets come last, named with `BUCKET_FORMAT`. Load it with `HashedVocab.from_file`.
+
+        :param (file) f: a file object, e.g. as returned by calling `open`
+        """
+        for word, count in izip(self, self._counts.tolist()):
+            f.write(u'{}\t{}\n'.format(word, count).encode('utf-8'))
+
+    @classmethod
+    def from_file(cls, f):
+        """Load vocab from a file written by `to_file`. The front vocab, if any, is a `CompactVocab`.
+
+        :param (file) f: a file object, e.g. as returned by calling `open`
+        :return: a HashedVocab object
+        """
+        words, counts = [], []
+        for line in f:
+            word, count_str = line.split('\t')
+            words.append(word.decode('utf-8'))
+            counts.append(int(float(count_str)))
+        first_bucket = cls.BUCKET_FORMAT.format(0)
+        if first_bucket not in words:
+            raise ValueError('not a HashedVocab file: it has no buckets')
+        offset = words.index(first_bucket)
+        num_buckets = len(words) - offset
+        if words[offset:] != [cls.BUCKET_FORMAT.format(i) for i in range(num_buckets)]:
+            raise ValueError('not a HashedVocab file: the buckets are not last, in order')
+        front = None
+        if offset > 1:
+            front = CompactVocab(unk=words[0])
+            for w, c in izip(words[1:offset], counts[1:offset]):
+                front.add(w, count=c)
+        v = cls(num_buckets, front=front, unk=words[0])
+        v._counts[:] = counts
+        return v
+
+
+# The embedding caches opened by this process: maps a path prefix to its modification time, its `MappedVocab`
+# and its memory-mapped matrix.
+_embedding_caches = {}
+
+
+def _open_embeddings_cache(prefix):
+    """Open the `MappedVocab` and memory-mapped matrix of an embeddings cache, once per process.
+
+    Mapping is cheap, but reusing the maps also reuses the pages that earlier calls have already read.
+    The cache is reopened if its matrix has been rewritten.
+
+    :param prefix: path prefix of the cache files `<prefix>.vocab.bin` and `<prefix>.npy`.
+    :return: the MappedVocab and the matrix
+    """
+    mtime = os.path.getmtime(prefix + '.npy')
+    cached = _embedding_caches.get(prefix)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, MappedVocab(prefix + '.vocab.bin'), np.load(prefix + '.npy', mmap_mode='r'))
+        _embedding_caches[prefix] = cached
+    return cached[1], cached[2]
+
+
 class EmbeddedVocab(Vocab):
     def get_embeddings(self):
         """
@@ -305,14 +1245,49 @@ class EmbeddedVocab(Vocab):
         """ Backfills an embedding matrix with the embedding for the unknown token.
 
         :param E: original embedding matrix of dimensions `(vocab_size, emb_dim)`.
-        :param filled_words: these words will not be backfilled with unk.
+        :param filled_words: these words will not be backfilled with unk. Either a collection of words, or a boolean
+            array that is True at the indices of the filled words.
 
         NOTE: this function is for internal use.
         """
-        unk_emb = E[self[self._unk]]
-        for i, word in enumerate(self):
-            if word not in filled_words:
-                E[i] = unk_emb
+        if not isinstance(filled_words, np.ndarray):
+            filled_words = np.fromiter((w in filled_words for w in self), dtype=bool, count=len(self))
+        E[~filled_words] = E[self[self._unk]].copy()
+
+    def _get_cached_embeddings(self, dir_name, cache_name, n_dim, convert, rand, dtype):
+        """Retrieves the embeddings for the vocabulary from a binary cache, creating the cache first if needed.
+
+        The cache is a float32 `.npy` matrix and a `MappedVocab` of its words in `DATA_DIR/<dir_name>/`. The
+        MappedVocab indexes every word of the source by its row, and rows have a fixed size, so only the rows of
+        the words in this vocab are read, in file order, with a single fancy index into the memory-mapped matrix.
+        Both are opened once per process.
+
+        :param dir_name: directory of the cache, under `DATA_DIR`.
+        :param cache_name: name of the cache files, which should identify the source and dimension.
+        :param n_dim: dimension of the vectors.
+        :param convert: called with the path of the `.npy` file if the cache doesn't exist. It should write the
+            matrix there (see `parse_embedding_file`) and return the word of every row.
+        :param rand: Random initialization function for out-of-vocabulary words.
+        :param dtype: Type of the matrix.
+        :return: embeddings corresponding to the vocab instance.
+        """
+        prefix = os.path.join(stanza.DATA_DIR, dir_name, cache_name)
+        if not (os.path.isfile(prefix + '.npy') and os.path.isfile(prefix + '.vocab.bin')):
+            logging.info('Converting embeddings to a binary cache at {}. This only happens once.'.format(prefix))
+            words = convert(prefix + '.npy')
+            MappedVocab.write_words(words, prefix + '.vocab.bin.tmp')
+            os.rename(prefix + '.vocab.bin.tmp', prefix + '.vocab.bin')
+
+        words, matrix = _open_embeddings_cache(prefix)
+        rows = np.fromiter((words._lookup(w) for w in self), dtype=np.int64, count=len(self))
+        found = np.flatnonzero(rows >= 0)
+        # read the rows in file order, so that the pages of the matrix are visited sequentially
+        order = np.argsort(rows[found], kind='mergesort')
+
+        E = rand((len(self), n_dim)).astype(dtype)
+        E[found[order]] = matrix[rows[found[order]]]
+        self.backfill_unk_emb(E, rows >= 0)
+        return E
 
 
 class SennaVocab(EmbeddedVocab):
@@ -341,30 +1316,31 @@ class SennaVocab(EmbeddedVocab):
             for line in f:
                 yield np.fromstring(line, sep=' ')
 
-    def get_embeddings(self, rand=None, dtype='float32'):
+    def get_embeddings(self, rand=None, dtype='float32', workers=None):
         """
         Retrieves the embeddings for the vocabulary.
 
         :param rand: Random initialization function for out-of-vocabulary words. Defaults to `np.random.uniform(-0.1, 0.1, size=shape)`.
         :param dtype: Type of the matrix.
+        :param workers: number of processes used to parse the embeddings the first time. Defaults to the number of CPUs.
         :return: embeddings corresponding to the vocab instance.
 
-        NOTE: this function will download potentially very large binary dumps the first time it is called.
+        NOTE: this function will download potentially very large binary dumps the first time it is called,
+        and convert them to a binary cache that later calls load.
         """
         rand = rand if rand else lambda shape: np.random.uniform(-0.1, 0.1, size=shape)
-        embeddings = get_data_or_download('senna', 'embeddings.txt', self.embeddings_url)
-        words = get_data_or_download('senna', 'words.lst', self.words_url)
-
-        E = rand((len(self), self.n_dim)).astype(dtype)
-
-        seen = []
-        for word_emb in zip(self.gen_word_list(words), self.gen_embeddings(embeddings)):
-            w, e = word_emb
-            if w in self:
-                seen += [w]
-                E[self[w]] = e
-        self.backfill_unk_emb(E, set(seen))
-        return E
+
+        def convert(out_path):
+            embeddings = get_data_or_download('senna', 'embeddings.txt', self.embeddings_url)
+            words = list(self.gen_word_list(get_data_or_download('senna', 'words.lst', self.words_url)))
+            parse_embedding_file(embeddings, out_path, self.n_dim, has_words=False, workers=workers)
+            if len(np.load(out_path, mmap_mode='r')) != len(words):
+                os.remove(out_path)
+                raise ValueError('Senna has a different number of words and embeddings')
+            return words
+
+        return self._get_cached_embeddings('senna', 'senna.{}d'.format(self.n_dim), self.n_dim, convert,
+                                           rand, dtype)
 
 
 class GloveVocab(EmbeddedVocab):
@@ -389,7 +1365,7 @@ class GloveVocab(EmbeddedVocab):
     def __init__(self, unk='UNKNOWN'):
         super(GloveVocab, self).__init__(unk=unk)
 
-    def get_embeddings(self, rand=None, dtype='float32', corpus='common_crawl_48', n_dim=300):
+    def get_embeddings(self, rand=None, dtype='float32', corpus='common_crawl_48', n_dim=300, workers=None):
         """
         Retrieves the embeddings for the vocabulary.
 
@@ -397,36 +1373,40 @@ class GloveVocab(EmbeddedVocab):
         :param dtype: Type of the matrix.
         :param corpus: Corpus to use. Please see `GloveVocab.settings` for available corpus.
         :param n_dim: dimension of vectors to use. Please see `GloveVocab.settings` for available corpus.
+        :param workers: number of processes used to parse the embeddings the first time. Defaults to the number of CPUs.
         :return: embeddings corresponding to the vocab instance.
 
-        NOTE: this function will download potentially very large binary dumps the first time it is called.
+        NOTE: this function will download potentially very large binary dumps the first time it is called,
+        and convert them to a binary cache that later calls load.
         """
         assert corpus in self.settings, '{} not in supported corpus {}'.format(corpus, self.settings.keys())
         self.n_dim, self.corpus, self.setting = n_dim, corpus, self.settings[corpus]
         assert n_dim in self.setting.n_dims, '{} not in supported dimensions {}'.format(n_dim, self.setting.n_dims)
 
         rand = rand if rand else lambda shape: np.random.uniform(-0.1, 0.1, size=shape)
-        zip_file = get_data_or_download('glove', '{}.zip'.format(self.corpus), self.setting.url, size=self.setting.size)
-
-        E = rand((len(self), self.n_dim)).astype(dtype)
-        n_dim = str(self.n_dim)
-
-        with zipfile.ZipFile(zip_file) as zf:
-            # should be only 1 txt file
-            names = [info.filename for info in zf.infolist() if
-                     info.filename.endswith('.txt') and n_dim in info.filename]
-            if not names:
-                s = 'no .txt files found in zip file that matches {}-dim!'.format(n_dim)
-                s += '\n available files: {}'.format(names)
-                raise IOError(s)
-            name = names[0]
-            seen = []
-            with zf.open(name) as f:
-                for line in f:
-                    toks = str(line).rstrip().split(' ')
-                    word = toks[0]
-                    if word in self:
-                        seen += [word]
-                        E[self[word]] = np.array([float(w) for w in toks[1:]], dtype=dtype)
-            self.backfill_unk_emb(E, set(seen))
-            return E
+
+        def convert(out_path):
+            zip_file = get_data_or_download('glove', '{}.zip'.format(self.corpus), self.setting.url,
+                                            size=self.setting.size)
+            with zipfile.ZipFile(zip_file) as zf:
+                txt_file = zf.extract(self._find_txt(zf, n_dim), os.path.dirname(out_path))
+            try:
+                return parse_embedding_file(txt_file, out_path, n_dim, workers=workers)
+            finally:
+                os.remove(txt_file)
+
+        cache_name = '{}.{}d'.format(self.corpus, n_dim)
+        return self._get_cached_embeddings('glove', cache_name, n_dim, convert, rand, dtype)
+
+    @staticmethod
+    def _find_txt(zf, n_dim):
+        """Name of the text file of n_dim-dimensional vectors in a GloVe zip file."""
+        n_dim = str(n_dim)
+        # should be only 1 txt file
+        names = [info.filename for info in zf.infolist() if
+                 info.filename.endswith('.txt') and n_dim in info.filename]
+        if not names:
+            s = 'no .txt files found in zip file that matches {}-dim!'.format(n_dim)
+            s += '\n available files: {}'.format(names)
+            raise IOError(s)
+        return names[0]
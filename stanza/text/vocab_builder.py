@@ -0,0 +1,348 @@
+"""
+Builders for vocabularies over large corpora: streaming, in bounded memory, or in parallel over shards.
+"""
+from collections import Counter, namedtuple
+import hashlib
+from itertools import chain, islice
+from multiprocessing import Pool, cpu_count
+import os
+
+import numpy as np
+from six.moves import reduce
+
+from .vocab import Vocab
+from ..util.unicode import uopen
+
+
+class StreamingVocabBuilder(object):
+    """Approximately counts a stream of tokens in bounded memory, and builds a `Vocab` of the most frequent.
+
+    Counts are kept in a Misra-Gries summary of at most `max_words` words, backed by a count-min sketch.
+    The stream is consumed in chunks; each chunk is counted exactly, merged into the summary, and the
+    summary is then shrunk back to `max_words` words by subtracting the `(max_words + 1)`-th largest count
+    from every word. This gives the following guarantees, for a stream of N tokens:
+
+    - every word that occurs more than `error` <= N / (max_words + 1) times is in the summary;
+    - the true count of a word lies within `bounds(word)`: the summary count is a lower bound, and the
+      smaller of `summary count + error` and the sketch estimate is an upper bound (the rows of the sketch
+      hash words independently, with collision probability at most 2 / sketch_width, so the sketch
+      overestimates by at most 4N / sketch_width with probability at least 1 - 0.5 ** sketch_depth).
+
+    Example:
+
+    .. code-block:: python
+
+        builder = StreamingVocabBuilder.from_memory_budget(2 * 1024 ** 3)
+        builder.update(token for line in open('corpus.txt') for token in line.split())
+        vocab = builder.build('***UNK***', top_k=100000)
+    """
+
+    # rough cost of one word in the summary (dict entry, int and a short string), in bytes
+    BYTES_PER_WORD = 200
+
+    def __init__(self, max_words=100000, sketch_width=2 ** 20, sketch_depth=4, chunk_size=None):
+        """
+        :param max_words: number of words kept in the summary.
+        :param sketch_width: number of counters in each row of the count-min sketch.
+        :param sketch_depth: number of rows (hash functions) of the count-min sketch.
+        :param chunk_size: number of tokens counted exactly at a time. Defaults to `max_words`.
+        """
+        self.max_words = max_words
+        self.chunk_size = chunk_size or max_words
+        self.sketch = np.zeros((sketch_depth, sketch_width), dtype=np.int64)
+        # one random odd multiplier per row, for multiply-shift hashing; the seed is fixed so that sketches
+        # are comparable across processes and runs
+        self._multipliers = np.random.RandomState(0).randint(0, 2 ** 64, size=sketch_depth, dtype=np.uint64) | \
+            np.uint64(1)
+        self._counts = {}
+        self.error = 0
+        self.n_tokens = 0
+
+    @classmethod
+    def from_memory_budget(cls, memory_bytes, sketch_depth=4):
+        """Create a builder whose summary, sketch and chunk counts fit in roughly `memory_bytes`.
+
+        A quarter of the budget goes to the sketch. The summary and the chunk being counted share the rest.
+        """
+        sketch_width = max(1, memory_bytes // 4 // (8 * sketch_depth))
+        max_words = max(1, memory_bytes * 3 // 4 // (2 * cls.BYTES_PER_WORD))
+        return cls(max_words=max_words, sketch_width=sketch_width, sketch_depth=sketch_depth)
+
+    def _columns(self, words):
+        """The column of every word in every row of the sketch.
+
+        Every word is hashed once to a 64-bit key, with MD5, and every row then hashes the key independently
+        by multiply-shift with its own multiplier: the top 32 bits of `key * multiplier` (mod 2 ** 64), scaled
+        to the width.
+
+        :return: an int64 array of shape `(len(words), sketch_depth)`
+        """
+        keys = np.array([np.frombuffer(hashlib.md5(w.encode('utf-8') if not isinstance(w, bytes) else w)
+                                       .digest()[:8], dtype='<u8')[0] for w in words], dtype=np.uint64)
+        with np.errstate(over='ignore'):
+            mixed = keys[:, np.newaxis] * self._multipliers
+        top = mixed >> np.uint64(32)
+        return ((top * np.uint64(self.sketch.shape[1])) >> np.uint64(32)).astype(np.int64)
+
+    def _shrink(self):
+        """Reduce the summary to at most max_words words, accumulating the subtracted count in `error`."""
+        if len(self._counts) <= self.max_words:
+            return
+        values = np.fromiter(self._counts.values(), dtype=np.int64, count=len(self._counts))
+        # the (max_words + 1)-th largest count
+        threshold = -np.partition(-values, self.max_words)[self.max_words]
+        self._counts = {w: c - threshold for w, c in self._counts.items() if c > threshold}
+        self.error += threshold
+
+    def _add_counts(self, chunk_counts):
+        """Merge exact counts of a chunk of tokens into the summary and the sketch."""
+        if not chunk_counts:
+            return
+        words = list(chunk_counts)
+        counts = np.array([chunk_counts[w] for w in words], dtype=np.int64)
+        columns = self._columns(words)
+        for row in range(self.sketch.shape[0]):
+            np.add.at(self.sketch[row], columns[:, row], counts)
+
+        summary = self._counts
+        for w, c in chunk_counts.items():
+            summary[w] = summary.get(w, 0) + c
+        self.n_tokens += int(counts.sum())
+        self._shrink()
+
+    def update(self, tokens):
+        """Count an iterable of tokens.
+
+        :param tokens: an iterable of words; it is consumed `chunk_size` tokens at a time.
+        """
+        tokens = iter(tokens)
+        while True:
+            chunk = Counter(islice(tokens, self.chunk_size))
+            if not chunk:
+                break
+            self._add_counts(chunk)
+
+    def sketch_count(self, word):
+        """The count-min sketch estimate of the count of word, which never underestimates."""
+        columns = self._columns([word])[0]
+        return int(self.sketch[np.arange(len(columns)), columns].min())
+
+    def bounds(self, word):
+        """Lower and upper bounds on the true count of word.
+
+        :return: a tuple `(lower, upper)`
+        """
+        lower = self._counts.get(word, 0)
+        return lower, min(lower + self.error, self.sketch_count(word))
+
+    def estimates(self):
+        """Estimated counts of the words in the summary: the upper bound of `bounds`.
+
+        :return: a dict from word to estimated count
+        """
+        return {w: self.bounds(w)[1] for w in self._counts}
+
+    def build(self, unk, top_k=None, min_count=None, vocab_cls=Vocab):
+        """Build a vocabulary from the words in the summary, ordered by decreasing estimated count.
+
+        :param unk: string to represent the unknown word (UNK).
+        :param top_k: if given, keep at most this many words (besides UNK).
+        :param min_count: if given, keep only words whose estimated count is at least this.
+        :param vocab_cls: class of the vocabulary to build, e.g. `Vocab` or `CompactVocab`.
+
+        :return: a vocab whose counts are the estimated counts.
+        """
+        estimates = self.estimates()
+        estimates.pop(unk, None)
+        words = sorted(estimates, key=lambda w: (-estimates[w], w))
+        if min_count is not None:
+            words = [w for w in words if estimates[w] >= min_count]
+        if top_k is not None:
+            words = words[:top_k]
+        vocab = vocab_cls(unk)
+        for w in words:
+            vocab.add(w, count=estimates[w])
+        return vocab
+
+
+def _count_shards(args):
+    """Count the tokens of some shards, UTF-8 text files, into one Counter."""
+    paths, tokenize = args
+    counts = Counter()
+    for path in paths:
+        with uopen(path) as f:
+            for line in f:
+                counts.update(tokenize(line) if tokenize else line.split())
+    return counts
+
+
+def count_shards(paths, tokenize=None, workers=None):
+    """Count the tokens of many text files in parallel.
+
+    The shards are split into one group per worker process, balanced by file size. Workers receive only the
+    paths, and each returns the counts of its whole group, which this process merges as they arrive.
+
+    :param paths: paths of UTF-8 text files.
+    :param tokenize: a function from a line to its tokens. Defaults to splitting on whitespace.
+        It must be picklable (e.g. a module-level function) if `workers` is not 1.
+    :param workers: number of worker processes. Defaults to the number of CPUs; 1 counts in this process.
+
+    :return: a Counter of all tokens.
+    """
+    workers = min(workers or cpu_count(), len(paths))
+    if workers <= 1:
+        return _count_shards((paths, tokenize))
+    # deal the shards out largest first, so that every group has about the same number of bytes
+    groups = [[] for _ in range(workers)]
+    sizes = [0] * workers
+    for path in sorted(paths, key=os.path.getsize, reverse=True):
+        i = sizes.index(min(sizes))
+        groups[i].append(path)
+        sizes[i] += os.path.getsize(path)
+    pool = Pool(workers)
+    try:
+        counts = Counter()
+        for group_counts in pool.imap_unordered(_count_shards, [(group, tokenize) for group in groups]):
+            counts.update(group_counts)
+        return counts
+    finally:
+        pool.terminate()
+
+
+def build_vocab_from_shards(paths, unk, tokenize=None, workers=None, vocab_cls=Vocab):
+    """Build a vocabulary over many text files in parallel.
+
+    The result doesn't depend on the number of workers: words are ordered by decreasing count and then by
+    word (see `Vocab.from_counts`), with UNK at index 0.
+
+    :param paths: paths of UTF-8 text files.
+    :param unk: string to represent the unknown word (UNK).
+    :param tokenize: a function from a line to its tokens. Defaults to splitting on whitespace.
+    :param workers: number of worker processes. Defaults to the number of CPUs.
+    :param vocab_cls: class of the vocabulary to build, e.g. `Vocab` or `CompactVocab`.
+
+    :return: the vocabulary.
+    """
+    return vocab_cls.from_counts(count_shards(paths, tokenize, workers), unk)
+
+
+class LengthStats(namedtuple('LengthStats', ['count', 'min', 'max', 'mean', 'p50', 'p95', 'p99'])):
+    """Statistics of the lengths of the values of a field."""
+
+    @classmethod
+    def from_histogram(cls, histogram):
+        """
+        :param histogram: an array whose i-th element is the number of values of length i.
+        """
+        n = int(histogram.sum())
+        if n == 0:
+            return cls(0, 0, 0, 0., 0, 0, 0)
+        lengths = np.flatnonzero(histogram)
+        cumulative = np.cumsum(histogram)
+
+        def percentile(q):
+            return int(np.searchsorted(cumulative, q / 100. * n))
+
+        mean = float(np.dot(np.arange(len(histogram)), histogram)) / n
+        return cls(n, int(lengths[0]), int(lengths[-1]), mean, percentile(50), percentile(95), percentile(99))
+
+
+FieldVocabs = namedtuple('FieldVocabs', ['vocabs', 'char_vocabs', 'lengths'])
+
+
+def _tokens(value):
+    """The tokens of a field value: the value itself if it is a sequence, else the value as one token."""
+    return value if isinstance(value, (list, tuple)) else (value,)
+
+
+def _count_columns(args):
+    """Count the tokens, characters and lengths of some columns of a dataset.
+
+    :return: dicts from field name to a Counter of tokens, a Counter of characters, and a histogram of lengths
+    """
+    columns, char_fields = args
+    counts, char_counts, histograms = {}, {}, {}
+    for name, column in columns.items():
+        values = [_tokens(v) for v in column]
+        counts[name] = Counter(chain.from_iterable(values))
+        if name in char_fields:
+            # count the characters of each distinct token once, weighted by its count
+            chars = Counter()
+            for token, c in counts[name].items():
+                for ch, n in Counter(token).items():
+                    chars[ch] += n * c
+            char_counts[name] = chars
+        histograms[name] = np.bincount([len(v) for v in values]) if values else np.zeros(1, dtype=np.int64)
+    return counts, char_counts, histograms
+
+
+def _add_histograms(a, b):
+    if len(a) < len(b):
+        a, b = b, a
+    a = a.copy()
+    a[:len(b)] += b
+    return a
+
+
+def _merge_column_counts(merged, other):
+    """Add the counts and histograms of `_count_columns` in `other` to those in `merged`."""
+    counts, char_counts, histograms = merged
+    counts_b, char_counts_b, histograms_b = other
+    for name in counts:
+        counts[name].update(counts_b[name])
+        histograms[name] = _add_histograms(histograms[name], histograms_b[name])
+    for name in char_counts:
+        char_counts[name].update(char_counts_b[name])
+    return merged
+
+
+def build_field_vocabs(dataset, fields=None, unk='***UNK***', char_fields=(), workers=1, vocab_cls=Vocab):
+    """Build a vocabulary for several fields of a `Dataset` in one pass over their columns.
+
+    Columns are read directly from `dataset.fields`, rather than through `Dataset.__iter__`, which builds an
+    `OrderedDict` per instance. A field value that is a list or tuple is taken as a sequence of tokens; any other
+    value is a single token.
+
+    Example:
+
+    .. code-block:: python
+
+        result = build_field_vocabs(dataset, ['words', 'tags'], char_fields=['words'], workers=4)
+        word_vocab, tag_vocab = result.vocabs['words'], result.vocabs['tags']
+        print(result.lengths['words'].p95)
+
+    :param dataset: a `Dataset`.
+    :param fields: names of the fields to build vocabularies for. Defaults to all fields.
+    :param unk: string to represent the unknown word (UNK) in every vocabulary.
+    :param char_fields: names of the fields to also build a character vocabulary for.
+    :param workers: number of worker processes; the instances are split into that many ranges.
+    :param vocab_cls: class of the vocabularies to build, e.g. `Vocab` or `CompactVocab`.
+
+    :return (FieldVocabs): dicts from field name to its vocab (ordered as by `Vocab.from_counts`), to its character
+        vocab (for `char_fields` only), and to the `LengthStats` of its values.
+    """
+    fields = list(dataset.fields) if fields is None else list(fields)
+    char_fields = frozenset(char_fields)
+    if not char_fields <= set(fields):
+        raise ValueError('char_fields must be a subset of fields')
+    columns = {name: dataset.fields[name] for name in fields}
+
+    n = len(dataset)
+    if workers > 1 and n > 1:
+        bounds = np.linspace(0, n, min(workers, n) + 1).astype(int)
+        args = [({name: column[begin:end] for name, column in columns.items()}, char_fields)
+                for begin, end in zip(bounds[:-1], bounds[1:])]
+        pool = Pool(workers)
+        try:
+            # every worker counts one range; the results are merged here, as they arrive
+            results = pool.imap_unordered(_count_columns, args)
+            counts, char_counts, histograms = reduce(_merge_column_counts, results)
+        finally:
+            pool.terminate()
+    else:
+        counts, char_counts, histograms = _count_columns((columns, char_fields))
+
+    vocabs = {name: vocab_cls.from_counts(counts[name], unk) for name in fields}
+    char_vocabs = {name: vocab_cls.from_counts(char_counts[name], unk) for name in char_fields}
+    lengths = {name: LengthStats.from_histogram(histograms[name]) for name in fields}
+    return FieldVocabs(vocabs, char_vocabs, lengths)
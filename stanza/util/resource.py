@@ -1,25 +1,220 @@
 __author__ = 'victor'
+import hashlib
 import os
+import re
+import threading
 import stanza
 import requests
 import logging
 
 
+CHUNK_SIZE = 1024 ** 2
+
+
 def get_from_url(url):
     """
     :param url: url to download from
     :return: return the content at the url
+
+    NOTE: the content is held in memory. Use `download` for large files.
     """
     return requests.get(url).content
 
 
-def get_data_or_download(dir_name, file_name, url='', size='unknown'):
+def file_checksum(path, hash_name='sha256'):
+    """
+    :param path: file to hash
+    :param hash_name: name of a hash function in `hashlib`
+    :return: the hex digest of the file
+    """
+    h = hashlib.new(hash_name)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _honored(response, begin, end):
+    """Whether a response to a Range request holds bytes [begin, end] (to the end if end is None)."""
+    if response.status_code != 206:
+        return False
+    match = re.match(r'bytes (\d+)-(\d+)/', response.headers.get('Content-Range', ''))
+    return bool(match) and int(match.group(1)) == begin and (end is None or int(match.group(2)) == end)
+
+
+def _get_range(url, fname, begin=0, end=None, on_chunk=None):
+    """Download bytes [begin, end] of url (to the end if end is None), appending to fname.
+
+    If fname already holds the first bytes of the range, only the rest is requested; if it holds more bytes than
+    the range, it can't be the start of the range and is deleted. The bytes are written as sent, without decoding
+    any Content-Encoding, since the range offsets count the encoded bytes.
+
+    :param on_chunk: called with the size of every chunk written, and with minus the size of fname when its bytes
+        are discarded
+    :return: whether the server honored the range, as checked against the status and Content-Range of the
+        response. If it didn't, fname now holds the whole content if end is None, and nothing is written
+        otherwise.
+    """
+    done = os.path.getsize(fname) if os.path.isfile(fname) else 0
+    if end is not None and begin + done > end:
+        if begin + done == end + 1:
+            return True
+        os.remove(fname)
+        if on_chunk:
+            on_chunk(-done)
+        done = 0
+    headers = {}
+    if begin + done > 0 or end is not None:
+        headers['Range'] = 'bytes={}-{}'.format(begin + done, '' if end is None else end)
+    response = requests.get(url, headers=headers, stream=True)
+    if response.status_code == 416 and end is None:
+        # the range starts at the end of the content: nothing is left to download
+        return True
+    response.raise_for_status()
+    partial = response.status_code == 206
+    if headers and (partial or end is not None) and not _honored(response, begin + done, end):
+        response.close()
+        if end is not None:
+            return False
+        # some other range was sent: download the whole content instead
+        os.remove(fname)
+        if on_chunk:
+            on_chunk(-done)
+        _get_range(url, fname, on_chunk=on_chunk)
+        return False
+    if not partial and done and on_chunk:
+        # the whole content replaces what was there
+        on_chunk(-done)
+    with open(fname, 'ab' if partial else 'wb') as f:
+        for chunk in response.raw.stream(CHUNK_SIZE, decode_content=False):
+            f.write(chunk)
+            if on_chunk:
+                on_chunk(len(chunk))
+    return partial or not headers
+
+
+def _part_paths(fname, segments):
+    """The part files that `_get_segments` downloads the segments of fname to."""
+    return ['{}.{}'.format(fname, i) for i in range(segments)]
+
+
+def _get_segments(url, fname, size, segments, on_chunk):
+    """Download url in parallel ranges, each to its own part file, and concatenate them into fname.
+
+    If the server doesn't honor the ranges, the part files are deleted and url is downloaded as one stream.
+    """
+    bounds = [size * i // segments for i in range(segments + 1)]
+    parts = _part_paths(fname, segments)
+    errors = []
+    ignored = []
+
+    def get_segment(i):
+        try:
+            if not _get_range(url, parts[i], bounds[i], bounds[i + 1] - 1, on_chunk):
+                ignored.append(i)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=get_segment, args=(i,)) for i in range(segments)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        raise errors[0]
+    if ignored:
+        logging.warn('{} does not honor range requests; downloading it as one stream'.format(url))
+        for part in parts:
+            if os.path.isfile(part):
+                on_chunk(-os.path.getsize(part))
+                os.remove(part)
+        _get_range(url, fname, on_chunk=on_chunk)
+        return
+
+    with open(fname, 'wb') as f:
+        for part in parts:
+            with open(part, 'rb') as p:
+                for chunk in iter(lambda: p.read(CHUNK_SIZE), b''):
+                    f.write(chunk)
+    for part in parts:
+        os.remove(part)
+
+
+def download(url, fname, checksum=None, hash_name='sha256', segments=1, show_progress=True):
+    """Download url to fname, streaming it to disk.
+
+    The content is written to `<fname>.part` and renamed to fname once it is complete (and matches checksum),
+    so fname either doesn't exist or is complete. If a previous download was interrupted, it resumes from the
+    partial file with an HTTP Range request.
+
+    :param url: url to download from
+    :param fname: path to write to
+    :param checksum: if given, the expected hex digest of the file. On mismatch the download is deleted
+        and an IOError is raised.
+    :param hash_name: name of the hash function of checksum, in `hashlib`
+    :param segments: number of ranges to download in parallel, if the server supports range requests
+    :param show_progress: whether to report progress, in MB, through `stanza.monitoring.progress`
+    :return: fname
+    """
+    tmp = fname + '.part'
+    head = requests.head(url, allow_redirects=True)
+    if not head.ok:
+        # not every server answers HEAD requests; download without knowing the size
+        head.headers.clear()
+    size = int(head.headers['Content-Length']) if 'Content-Length' in head.headers else None
+    ranges = head.headers.get('Accept-Ranges') == 'bytes'
+    segmented = segments > 1 and ranges and size
+
+    if size is not None and os.path.isfile(tmp) and os.path.getsize(tmp) > size:
+        # it can't be the start of the content, which may have changed since
+        logging.warn('{} is larger than {}; restarting the download'.format(tmp, url))
+        os.remove(tmp)
+
+    # progress counts the bytes on disk, starting from those of an interrupted download
+    lock = threading.Lock()
+    files = _part_paths(tmp, segments) if segmented else [tmp]
+    received = [sum(os.path.getsize(path) for path in files if os.path.isfile(path))]
+    if show_progress and size:
+        # imported here: stanza.monitoring.progress is Python 2 only, and this module is imported by stanza.text
+        from stanza.monitoring import progress
+        progress.start_task('MB of {}'.format(os.path.basename(fname)), size // 1024 ** 2)
+        progress.progress(received[0] // 1024 ** 2)
+
+    def on_chunk(n):
+        with lock:
+            received[0] += n
+            if show_progress and size:
+                progress.progress(received[0] // 1024 ** 2)
+
+    try:
+        if segmented:
+            _get_segments(url, tmp, size, segments, on_chunk)
+        else:
+            _get_range(url, tmp, on_chunk=on_chunk)
+    finally:
+        if show_progress and size:
+            progress.end_task()
+
+    if size is not None and os.path.getsize(tmp) != size:
+        raise IOError('downloaded {} bytes of {} from {}; retry to resume'.format(os.path.getsize(tmp), size, url))
+    if checksum is not None:
+        actual = file_checksum(tmp, hash_name)
+        if actual != checksum.lower():
+            os.remove(tmp)
+            raise IOError('{} checksum of {} is {}, expected {}'.format(hash_name, url, actual, checksum))
+    os.rename(tmp, fname)
+    return fname
+
+
+def get_data_or_download(dir_name, file_name, url='', size='unknown', checksum=None, segments=1):
     """Returns the data. if the data hasn't been downloaded, then first download the data.
 
     :param dir_name: directory to look in
     :param file_name: file name to retrieve
     :param url: if the file is not found, then download it from this url
     :param size: the expected size
+    :param checksum: if given, the expected sha256 hex digest of the downloaded file
+    :param segments: number of ranges to download in parallel, if the server supports it
     :return: path to the requested file
     """
     dname = os.path.join(stanza.DATA_DIR, dir_name)
@@ -30,6 +225,5 @@ def get_data_or_download(dir_name, file_name, url='', size='unknown'):
     if not os.path.isfile(fname):
         assert url, 'Could not locate data {}, and url was not specified. Cannot retrieve data.'.format(fname)
         logging.warn('downloading from {}. This file could potentially be *very* large! Actual size ({})'.format(url, size))
-        with open(fname, 'wb') as f:
-            f.write(get_from_url(url))
+        download(url, fname, checksum=checksum, segments=segments)
     return fname
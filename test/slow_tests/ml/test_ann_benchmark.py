@@ -0,0 +1,61 @@
+"""
+Recall and speed benchmark of `Embeddings.k_nearest_approx_batch` against the exact `k_nearest_batch`.
+
+The vectors are drawn around random centers, so that they are clustered like word embeddings.
+
+Run with `py.test -s test/slow_tests/ml/test_ann_benchmark.py` to see the numbers.
+"""
+import time
+from unittest import TestCase
+
+import numpy as np
+
+from stanza.ml.embeddings import Embeddings
+from stanza.text.vocab import CompactVocab
+
+N_WORDS = 200000
+N_DIM = 100
+N_CENTERS = 2000
+N_QUERIES = 1000
+K = 10
+
+
+def _embeddings(rng):
+    centers = rng.randn(N_CENTERS, N_DIM).astype(np.float32)
+    array = centers[rng.randint(N_CENTERS, size=N_WORDS)] + rng.randn(N_WORDS, N_DIM).astype(np.float32)
+    vocab = CompactVocab('unk')
+    vocab.update('w{}'.format(i) for i in range(N_WORDS - 1))
+    return Embeddings(array, vocab)
+
+
+class TestAnnBenchmark(TestCase):
+
+    def test_recall_and_qps(self):
+        rng = np.random.RandomState(0)
+        embeddings = _embeddings(rng)
+        queries = embeddings.array[rng.choice(N_WORDS, N_QUERIES, replace=False)]
+        queries = queries + 0.1 * rng.randn(*queries.shape).astype(np.float32)
+
+        start = time.time()
+        exact_ids, _ = embeddings.k_nearest_batch(queries, K, metric='cosine')
+        exact_qps = N_QUERIES / (time.time() - start)
+
+        start = time.time()
+        index = embeddings.build_ann_index()
+        build_time = time.time() - start
+
+        print('\n{} words of dimension {}, {} lists (built in {:.1f}s), {} queries:'.format(
+            N_WORDS, N_DIM, index.n_lists, build_time, N_QUERIES))
+        print('  exact:       recall@{} 1.000, {:8.0f} queries/s'.format(K, exact_qps))
+        recalls = []
+        for n_probe in (1, 4, 16, 64):
+            start = time.time()
+            ids, _ = embeddings.k_nearest_approx_batch(queries, K, n_probe=n_probe)
+            qps = N_QUERIES / (time.time() - start)
+            recall = np.mean([len(set(a) & set(b)) / float(K) for a, b in zip(ids, exact_ids)])
+            recalls.append(recall)
+            print('  n_probe={:<3}  recall@{} {:.3f}, {:8.0f} queries/s'.format(n_probe, K, recall, qps))
+            if n_probe == 16:
+                self.assertGreater(qps, exact_qps)
+        self.assertEqual(recalls, sorted(recalls))
+        self.assertGreater(recalls[-1], 0.9)
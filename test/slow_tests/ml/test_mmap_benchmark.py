@@ -0,0 +1,87 @@
+"""
+Memory benchmark of worker processes that load the same embeddings with and without `mmap=True`.
+
+Every worker loads the embeddings, reads every row and reports its memory while all of them are alive:
+
+- RSS counts every page the process has in memory, including pages of the mapped file, which the page cache
+  holds once for all processes. It grows by the size of the matrix in every worker either way.
+- PSS divides shared pages between the processes that map them, so it adds up to the memory actually used.
+- Anonymous memory is memory that is not backed by a file: a private copy of the matrix.
+
+Run with `py.test -s test/slow_tests/ml/test_mmap_benchmark.py` to see the numbers (Linux only).
+"""
+from multiprocessing import Event, Process, Queue
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from stanza.ml.embeddings import Embeddings
+from stanza.text.vocab import CompactVocab
+
+N_WORDS = 200000
+N_DIM = 300
+N_WORKERS = 4
+
+
+def _memory():
+    """The RSS, PSS and anonymous memory of this process, in bytes."""
+    totals = {'Rss:': 0, 'Pss:': 0, 'Anonymous:': 0}
+    with open('/proc/self/smaps') as f:
+        for line in f:
+            fields = line.split()
+            if fields[0] in totals:
+                totals[fields[0]] += int(fields[1]) * 1024
+    return totals['Rss:'], totals['Pss:'], totals['Anonymous:']
+
+
+def _worker(prefix, mmap, results, done):
+    before = np.array(_memory())
+    embeddings = Embeddings.from_file_path(prefix, mmap=mmap)
+    embeddings.array.sum()  # read every row
+    results.put(np.array(_memory()) - before)
+    # stay alive until every worker has measured, so that they map the file at the same time
+    done.wait()
+
+
+def _run_workers(prefix, mmap):
+    results, done = Queue(), Event()
+    workers = [Process(target=_worker, args=(prefix, mmap, results, done)) for _ in range(N_WORKERS)]
+    for w in workers:
+        w.start()
+    added = [results.get() for _ in workers]
+    done.set()
+    for w in workers:
+        w.join()
+    return np.array(added)
+
+
+class TestMmapBenchmark(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.prefix = os.path.join(self.dir, 'emb')
+        vocab = CompactVocab('unk')
+        vocab.update('w{}'.format(i) for i in range(N_WORDS - 1))
+        self.array = np.random.RandomState(0).randn(N_WORDS, N_DIM).astype(np.float32)
+        Embeddings(self.array, vocab).to_file_path(self.prefix)
+        Embeddings.from_file_path(self.prefix, mmap=True)  # write the mapped vocab
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_workers(self):
+        print('\nmemory added per worker, {} workers, {:.0f}MB matrix:'.format(N_WORKERS, self.array.nbytes / 1e6))
+        print('  {:<12} {:>10} {:>10} {:>14}'.format('', 'RSS MB', 'PSS MB', 'anonymous MB'))
+        added = {}
+        for mmap in (False, True):
+            added[mmap] = _run_workers(self.prefix, mmap)
+            rss, pss, anonymous = added[mmap].mean(axis=0) / 1e6
+            print('  {:<12} {:>10.1f} {:>10.1f} {:>14.1f}'.format('mmap=' + str(mmap), rss, pss, anonymous))
+
+        self.assertGreater(added[False][:, 2].min(), self.array.nbytes)
+        self.assertLess(added[True][:, 2].max(), self.array.nbytes / 100)
+        # the pages of the file are split between the workers
+        self.assertLess(added[True][:, 1].max(), 1.5 * self.array.nbytes / N_WORKERS)
@@ -0,0 +1,71 @@
+"""
+Memory and accuracy benchmark of the quantized storage modes of `Embeddings` against float32.
+
+The vectors are drawn around random centers, so that they are clustered like word embeddings. For every mode, it
+reports the memory of the matrix, the recall of the top 10 inner products, the error of those products and of
+the cosine similarities of random pairs (see `quantization_report`), and the time of a single-query `k_nearest`.
+
+Run with `py.test -s test/slow_tests/ml/test_quantization_benchmark.py` to see the numbers.
+"""
+import time
+from unittest import TestCase
+
+import numpy as np
+
+from stanza.ml.embeddings import Embeddings
+from stanza.ml.quantization import quantization_report
+from stanza.text.vocab import CompactVocab
+
+N_WORDS = 200000
+N_DIM = 300
+N_CENTERS = 2000
+N_QUERIES = 200
+K = 10
+
+
+def _embeddings(rng):
+    centers = rng.randn(N_CENTERS, N_DIM).astype(np.float32)
+    array = centers[rng.randint(N_CENTERS, size=N_WORDS)] + rng.randn(N_WORDS, N_DIM).astype(np.float32)
+    vocab = CompactVocab('unk')
+    vocab.update('w{}'.format(i) for i in range(N_WORDS - 1))
+    return Embeddings(array, vocab)
+
+
+def _search_time(embeddings, queries):
+    start = time.time()
+    for query in queries:
+        embeddings.k_nearest(query, K)
+    return (time.time() - start) / len(queries)
+
+
+class TestQuantizationBenchmark(TestCase):
+
+    def test_report(self):
+        rng = np.random.RandomState(0)
+        embeddings = _embeddings(rng)
+        queries = embeddings.array[rng.choice(N_WORDS, N_QUERIES, replace=False)]
+        queries = queries + 0.1 * rng.randn(*queries.shape).astype(np.float32)
+
+        print('\n{} words of dimension {}, {} queries:'.format(N_WORDS, N_DIM, N_QUERIES))
+        print('  {:<14} {:>8} {:>6} {:>10} {:>10} {:>12} {:>10}'.format(
+            'mode', 'MB', 'ratio', 'recall@{}'.format(K), 'dot err', 'cosine err', 'ms/query'))
+        print('  {:<14} {:>8.1f} {:>6.1f} {:>10.3f} {:>10.4f} {:>12.4f} {:>10.1f}'.format(
+            'float32', embeddings.array.nbytes / 1e6, 1, 1, 0, 0, 1000 * _search_time(embeddings, queries[:20])))
+
+        reports = {}
+        for mode, kwargs in [('float16', {}), ('int8', {}), ('pq', {'n_subspaces': 150}), ('pq', {})]:
+            start = time.time()
+            quantized = embeddings.quantize(mode, **kwargs)
+            encode_time = time.time() - start
+            report = quantization_report(embeddings.array, quantized.array, queries, k=K)
+            name = '{}{}'.format(mode, '/{}'.format(kwargs['n_subspaces']) if kwargs else '')
+            print('  {:<14} {:>8.1f} {:>6.1f} {:>10.3f} {:>10.4f} {:>12.4f} {:>10.1f}   (encoded in {:.1f}s)'.format(
+                name, quantized.array.nbytes / 1e6, report['compression'], report['recall'], report['dot_error'],
+                report['cosine_error'], 1000 * _search_time(quantized, queries[:20]), encode_time))
+            reports[name] = report
+
+        self.assertEqual(reports['float16']['compression'], 2)
+        self.assertGreater(reports['float16']['recall'], 0.99)
+        self.assertGreater(reports['int8']['compression'], 3.9)
+        self.assertGreater(reports['int8']['recall'], 0.9)
+        self.assertGreater(reports['pq']['compression'], 15)
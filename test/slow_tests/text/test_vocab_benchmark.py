@@ -0,0 +1,72 @@
+"""
+Memory and speed benchmark of `Vocab` against `CompactVocab` for a 2M-word vocabulary.
+
+Run with `py.test -s test/slow_tests/text/test_vocab_benchmark.py` to see the numbers.
+"""
+import os
+import time
+from multiprocessing import Pool
+from unittest import TestCase
+
+from stanza.text.vocab import Vocab, CompactVocab
+
+N_WORDS = 2000000
+N_INTERLEAVED = 20000
+
+
+def _rss():
+    """Resident set size of this process, in bytes (Linux only)."""
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def _build(vocab_cls):
+    """Build a vocab of N_WORDS words, returning (seconds, bytes of memory used)."""
+    words = ['w{}'.format(i) for i in range(N_WORDS)]
+    before = _rss()
+    start = time.time()
+    v = vocab_cls('unk')
+    v.update(words)
+    elapsed = time.time() - start
+    used = _rss() - before
+    assert len(v) == N_WORDS + 1
+    return elapsed, used
+
+
+def _interleave(vocab_cls):
+    """Alternate add and index2word, returning seconds taken."""
+    v = vocab_cls('unk')
+    start = time.time()
+    for i in range(N_INTERLEAVED):
+        idx = v.add('w{}'.format(i))
+        assert v.index2word(idx) == 'w{}'.format(i)
+    return time.time() - start
+
+
+def _in_subprocess(fn, *args):
+    # a fresh process for every measurement, so that memory freed by one run doesn't hide the next
+    pool = Pool(1)
+    try:
+        return pool.apply(fn, args)
+    finally:
+        pool.terminate()
+
+
+class TestVocabBenchmark(TestCase):
+
+    def test_build(self):
+        vocab_time, vocab_mem = _in_subprocess(_build, Vocab)
+        compact_time, compact_mem = _in_subprocess(_build, CompactVocab)
+        print('\nupdate() with {} words:'.format(N_WORDS))
+        print('  Vocab:        {:.2f}s, {:.0f}MB'.format(vocab_time, vocab_mem / 1e6))
+        print('  CompactVocab: {:.2f}s, {:.0f}MB'.format(compact_time, compact_mem / 1e6))
+        self.assertLess(compact_mem, vocab_mem)
+        self.assertLess(compact_time, vocab_time)
+
+    def test_interleaved(self):
+        vocab_time = _in_subprocess(_interleave, Vocab)
+        compact_time = _in_subprocess(_interleave, CompactVocab)
+        print('\ninterleaved add()/index2word() with {} words:'.format(N_INTERLEAVED))
+        print('  Vocab:        {:.2f}s'.format(vocab_time))
+        print('  CompactVocab: {:.2f}s'.format(compact_time))
+        self.assertLess(compact_time, vocab_time)
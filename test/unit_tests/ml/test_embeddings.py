@@ -1,7 +1,14 @@
+from multiprocessing import Pool
+import os
+import pickle
+
 import pytest
 
+from stanza.ml.ann import IVFIndex, top_k
 from stanza.ml.embeddings import Embeddings
+from stanza.ml.quantization import QuantizedMatrix
 from stanza.text import Vocab
+from stanza.text.vocab import CompactVocab, HashedVocab, MappedVocab
 import numpy as np
 from numpy.testing import assert_approx_equal
 
@@ -51,6 +58,73 @@ def test_inner_products(embeddings):
     assert knn == [('show', 58), ('a', 40), ('what', 22)]
 
 
+@pytest.mark.parametrize('chunk_size', [None, 3])
+def test_k_nearest_batch(chunk_size):
+    rng = np.random.RandomState(0)
+    v = Vocab('unk')
+    v.update(str(i) for i in range(99))
+    emb = Embeddings(rng.randn(100, 8), v)
+    queries = rng.randn(10, 8)
+
+    ids, scores = emb.k_nearest_batch(queries, 5, chunk_size=chunk_size)
+    assert ids.shape == scores.shape == (10, 5)
+    all_scores = queries.dot(emb.array.T)
+    assert np.array_equal(ids, np.argsort(-all_scores, axis=1)[:, :5])
+    assert np.allclose(scores, np.sort(all_scores, axis=1)[:, ::-1][:, :5])
+
+    ids, scores = emb.k_nearest_batch(queries[:2], 200)
+    assert ids.shape == (2, 100)
+    assert np.all(np.diff(scores, axis=1) <= 0)
+
+
+def test_cosine(embeddings, tmpdir):
+    query = np.array([3, 2, 1])
+    knn = embeddings.k_nearest(query, 3, metric='cosine')
+    correct = [('show', 0.89199106528525429), ('a', 0.87579576196887721), ('what', 0.83152184062029977)]
+    assert [w for w, _ in knn] == [w for w, _ in correct]
+    for (_, s1), (_, s2) in zip(knn, correct):
+        assert_approx_equal(s1, s2, significant=6)
+
+    normalized = embeddings.normalized_array()
+    assert normalized.dtype == np.float32
+    assert np.allclose(np.linalg.norm(normalized, axis=1), 1)
+    assert embeddings.normalized_array() is normalized
+
+    with pytest.raises(ValueError):
+        embeddings.k_nearest(query, 3, metric='euclidean')
+
+    path = str(tmpdir.join('normalized.npy'))
+    emb = Embeddings(np.vstack([np.zeros(3), embeddings.array[1:]]), embeddings.vocab)
+    mapped = emb.normalized_array(mmap_path=path)
+    assert isinstance(mapped, np.memmap)
+    assert mapped[0].tolist() == [0, 0, 0]
+    assert np.allclose(mapped[1:], normalized[1:])
+    # the file is reused
+    mtime = os.path.getmtime(path)
+    emb = Embeddings(emb.array, emb.vocab)
+    assert np.array_equal(emb.normalized_array(mmap_path=path), mapped)
+    assert os.path.getmtime(path) == mtime
+
+    # but not for another matrix of the same shape
+    expected = np.array(mapped[::-1])
+    emb = Embeddings(emb.array[::-1].copy(), emb.vocab)
+    assert np.allclose(emb.normalized_array(mmap_path=path), expected)
+
+
+def test_pairwise_similarity(embeddings):
+    sims = embeddings.pairwise_similarity(['what', 'a'], other_words=['show', 'unk', 'a'], chunk_size=1)
+    assert sims.shape == (2, 3)
+    assert sims.dtype == np.float32
+    normalized = embeddings.normalized_array()
+    assert np.allclose(sims, normalized[[1, 2]].dot(normalized[[3, 0, 2]].T))
+    assert_approx_equal(sims[1, 2], 1, significant=6)
+
+    other = embeddings.subset(['show'])
+    dots = embeddings.pairwise_similarity(other=other, metric='dot')
+    assert dots.shape == (4, 2)
+    assert dots[3, 1] == 9 * 9 + 10 * 10 + 11 * 11
+
+
 def test_k_nearest_approx(embeddings):
     # Code for calculating the correct cosine similarities.
     # for i in range(len(array)):
@@ -65,6 +139,304 @@ def test_k_nearest_approx(embeddings):
         assert_approx_equal(s1, s2)
 
 
+@pytest.fixture
+def random_embeddings():
+    rng = np.random.RandomState(0)
+    vocab = Vocab('unk')
+    vocab.update('w{}'.format(i) for i in range(1999))
+    return Embeddings(rng.randn(2000, 16), vocab)
+
+
+def test_ann_index(random_embeddings):
+    index = random_embeddings.build_ann_index(n_lists=20, n_probe=4)
+    assert index.offsets[-1] == 2000
+    assert sorted(index.ids.tolist()) == list(range(2000))
+
+    queries = np.random.RandomState(1).randn(50, 16)
+    exact_ids, exact_scores = random_embeddings.k_nearest_batch(queries, 10, metric='cosine')
+    # searching every list is exact
+    ids, scores = random_embeddings.k_nearest_approx_batch(queries, 10, n_probe=20)
+    assert (ids == exact_ids).all()
+    assert np.allclose(scores, exact_scores)
+
+    recalls = []
+    for n_probe in (1, 4, 10):
+        ids, _ = random_embeddings.k_nearest_approx_batch(queries, 10, n_probe=n_probe)
+        recalls.append(np.mean([len(set(a) & set(b)) / 10. for a, b in zip(ids, exact_ids)]))
+    assert recalls[0] <= recalls[1] <= recalls[2]
+    assert recalls[2] > 0.8
+
+
+def test_ann_index_file_path(random_embeddings, tmpdir):
+    prefix = str(tmpdir.join('emb'))
+    random_embeddings.build_ann_index(n_lists=20, n_probe=3)
+    random_embeddings.to_file_path(prefix)
+    assert tmpdir.join('emb.ann.npz').check()
+
+    loaded = Embeddings.from_file_path(prefix)
+    assert loaded.ann_index.n_lists == 20 and loaded.ann_index.n_probe == 3
+    assert (loaded.ann_index.centroids == random_embeddings.ann_index.centroids).all()
+    query = np.arange(16)
+    assert loaded.k_nearest_approx(query, 5) == random_embeddings.k_nearest_approx(query, 5)
+
+    # saving embeddings without an index removes the old one
+    random_embeddings.subset(['w1', 'w2']).to_file_path(prefix)
+    assert not tmpdir.join('emb.ann.npz').check()
+    loaded = Embeddings.from_file_path(prefix)
+    assert loaded.ann_index is None
+    assert [w for w, _ in loaded.k_nearest_approx(query, 2)] == [w for w, _ in loaded.k_nearest(query, 2, 'cosine')]
+
+
+def test_top_k():
+    scores = np.array([[0.1, 0.9, 0.5, 0.7], [3., 1., 2., 0.]])
+    columns, values = top_k(scores, 2)
+    assert columns.tolist() == [[1, 3], [0, 2]]
+    assert values.tolist() == [[0.9, 0.7], [3., 2.]]
+    columns, _ = top_k(scores, 4)
+    assert columns.tolist() == [[1, 3, 2, 0], [0, 2, 1, 3]]
+
+
+def test_ann_index_mismatch(random_embeddings, tmpdir):
+    path = str(tmpdir.join('index.ann.npz'))
+    random_embeddings.build_ann_index(n_lists=20).save(path)
+    with pytest.raises(ValueError):
+        IVFIndex.load(path, n_vectors=3)
+    index = IVFIndex.load(path, n_vectors=2000)
+    with pytest.raises(ValueError):
+        index.search(np.ones((3, 16)), np.ones((1, 16)), 2)
+
+
+@pytest.mark.parametrize('mode', ['float16', 'int8', 'pq'])
+def test_quantize(random_embeddings, mode, tmpdir):
+    quantized = random_embeddings.quantize(mode)
+    assert quantized.vocab is random_embeddings.vocab
+    assert quantized['w3'].dtype == np.float32
+    assert quantized.array.nbytes < random_embeddings.array.nbytes
+
+    query = random_embeddings['w3']
+    words = [w for w, _ in quantized.k_nearest(query, 5, metric='cosine')]
+    assert words[0] == 'w3'
+    assert len(quantized.inner_products(query)) == 2000
+    assert quantized.subset(['w1', 'w2']).array.shape == (3, 16)
+    assert quantized.pairwise_similarity(['w1'], metric='dot').shape == (1, 2000)
+
+    # the cosine metric and the index use the quantized matrix, rescaled to unit norms
+    normalized = quantized.normalized_array()
+    assert isinstance(normalized, QuantizedMatrix)
+    assert normalized.codes is quantized.array.codes
+    assert normalized.nbytes < random_embeddings.array.nbytes
+    assert np.allclose(np.linalg.norm(normalized[:10], axis=1), 1, atol=1e-5)
+    quantized.build_ann_index(n_lists=16, n_probe=16)
+    assert quantized.k_nearest_approx(query, 5)[0][0] == 'w3'
+
+    prefix = str(tmpdir.join('emb'))
+    quantized.to_file_path(prefix)
+    loaded = Embeddings.from_file_path(prefix)
+    assert type(loaded.array) is type(quantized.array)
+    assert (loaded.array[:] == quantized.array[:]).all()
+    assert loaded.k_nearest(query, 5) == quantized.k_nearest(query, 5)
+
+    # writing a float32 matrix to the same prefix replaces the quantized one
+    random_embeddings.to_file_path(prefix)
+    assert not tmpdir.join('emb.quant.npz').check()
+    assert np.allclose(Embeddings.from_file_path(prefix).array, random_embeddings.array)
+
+
+def test_from_file_path_mmap(random_embeddings, tmpdir, monkeypatch):
+    prefix = str(tmpdir.join('emb'))
+    random_embeddings.to_file_path(prefix)
+    mapped = Embeddings.from_file_path(prefix, mmap=True)
+    assert isinstance(mapped.array, np.memmap)
+    assert not mapped.array.flags.writeable
+    assert isinstance(mapped.vocab, MappedVocab)
+    assert tmpdir.join('emb.vocab.bin').check()
+    assert mapped['w3'].tolist() == random_embeddings['w3'].tolist()
+    query = np.arange(16)
+    assert mapped.k_nearest(query, 5) == random_embeddings.k_nearest(query, 5)
+
+    # pickled as its paths
+    data = pickle.dumps(mapped, protocol=2)
+    assert len(data) < 1000
+    unpickled = pickle.loads(data)
+    assert isinstance(unpickled.array, np.memmap)
+    assert unpickled.k_nearest(query, 5) == mapped.k_nearest(query, 5)
+
+    # and so are its normalized matrix and its index
+    random_embeddings.build_ann_index(n_lists=20)
+    random_embeddings.to_file_path(prefix)
+    mapped = Embeddings.from_file_path(prefix, mmap=True)
+    mapped.normalized_array(mmap_path=str(tmpdir.join('normalized.npy')))
+    data = pickle.dumps(mapped, protocol=2)
+    assert len(data) < 1000
+    unpickled = pickle.loads(data)
+    assert isinstance(unpickled._normalized, np.memmap)
+    assert (unpickled.ann_index.ids == random_embeddings.ann_index.ids).all()
+    assert unpickled.k_nearest_approx(query, 5) == mapped.k_nearest_approx(query, 5)
+
+    # mapped embeddings can be subset and saved, even to the files they map
+    sub = mapped.subset(['w5', 'unk', 'w1', 'missing'])
+    assert list(sub.vocab) == ['unk', 'w5', 'w1']
+    assert sub['w1'].tolist() == random_embeddings['w1'].tolist()
+    mapped.to_file_path(str(tmpdir.join('copy')))
+    copied = Embeddings.from_file_path(str(tmpdir.join('copy')))
+    assert list(copied.vocab) == list(random_embeddings.vocab)
+    assert (copied.array == random_embeddings.array).all()
+    assert copied.vocab.count('w3') == random_embeddings.vocab.count('w3')
+    mapped.to_file_path(prefix)
+    assert mapped['w3'].tolist() == random_embeddings['w3'].tolist()
+    assert (Embeddings.from_file_path(prefix).array == random_embeddings.array).all()
+    assert not [p for p in tmpdir.listdir() if p.ext == '.tmp']
+
+    # a failed write leaves the old files as they were
+    def fail(self, f):
+        raise IOError('disk full')
+    monkeypatch.setattr(MappedVocab, 'to_file', fail)
+    with pytest.raises(IOError):
+        mapped.to_file_path(prefix)
+    assert (Embeddings.from_file_path(prefix).array == random_embeddings.array).all()
+    assert not [p for p in tmpdir.listdir() if p.ext == '.tmp']
+    monkeypatch.undo()
+
+    # the mapped vocab is written again when the vocab changes
+    random_embeddings.subset(['w5', 'w1']).quantize('int8').to_file_path(prefix)
+    mapped = Embeddings.from_file_path(prefix, mmap=True)
+    assert list(mapped.vocab) == ['unk', 'w5', 'w1']
+    assert isinstance(mapped.array.codes, np.memmap)
+    assert np.allclose(mapped['w1'], random_embeddings['w1'], atol=0.05)
+
+
+def _anonymous_memory():
+    """The anonymous memory of this process, in bytes: memory that is not backed by a file. Reading a memory-mapped
+    file adds pages of the page cache, which are shared by every process that maps the file, instead."""
+    total = 0
+    with open('/proc/self/smaps') as f:
+        for line in f:
+            if line.startswith('Anonymous:'):
+                total += int(line.split()[1]) * 1024
+    return total
+
+
+def _load_in_worker(args):
+    prefix, mmap = args
+    before = _anonymous_memory()
+    embeddings = Embeddings.from_file_path(prefix, mmap=mmap)
+    embeddings.array.sum()  # read every row
+    return _anonymous_memory() - before
+
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/smaps'), reason='needs /proc/self/smaps')
+@pytest.mark.parametrize('mmap', [False, True])
+def test_mmap_memory_per_worker(mmap, tmpdir):
+    # RSS also counts the pages of the file that a worker reads, although the page cache holds them once for all
+    # workers; what every worker adds is its anonymous memory
+    vocab = Vocab('unk')
+    vocab.update('w{}'.format(i) for i in range(3999))
+    embeddings = Embeddings(np.ones((4000, 2500), dtype=np.float32), vocab)
+    prefix = str(tmpdir.join('emb'))
+    embeddings.to_file_path(prefix)
+    Embeddings.from_file_path(prefix, mmap=True)  # write the mapped vocab
+
+    pool = Pool(2)
+    try:
+        added = pool.map(_load_in_worker, [(prefix, mmap)] * 2, chunksize=1)
+    finally:
+        pool.terminate()
+    for worker_added in added:
+        if mmap:
+            assert worker_added < embeddings.array.nbytes / 10
+        else:
+            assert worker_added > embeddings.array.nbytes
+
+
 def test_subset(embeddings):
     sub = embeddings.subset(['a', 'what'])
     assert sub.to_dict() == {'a': [6, 7, 8], 'unk': [0, 1, 2], 'what': [3, 4, 5]}
+    assert sub.array.tolist() == [[0, 1, 2], [6, 7, 8], [3, 4, 5]]
+
+
+def test_hashed_vocab(embeddings, tmpdir):
+    v = HashedVocab(4, front=embeddings.vocab)
+    array = np.concatenate([embeddings.array, 10 + np.arange(12).reshape(4, 3)])
+    emb = Embeddings(array, v)
+    assert emb['what'].tolist() == [3, 4, 5]
+    unseen = emb['unseen'].tolist()
+    assert unseen == array[v.bucket('unseen')].tolist()
+    assert len(emb) == 8
+
+    d = emb.to_dict()
+    assert len(d) == 8
+    assert d['what'] == [3, 4, 5]
+    assert d[HashedVocab.BUCKET_FORMAT.format(0)] == [10, 11, 12]
+
+    # the front vocab is subset, and every bucket is kept
+    sub = emb.subset(['show', 'what'])
+    assert isinstance(sub.vocab, HashedVocab)
+    assert len(sub) == 7
+    assert sub['show'].tolist() == emb['show'].tolist()
+    assert sub['a'].tolist() == array[sub.vocab.bucket('a') + 1].tolist()
+    assert sub['unseen'].tolist() == unseen
+
+    prefix = str(tmpdir.join('hashed'))
+    emb.vocab.update(['unseen', 'what'])
+    emb.to_file_path(prefix)
+    loaded = Embeddings.from_file_path(prefix, vocab_cls=HashedVocab)
+    assert list(loaded.vocab) == list(emb.vocab)
+    assert loaded['unseen'].tolist() == unseen
+    assert loaded.vocab.count('unseen') == 1
+    assert loaded.vocab.count('what') == 1
+    with pytest.raises(ValueError):
+        Embeddings.from_file_path(prefix, mmap=True, vocab_cls=HashedVocab)
+
+
+@pytest.fixture
+def vectors():
+    rng = np.random.RandomState(0)
+    words = [u'the', u'caf\xe9', u'</s>', u'cat', u'the']
+    return words, rng.uniform(-1, 1, size=(len(words), 3)).astype(np.float32)
+
+
+@pytest.mark.parametrize('newlines', [True, False])
+def test_from_word2vec_binary(vectors, tmpdir, newlines):
+    words, array = vectors
+    path = str(tmpdir.join('vectors.bin'))
+    with open(path, 'wb') as f:
+        f.write(b'5 3\n')
+        for w, v in zip(words, array):
+            f.write(w.encode('utf-8') + b' ' + v.astype('<f4').tobytes() + (b'\n' if newlines else b''))
+
+    emb = Embeddings.from_word2vec_binary(path, unk=u'</s>')
+    assert list(emb.vocab) == [u'</s>', u'the', u'caf\xe9', u'cat']
+    assert emb.array.dtype == np.float32
+    assert np.array_equal(emb.array, array[[2, 0, 1, 3]])
+
+    emb = Embeddings.from_word2vec_binary(path, words={u'cat', u'caf\xe9'}, vocab_cls=CompactVocab)
+    assert list(emb.vocab) == [u'***UNK***', u'caf\xe9', u'cat']
+    assert np.array_equal(emb.array, np.concatenate([np.zeros((1, 3)), array[[1, 3]]]))
+
+    emb = Embeddings.from_word2vec_binary(path, limit=2)
+    assert list(emb.vocab) == [u'***UNK***', u'the', u'caf\xe9']
+
+
+def test_from_word2vec_binary_truncated(vectors, tmpdir):
+    path = str(tmpdir.join('vectors.bin'))
+    with open(path, 'wb') as f:
+        f.write(b'2 3\nthe ' + vectors[1][0].tobytes() + b'\ncat ' + vectors[1][1].tobytes()[:5])
+    with pytest.raises(ValueError):
+        Embeddings.from_word2vec_binary(path)
+
+
+def test_from_vec_text(vectors, tmpdir):
+    words, array = vectors
+    path = str(tmpdir.join('vectors.vec'))
+    with open(path, 'wb') as f:
+        f.write(b'5 3\n')
+        for w, v in zip(words, array):
+            f.write(u'{} {}\n'.format(w, ' '.join(repr(float(x)) for x in v)).encode('utf-8'))
+
+    emb = Embeddings.from_vec_text(path, unk=u'</s>', chunk_size=2)
+    assert list(emb.vocab) == [u'</s>', u'the', u'caf\xe9', u'cat']
+    assert np.allclose(emb.array, array[[2, 0, 1, 3]])
+
+    emb = Embeddings.from_vec_text(path, words={u'caf\xe9'}, limit=3)
+    assert list(emb.vocab) == [u'***UNK***', u'caf\xe9']
+    assert np.allclose(emb[u'caf\xe9'], array[1])
@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+
+from stanza.ml.quantization import QuantizedMatrix, Float16Matrix, Int8Matrix, PQMatrix, load_quantized, quantization_report, \
+    quantize
+
+
+@pytest.fixture
+def array():
+    rng = np.random.RandomState(0)
+    centers = rng.randn(20, 12)
+    return (centers[rng.randint(20, size=1000)] + 0.1 * rng.randn(1000, 12)).astype(np.float32)
+
+
+@pytest.mark.parametrize('mode,cls,tolerance', [
+    ('float16', Float16Matrix, 1e-2),
+    ('int8', Int8Matrix, 5e-2),
+    ('pq', PQMatrix, 0.5),
+])
+def test_quantize(array, mode, cls, tolerance):
+    q = quantize(array, mode, chunk_size=300)
+    assert isinstance(q, cls)
+    assert q.shape == array.shape
+    assert len(q) == len(array)
+    assert q.nbytes < array.nbytes
+
+    assert q[5].dtype == np.float32
+    assert q[5].shape == (12,)
+    assert q[10:20].shape == (10, 12)
+    assert np.allclose(q[[3, 1]], q[3:0:-2])
+    assert np.abs(q[:] - array).max() < tolerance
+
+    vec = np.arange(12, dtype=np.float32)
+    assert np.allclose(q.dot(vec), q[:].dot(vec), atol=1e-4)
+    queries = np.ones((12, 20))
+    assert np.allclose(q.dot(queries), q[:].dot(queries), atol=1e-4)
+    assert np.allclose(q.take([7, 2])[:], q[[7, 2]])
+
+    normalized = q.normalized()
+    assert type(normalized) is cls
+    assert normalized.codes is q.codes
+    assert np.allclose(np.linalg.norm(normalized[:], axis=1), 1, atol=1e-5)
+    assert np.allclose(normalized[:], q[:] / np.linalg.norm(q[:], axis=1)[:, np.newaxis], atol=1e-5)
+    assert np.allclose(normalized.dot(vec), normalized[:].dot(vec), atol=1e-4)
+    assert np.allclose(normalized.take([7, 2])[:], normalized[[7, 2]])
+    assert normalized[5].shape == (12,)
+
+
+def test_int8():
+    q = Int8Matrix.encode(np.array([[1., -2., 0.5], [0., 0., 0.]]))
+    assert q.codes.tolist() == [[64, -127, 32], [0, 0, 0]]
+    assert np.allclose(q.scales, [2. / 127, 1])
+    assert q[1].tolist() == [0, 0, 0]
+
+
+def test_pq_subspaces(array):
+    q = PQMatrix.encode(array, n_subspaces=5)
+    assert q.codes.shape == (1000, 5)
+    assert q.codes.dtype == np.uint8
+    assert q.bounds.tolist() == [0, 2, 4, 7, 9, 12]
+    # 20 clusters fit in 256 centroids per subspace
+    assert np.abs(q[:] - array).max() < 0.5
+
+
+def test_abstract():
+    class Incomplete(QuantizedMatrix):
+        def _with(self, codes, scales):
+            return Incomplete(codes, self.n_dim, scales)
+
+    codes = np.zeros((2, 3), dtype=np.int8)
+    with pytest.raises(TypeError):
+        QuantizedMatrix(codes, 3)
+    with pytest.raises(TypeError):
+        Incomplete(codes, 3)
+
+
+def test_bad_mode(array):
+    with pytest.raises(ValueError):
+        quantize(array, 'int4')
+
+
+@pytest.mark.parametrize('mode', ['float16', 'int8', 'pq'])
+def test_save_load(array, mode, tmpdir):
+    q = quantize(array, mode)
+    codes_path, params_path = str(tmpdir.join('codes.npy')), str(tmpdir.join('params.npz'))
+    with open(codes_path, 'wb') as codes_file, open(params_path, 'wb') as params_file:
+        q.save(codes_file, params_file)
+    with open(params_path, 'rb') as params_file:
+        loaded = load_quantized(np.load(codes_path), params_file)
+    assert type(loaded) is type(q)
+    assert (loaded[:] == q[:]).all()
+
+    # the row scales of a normalized matrix are saved too
+    with open(codes_path, 'wb') as codes_file, open(params_path, 'wb') as params_file:
+        q.normalized().save(codes_file, params_file)
+    assert (load_quantized(np.load(codes_path), params_path)[:] == q.normalized()[:]).all()
+
+
+def test_quantization_report(array):
+    queries = array[:50] + 0.01
+    exact = quantization_report(array, Float16Matrix.encode(array), queries)
+    assert exact['compression'] == 2
+    assert exact['recall'] > 0.95
+    assert exact['dot_error'] < 1e-3
+    assert exact['cosine_error'] < 1e-3
+
+    report = quantization_report(array, PQMatrix.encode(array, n_subspaces=3), queries)
+    assert report['compression'] > 2
+    assert 0 <= report['recall'] <= 1
@@ -0,0 +1,86 @@
+# pylint: disable=no-self-use, redefined-outer-name
+
+import os
+
+import pytest
+
+from stanza.nlp.annotate import AnnotationJob, read_documents, write_documents
+from stanza.nlp.tokenizer import RegexTokenizer
+
+
+class FakeClient(RegexTokenizer):
+    """Stands in for CoreNLPClient; fails on documents containing 'CRASH'."""
+
+    def annotate_proto(self, text, annotators=None, properties=None):
+        if u'CRASH' in text:
+            raise RuntimeError('preempted')
+        return super(FakeClient, self).annotate_proto(text)
+
+
+@pytest.fixture
+def doc_paths(tmpdir):
+    paths = []
+    for i in range(5):
+        path = str(tmpdir.join('doc{}.txt'.format(i)))
+        with open(path, 'w') as f:
+            f.write('Document number {}. Second sentence.'.format(i))
+        paths.append(path)
+    return paths
+
+
+def annotated_paths(output_dir):
+    paths = []
+    for name in sorted(os.listdir(output_dir)):
+        if name.endswith('.pb'):
+            paths.extend(doc_pb.docID for doc_pb in read_documents(os.path.join(output_dir, name)))
+    return paths
+
+
+def test_write_read(tmpdir):
+    docs = [RegexTokenizer().annotate_proto(u'One. Two.'), RegexTokenizer().annotate_proto(u'Three.')]
+    path = str(tmpdir.join('docs.pb'))
+    write_documents(path, docs)
+    assert list(read_documents(path)) == docs
+
+
+def test_resume(tmpdir, doc_paths):
+    output_dir = str(tmpdir.join('out'))
+    with open(doc_paths[3], 'w') as f:
+        f.write('CRASH')
+    job = AnnotationJob(doc_paths, output_dir, FakeClient, ['tokenize', 'ssplit'], shard_size=2)
+    with pytest.raises(RuntimeError):
+        job.run()
+    assert job.completed_shards() == {'shard-00000'}
+    assert annotated_paths(output_dir) == doc_paths[:2]
+
+    with open(doc_paths[3], 'w') as f:
+        f.write('Fixed.')
+    assert job.run() == 2
+    assert job.completed_shards() == {'shard-00000', 'shard-00001', 'shard-00002'}
+    assert annotated_paths(output_dir) == doc_paths
+    assert job.run() == 0
+
+
+def test_resume_other_job(tmpdir, doc_paths):
+    output_dir = str(tmpdir.join('out'))
+    assert AnnotationJob(doc_paths, output_dir, FakeClient, shard_size=2).run() == 3
+    # shards are identified by position, so they can't be reused with another shard size or manifest
+    with pytest.raises(ValueError):
+        AnnotationJob(doc_paths, output_dir, FakeClient, shard_size=3).run()
+    with pytest.raises(ValueError):
+        AnnotationJob(doc_paths[1:], output_dir, FakeClient, shard_size=2).run()
+    assert annotated_paths(output_dir) == doc_paths
+    assert AnnotationJob(list(doc_paths), output_dir, FakeClient, shard_size=2).run() == 0
+
+    os.remove(os.path.join(output_dir, AnnotationJob.JOB_FILE))
+    with pytest.raises(ValueError):
+        AnnotationJob(doc_paths, output_dir, FakeClient, shard_size=2).run()
+
+
+def test_workers(tmpdir, doc_paths):
+    output_dir = str(tmpdir.join('out'))
+    job = AnnotationJob(doc_paths, output_dir, FakeClient, shard_size=1, workers=2)
+    assert job.run() == 5
+    assert annotated_paths(output_dir) == doc_paths
+    doc_pb = next(read_documents(job.shard_path('shard-00004')))
+    assert len(doc_pb.sentence) == 2
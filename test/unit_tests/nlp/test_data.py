@@ -101,6 +101,20 @@ class TestAnnotatedSentence(object):
         assert len(sentence) == 5
         assert sentence[1].word == "is"
 
+    def test_from_tokens_whitespace(self):
+        text = " This  is a test. "
+        tokens = "This is a test .".split()
+        sentence = AnnotatedSentence.from_tokens(text, tokens)
+        assert sentence.before == " "
+        assert sentence.after == " "
+        assert sentence[1].before == "  "
+        assert sentence[3].character_span == (12, 16)
+        assert sentence[4].before == ""
+
+    def test_from_tokens_mismatch(self):
+        with pytest.raises(ValueError):
+            AnnotatedSentence.from_tokens("This is a test.", "This is the test .".split())
+
 class TestAnnotatedDocument(object):
     #def test_json_to_pb(self, json_dict):
     #    orig_text = 'Belgian swimmers beat the United States. Really?'
@@ -146,6 +160,23 @@ class TestAnnotatedDocument(object):
         assert document[0][1].word == "Hussein"
         assert document[0][1].ner == "PERSON"
 
+    def test_from_tokenized(self, json_dict):
+        texts = ["Belgian swimmers beat the United States.", "Really?"]
+        token_lists = ["Belgian swimmers beat the United States .".split(), "Really ?".split()]
+        doc = AnnotatedDocument.from_tokenized(texts, token_lists)
+        expected = AnnotatedDocument.from_json(json_dict)
+        assert doc.text == expected.text
+        for sent, expected_sent in zip(doc, expected):
+            assert sent.characterOffsetBegin == expected_sent.characterOffsetBegin
+            assert sent.tokenOffsetBegin == expected_sent.tokenOffsetBegin
+            assert sent.tokenOffsetEnd == expected_sent.tokenOffsetEnd
+            for tok, expected_tok in zip(sent, expected_sent):
+                assert tok.pb.word == expected_tok.pb.word
+                assert tok.character_span == expected_tok.character_span
+                assert (tok.before, tok.after) == (expected_tok.before, expected_tok.after)
+        assert doc[1].text == "Really?"
+        assert doc[1][0].character_span == (41, 47)
+
     def test_mentions(self, document_pb):
         document = AnnotatedDocument.from_pb(document_pb)
         mentions = document.mentions
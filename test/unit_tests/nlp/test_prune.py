@@ -0,0 +1,52 @@
+# pylint: disable=no-self-use, redefined-outer-name
+
+import pytest
+
+import stanza.nlp.CoreNLP_pb2 as proto
+
+from stanza.nlp.prune import prune
+from stanza.nlp.corenlp import AnnotatedDocument
+
+
+@pytest.fixture
+def document_pb():
+    doc = proto.Document()
+    with open("test/unit_tests/nlp/document.pb", "rb") as f:
+        doc.ParseFromString(f.read())
+    return doc
+
+
+def test_prune(document_pb):
+    size = document_pb.ByteSize()
+    saved = prune(document_pb, keep=['word', 'lemma', 'ner'])
+    assert saved > 0
+    assert document_pb.ByteSize() == size - saved
+
+    token = document_pb.sentence[0].token[1]
+    assert token.word == "Hussein"
+    assert token.ner == "PERSON"
+    assert not token.HasField('pos')
+    assert not document_pb.sentence[0].HasField('basicDependencies')
+    assert len(document_pb.corefChain) == 0
+
+    # required fields survive, so the document still round-trips.
+    doc = proto.Document()
+    doc.ParseFromString(document_pb.SerializeToString())
+    assert AnnotatedDocument.from_pb(doc)[0][1].word == "Hussein"
+
+
+def test_prune_dependencies(document_pb):
+    prune(document_pb, keep=['word', 'basicDependencies'])
+    sentence = document_pb.sentence[0]
+    assert sentence.HasField('basicDependencies')
+    assert not sentence.HasField('enhancedPlusPlusDependencies')
+
+
+def test_prune_defaults():
+    doc = proto.Document()
+    doc.text = ""
+    token = doc.sentence.add(tokenOffsetBegin=0, tokenOffsetEnd=1).token.add(word="a", pos="DT")
+    token.hasXmlContext = False
+    prune(doc, keep=['word', 'pos', 'hasXmlContext'])
+    assert token.HasField('pos')
+    assert not token.HasField('hasXmlContext')
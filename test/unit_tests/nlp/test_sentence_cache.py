@@ -0,0 +1,79 @@
+# pylint: disable=no-self-use, redefined-outer-name
+
+import shelve
+
+import pytest
+
+from stanza.nlp.sentence_cache import SentenceCachingClient
+from stanza.nlp.tokenizer import RegexTokenizer
+
+
+class FakeClient(object):
+    """Tags every token with its length, treating each line as a sentence, and records requests."""
+
+    default_annotators = ['tokenize', 'ssplit', 'pos']
+
+    def __init__(self):
+        self.requests = []
+        self.tokenizer = RegexTokenizer()
+
+    def annotate_proto(self, text, annotators=None, properties=None):
+        assert properties == {'ssplit.eolonly': 'true'}
+        self.requests.append(text)
+        doc_pb = self.tokenizer.annotate_proto(text)
+        for sentence_pb in doc_pb.sentence:
+            for token_pb in sentence_pb.token:
+                token_pb.pos = str(len(token_pb.word))
+                token_pb.tokenBeginIndex = sentence_pb.tokenOffsetBegin
+                token_pb.tokenEndIndex = sentence_pb.tokenOffsetBegin + 1
+        return doc_pb
+
+
+@pytest.fixture
+def client():
+    return SentenceCachingClient(FakeClient())
+
+
+def test_annotate(client):
+    text = u"Hello there. Terms apply. "
+    doc = client.annotate(text)
+    reference = RegexTokenizer().annotate(text)
+    assert doc.text == text
+    assert len(doc) == 2
+    for sent, ref_sent in zip(doc, reference):
+        assert sent.sentenceIndex == ref_sent.sentenceIndex
+        assert (sent.tokenOffsetBegin, sent.tokenOffsetEnd) == (ref_sent.tokenOffsetBegin, ref_sent.tokenOffsetEnd)
+        assert sent.character_span == ref_sent.character_span
+        for tok, ref_tok in zip(sent, ref_sent):
+            assert tok.character_span == ref_tok.character_span
+            assert (tok.before, tok.after) == (ref_tok.before, ref_tok.after)
+    assert doc[1].pos_tags == [u'5', u'5', u'1']
+
+
+def test_dedupe(client):
+    client.annotate(u"Hello there. Terms apply. Hello there.")
+    doc = client.annotate(u"Terms apply. Goodbye.")
+    assert client.client.requests == [u"Hello there.\nTerms apply.", u"Goodbye."]
+    assert (client.hits, client.misses) == (2, 3)
+    assert doc[1].character_span == (13, 21)
+    assert doc[1].tokenOffsetBegin == 3
+    assert doc[1][0].pb.tokenBeginIndex == 3
+
+
+def test_unsupported(client):
+    with pytest.raises(ValueError):
+        client.annotate(u"Hello.", annotators=['tokenize', 'ssplit', 'coref'])
+
+
+def test_shelve(tmpdir):
+    path = str(tmpdir.join('cache'))
+    cache = shelve.open(path)
+    client = SentenceCachingClient(FakeClient(), cache=cache)
+    client.annotate(u"Hello there. Caf\u00e9 closed.")
+    cache.close()
+
+    client = SentenceCachingClient(FakeClient(), cache=shelve.open(path))
+    doc = client.annotate(u"Caf\u00e9 closed.")
+    client.cache.close()
+    assert client.client.requests == []
+    assert doc[0].pos_tags == [u'4', u'6', u'1']
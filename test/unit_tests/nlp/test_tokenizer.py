@@ -0,0 +1,57 @@
+# pylint: disable=no-self-use, redefined-outer-name
+
+import pytest
+
+from stanza.nlp.tokenizer import RegexTokenizer
+
+
+@pytest.fixture
+def tokenizer():
+    return RegexTokenizer()
+
+
+def test_tokenize(tokenizer):
+    text = u"Mr. Smith didn't pay $3.50 for John's car in the U.S."
+    words = [text[b:e] for b, e in tokenizer.tokenize(text)]
+    assert words == [u'Mr.', u'Smith', u'did', u"n't", u'pay', u'$', u'3.50', u'for', u'John', u"'s", u'car',
+                     u'in', u'the', u'U.S.']
+
+
+def test_split_sentences(tokenizer):
+    text = u"Belgian swimmers beat the United States. Really?! (Yes.) They did\n\nNew paragraph"
+    sentences = [[text[b:e] for b, e in spans] for spans in tokenizer.split_sentences(text)]
+    assert sentences == [
+        u'Belgian swimmers beat the United States .'.split(),
+        u'Really ?!'.split(),
+        u'( Yes . )'.split(),
+        u'They did'.split(),
+        u'New paragraph'.split(),
+    ]
+
+
+def test_annotate(tokenizer):
+    text = u" Belgian swimmers beat the United States. Really? "
+    doc = tokenizer.annotate(text)
+    assert doc.text == text
+    assert len(doc) == 2
+    assert doc[0].before == u' '
+    assert doc[0].after == u' '
+    assert doc[1].after == u' '
+    assert doc[1].sentenceIndex == 1
+    assert (doc[1].tokenOffsetBegin, doc[1].tokenOffsetEnd) == (7, 9)
+    assert doc[1].character_span == (42, 49)
+    assert doc[0][6].character_span == (40, 41)
+    assert doc[0][6].before == u''
+
+
+def test_annotate_unsupported(tokenizer):
+    with pytest.raises(ValueError):
+        tokenizer.annotate_proto(u"Hello.", annotators=['tokenize', 'ssplit', 'pos'])
+
+
+def test_chunk(tokenizer):
+    text = u"One two. Three four. Five six seven eight nine. Ten."
+    chunks = tokenizer.chunk(text, 20)
+    assert chunks == [(0, u'One two. Three four.'), (21, u'Five six seven eight nine.'), (48, u'Ten.')]
+    for offset, chunk in chunks:
+        assert text[offset:offset + len(chunk)] == chunk
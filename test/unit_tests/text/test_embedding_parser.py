@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from stanza.text.embedding_parser import chunk_ranges, parse_embedding_file
+
+
+@pytest.fixture
+def vectors():
+    return np.random.RandomState(0).uniform(-1, 1, size=(50, 4)).astype(np.float32)
+
+
+def write_lines(path, lines):
+    with open(path, 'wb') as f:
+        f.write(u'\n'.join(lines).encode('utf-8'))
+
+
+def format_vector(v):
+    return u' '.join(u'{:.6f}'.format(x) for x in v)
+
+
+def test_chunk_ranges(tmpdir):
+    path = str(tmpdir.join('lines.txt'))
+    write_lines(path, [u'line {}'.format(i) for i in range(100)])
+    ranges = chunk_ranges(path, 30)
+    assert len(ranges) > 1
+    with open(path, 'rb') as f:
+        data = f.read()
+    assert b''.join(data[a:b] for a, b in ranges) == data
+    assert all(data[b - 1:b] == b'\n' for _, b in ranges[:-1])
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_parse(vectors, tmpdir, workers):
+    words = [u'w{}'.format(i) for i in range(len(vectors))]
+    words[3] = u'caf\xe9'
+    words[7] = u'. . .'  # words can contain spaces
+    path = str(tmpdir.join('emb.txt'))
+    write_lines(path, [u'{} {}'.format(w, format_vector(v)) for w, v in zip(words, vectors)] + [u''])
+    out_path = str(tmpdir.join('emb.npy'))
+
+    parsed = parse_embedding_file(path, out_path, 4, workers=workers, chunk_bytes=100)
+    assert parsed == words
+    assert np.allclose(np.load(out_path), vectors, atol=1e-6)
+    assert not tmpdir.join('emb.npy.tmp').check()
+
+
+def test_parse_no_words(vectors, tmpdir):
+    path = str(tmpdir.join('emb.vec'))
+    write_lines(path, [u'50 4'] + [format_vector(v) for v in vectors])
+    out_path = str(tmpdir.join('emb.npy'))
+    assert parse_embedding_file(path, out_path, 4, has_words=False, skip_header=True, workers=1,
+                                chunk_bytes=64) is None
+    assert np.allclose(np.load(out_path), vectors, atol=1e-6)
+
+
+def test_parse_bad(tmpdir):
+    path = str(tmpdir.join('emb.txt'))
+    write_lines(path, [u'a 1 2 3', u'b 1 2'])
+    with pytest.raises(ValueError):
+        parse_embedding_file(path, str(tmpdir.join('emb.npy')), 3, workers=1)
+    # nothing is left behind
+    assert tmpdir.listdir() == [tmpdir.join('emb.txt')]
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from stanza.text.sampler import UnigramSampler, _alias_table
+from stanza.text.vocab import Vocab, CompactVocab
+
+
+@pytest.mark.parametrize('probs', [[1.0], [0.5, 0.5], [0.1, 0.0, 0.6, 0.3], [0.7, 0.1, 0.1, 0.1]])
+def test_alias_table(probs):
+    accept, alias = _alias_table(probs)
+    # the probability of each outcome, summed over the columns that can produce it
+    n = len(probs)
+    recovered = np.zeros(n)
+    for j in range(n):
+        recovered[j] += accept[j] / n
+        recovered[alias[j]] += (1 - accept[j]) / n
+    assert np.allclose(recovered, probs)
+
+
+def test_sample_distribution():
+    counts = np.array([0, 1000, 100, 10, 0, 1])
+    sampler = UnigramSampler(counts, power=0.75, rng=np.random.RandomState(0))
+    expected = counts ** 0.75 / (counts ** 0.75).sum()
+    assert np.allclose(sampler.probs, expected)
+
+    samples = sampler.sample(200000)
+    assert samples.shape == (200000,)
+    freqs = np.bincount(samples, minlength=len(counts)) / 200000.
+    assert np.allclose(freqs, expected, atol=0.01)
+    assert freqs[0] == freqs[4] == 0
+
+    assert sampler.sample((3, 5)).shape == (3, 5)
+    assert isinstance(sampler.sample(), int)
+
+
+def test_sample_seeded():
+    counts = [0, 5, 3, 2]
+    a = UnigramSampler(counts, rng=np.random.RandomState(1)).sample(100)
+    b = UnigramSampler(counts, rng=np.random.RandomState(1)).sample(100)
+    assert np.array_equal(a, b)
+
+
+def test_no_counts():
+    with pytest.raises(ValueError):
+        UnigramSampler([0, 0])
+
+
+@pytest.mark.parametrize('vocab_cls', [Vocab, CompactVocab])
+def test_vocab_sampler(vocab_cls):
+    v = vocab_cls('unk')
+    v.update('a a a b'.split())
+    v.add('unk', count=10)
+
+    sampler = v.sampler(power=1, rng=np.random.RandomState(0))
+    assert np.allclose(sampler.probs, [0, 0.75, 0.25])
+    assert 0 not in sampler.sample(1000)
+
+    sampler = v.sampler(power=1, include_unk=True, rng=np.random.RandomState(0))
+    assert np.allclose(sampler.probs, [10 / 14., 3 / 14., 1 / 14.])
+
+
+def test_vocab_sampler_counts_not_truncated():
+    v = Vocab('unk')
+    v.add('a', count=0.5)
+    v.add('b', count=1.5)
+    assert np.allclose(v.sampler(power=1, rng=np.random.RandomState(0)).probs, [0, 0.25, 0.75])
+
+    v = Vocab('unk')
+    v.add('a', count=3 * 2 ** 63)
+    v.add('b', count=2 ** 63)
+    assert np.allclose(v.sampler(power=1, rng=np.random.RandomState(0)).probs, [0, 0.75, 0.25])
+
+
+def test_subsample_mask():
+    counts = np.array([0, 1000000, 10, 10])
+    sampler = UnigramSampler(counts, rng=np.random.RandomState(0))
+    keep = sampler.keep_probs(threshold=1e-3)
+    assert keep[0] == keep[2] == keep[3] == 1
+    assert 0 < keep[1] < 0.05
+    # computed once per threshold
+    assert sampler.keep_probs(threshold=1e-3) is keep
+    assert not keep.flags.writeable
+    assert sampler.keep_probs(threshold=1e-2) is not keep
+
+    batch = np.array([[1] * 1000 + [2, 3, 0, 0]])
+    mask = sampler.subsample_mask(batch, threshold=1e-3, pad_index=0)
+    assert mask.shape == batch.shape
+    assert mask[0, :1000].mean() < 0.1
+    assert mask[0, 1000:1002].all()
+    assert not mask[0, 1002:].any()
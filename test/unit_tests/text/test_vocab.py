@@ -2,9 +2,18 @@ import pytest
 
 __author__ = 'victor, kelvinguu'
 
-from collections import Counter
+from collections import Counter, OrderedDict
+
+import os
+import pickle
+import zipfile
+from io import BytesIO
+
+import numpy as np
 from unittest import TestCase
-from stanza.text.vocab import Vocab, SennaVocab, GloveVocab
+import stanza
+import stanza.text.vocab as vocab_module
+from stanza.text.vocab import Vocab, CompactVocab, MappedVocab, HashedVocab, SennaVocab, GloveVocab, invert_index_map
 
 
 # new tests are written in the lighter-weight pytest format
@@ -32,6 +41,86 @@ def test_subset(vocab):
     assert v._counts == Counter({'unk': 0, 'zero': 1, 'three': 3, 'two': 2})
 
 
+def test_encode_batch(vocab):
+    batch = [['one', 'two', 'three'], ['four'], []]
+    matrix, lengths = vocab.encode_batch(batch, pad_index=-1)
+    assert matrix.dtype == np.int32
+    assert matrix.tolist() == [[2, 3, 4], [0, -1, -1], [-1, -1, -1]]
+    assert lengths.tolist() == [3, 1, 0]
+
+    matrix, lengths = vocab.encode_batch(batch, max_len=2, pad_index=-1, pad_left=True, memo=True)
+    assert matrix.tolist() == [[2, 3], [-1, 0], [-1, -1]]
+    assert lengths.tolist() == [2, 1, 0]
+
+    matrix, _ = vocab.encode_batch(batch, max_len=2, pad_index=-1, truncate_left=True, dtype=np.int64)
+    assert matrix.dtype == np.int64
+    assert matrix.tolist() == [[3, 4], [0, -1], [-1, -1]]
+
+    matrix, lengths = vocab.freeze().encode_batch(batch, max_len=4, pad_index=-1)
+    assert matrix.shape == (3, 4)
+    assert matrix[0].tolist() == [2, 3, 4, -1]
+
+
+@pytest.mark.parametrize('vocab_cls', [Vocab, CompactVocab])
+def test_merge(vocab_cls):
+    a, b = vocab_cls('unk'), vocab_cls('unk')
+    a.update('x y y z'.split())
+    b.update('z z w'.split())
+    merged = vocab_cls.merge([a, b])
+    assert list(merged) == ['unk', 'z', 'y', 'w', 'x']
+    assert merged.count('z') == 3
+    assert list(vocab_cls.merge([b, a])) == list(merged)
+    with pytest.raises(ValueError):
+        vocab_cls.merge([a, vocab_cls('UNK')])
+    # vocabs of different classes can be merged
+    assert list(Vocab.merge([a, CompactVocab.merge([b])])) == list(merged)
+
+
+@pytest.mark.parametrize('vocab_cls', [Vocab, CompactVocab])
+def test_index_mapping(vocab_cls):
+    v = vocab_cls('unk')
+    v.update('zero one two two three three three'.split())
+    data = np.array([[1, 2, 3], [4, 0, 3]])
+    embeddings = np.arange(len(v))[:, np.newaxis] * np.ones(2)
+
+    sub, old_to_new = v.subset(['three', 'zero'], return_mapping=True)
+    assert old_to_new.tolist() == [0, 2, 0, 0, 1]
+    assert sub.indices2words(old_to_new[data[1]]) == ['three', 'unk', 'unk']
+    new_to_old = invert_index_map(old_to_new, len(sub))
+    assert new_to_old.tolist() == [0, 4, 1]
+    assert embeddings[new_to_old][:, 0].tolist() == [0, 4, 1]
+
+    pruned, old_to_new = v.prune_rares(2, return_mapping=True)
+    assert list(pruned) == ['unk', 'two', 'three']
+    assert old_to_new.tolist() == [0, 0, 0, 1, 2]
+
+    ordered, old_to_new = v.sort_by_decreasing_count(return_mapping=True)
+    assert list(ordered) == ['unk', 'three', 'two', 'zero', 'one']
+    assert old_to_new[data].tolist() == [[3, 4, 2], [1, 0, 2]]
+    assert ordered.indices2words(old_to_new[data[0]]) == v.indices2words(data[0])
+
+
+@pytest.mark.parametrize('vocab_cls', [Vocab, CompactVocab])
+@pytest.mark.parametrize('load_cls', [Vocab, CompactVocab])
+@pytest.mark.parametrize('words', ['zero one two two three three three', u'caf\xe9 na\xefve zero zero', u'a\0b c\0\0 d'])
+def test_binary_file(vocab_cls, load_cls, words):
+    v = vocab_cls('unk')
+    v.update(words.split())
+    f = BytesIO()
+    v.to_binary_file(f)
+    f.seek(0)
+    loaded = load_cls.from_binary_file(f)
+    assert isinstance(loaded, load_cls)
+    assert list(loaded) == list(v)
+    assert [loaded.count(w) for w in v] == [v.count(w) for w in v]
+    assert loaded.words2indices(words.split()) == v.words2indices(words.split())
+
+
+def test_binary_file_bad():
+    with pytest.raises(ValueError):
+        Vocab.from_binary_file(BytesIO(b'unk\t0\n'))
+
+
 class TestVocab(TestCase):
 
     def setUp(self):
@@ -104,6 +193,212 @@ class TestFrozen:
         assert words == ['i', 'like', 'pie', 'unk']
 
 
+class TestCompactVocab:
+
+    def test_unk(self):
+        v = CompactVocab('**UNK**')
+        assert len(v) == 1
+        assert '**UNK**' in v
+        assert v['**UNK**'] == 0
+        assert v.count('**UNK**') == 0
+
+    def test_add(self):
+        v = CompactVocab('unk')
+        assert v.add('hi') == 1
+        assert v.add('hi', count=2) == 1
+        assert v.count('hi') == 3
+        assert v['bye'] == 0
+        assert v.count('bye') == 0
+
+    def test_update_grows(self):
+        v = CompactVocab('unk')
+        words = [str(i % 100) for i in range(1000)]
+        indices = v.update(words)
+        assert indices[:3] == [1, 2, 3]
+        assert len(v) == 101
+        assert v.count('7') == 10
+        assert v.index2word(100) == '99'
+        assert list(v.counts) == [0] + [10] * 100
+
+    def test_same_as_vocab(self):
+        words = 'some words words for for for you you you you'.split()
+        v, c = Vocab('unk'), CompactVocab('unk')
+        assert v.update(words) == c.update(words)
+        assert dict(v) == dict(c)
+        assert list(v) == list(c)
+        assert v.words2indices(['you', 'said']) == c.words2indices(['you', 'said'])
+        assert v.indices2words([1, 2, 0]) == c.indices2words([1, 2, 0])
+        assert list(v.sort_by_decreasing_count()) == list(c.sort_by_decreasing_count())
+        assert list(v.prune_rares(3)) == list(c.prune_rares(3))
+        assert list(v.subset(['for', 'some'])) == list(c.subset(['for', 'some']))
+        assert c.sort_by_decreasing_count().count('you') == 4
+        assert v.get('you') == c.get('you') == 4
+        assert v.get('said') is None and c.get('said') is None
+        assert c.get('said', -1) == -1
+
+    def test_subset_unk_count(self):
+        # UNK keeps its count only if it is one of the words, as for Vocab
+        for cls in (Vocab, CompactVocab):
+            v = cls('unk')
+            v.update('a b b c'.split())
+            v.add('unk', count=5)
+            assert v.subset(['b', 'c']).count('unk') == 0
+            assert v.subset(['unk', 'b']).count('unk') == 5
+            assert v.prune_rares(2).count('unk') == 5
+            assert v.sort_by_decreasing_count().count('unk') == 5
+
+    def test_freeze(self):
+        v = CompactVocab('unk')
+        v.update(['i', 'like', 'pie'])
+        f = v.freeze()
+        assert f.words2indices(['i', 'said']) == [1, 0]
+        assert f.index2word(3) == 'pie'
+
+    def test_file(self):
+        lines = ['unk\t10\n', 'cat\t4\n', 'bear\t6']
+        v = CompactVocab.from_file(lines)
+        assert list(v) == ['unk', 'cat', 'bear']
+        assert list(v.counts) == [10, 4, 6]
+
+        class Writer(list):
+            write = list.append
+        f = Writer()
+        v.to_file(f)
+        assert CompactVocab.from_file(f) == v
+
+
+class TestMappedVocab:
+
+    @pytest.fixture
+    def mapped(self, vocab, tmpdir):
+        vocab.add(u'caf\xe9')
+        path = str(tmpdir.join('vocab.bin'))
+        MappedVocab.write(vocab, path)
+        return MappedVocab(path)
+
+    def test_lookup(self, vocab, mapped):
+        assert len(mapped) == len(vocab)
+        assert list(mapped) == list(vocab)
+        for w in vocab:
+            assert mapped.word2index(w) == vocab.word2index(w)
+            assert mapped.count(w) == vocab.count(w)
+            assert w in mapped
+        assert mapped[u'caf\xe9'] == 5
+        assert mapped.index2word(5) == u'caf\xe9'
+        assert mapped['missing'] == 0
+        assert mapped.get('missing') is None
+        assert mapped.get(u'caf\xe9') == 5
+        assert 'missing' not in mapped
+        assert mapped.count('missing') == 0
+        assert mapped.counts.tolist() == [0, 1, 1, 2, 3, 1]
+        assert mapped.words2indices(['two', 'four']) == [3, 0]
+
+    def test_pickle(self, mapped):
+        copied = pickle.loads(pickle.dumps(mapped))
+        assert list(copied) == list(mapped)
+        assert copied['three'] == 4
+
+    def test_subset(self, vocab, mapped):
+        sub, old_to_new = mapped.subset(['three', 'missing', 'one'], return_mapping=True)
+        assert isinstance(sub, Vocab)
+        assert sub == vocab.subset(['three', 'missing', 'one'])
+        assert sub.count('three') == 3
+        assert old_to_new.tolist() == [0, 0, 2, 0, 1, 0]
+
+    def test_to_file(self, vocab, mapped):
+        class Writer(list):
+            write = list.append
+        f = Writer()
+        mapped.to_file(f)
+        assert list(Vocab.from_file(f)) == list(mapped)
+        assert Vocab.from_file(f).count(u'caf\xe9') == 1
+
+    def test_from_compact(self, tmpdir):
+        v = CompactVocab('unk')
+        v.update([str(i) for i in range(1000)])
+        path = str(tmpdir.join('vocab.bin'))
+        MappedVocab.write(v, path)
+        mapped = MappedVocab(path)
+        assert mapped.words2indices([str(i) for i in range(1000)]) == list(range(1, 1001))
+
+    def test_bad_file(self, tmpdir):
+        path = str(tmpdir.join('vocab.bin'))
+        with open(path, 'wb') as f:
+            f.write(b'\0' * 64)
+        with pytest.raises(ValueError):
+            MappedVocab(path)
+
+
+class TestHashedVocab:
+
+    def test_buckets(self):
+        v = HashedVocab(16)
+        assert len(v) == 17
+        assert v.index2word(0) == u'***UNK***'
+        assert v.index2word(1) == u'<bucket 0>'
+        indices = v.words2indices(['a', 'cat', u'caf\xe9', 'a'])
+        assert all(1 <= i < 17 for i in indices)
+        assert indices[0] == indices[3]
+        # deterministic across instances
+        assert HashedVocab(16).words2indices(['a', 'cat', u'caf\xe9']) == indices[:3]
+        assert 'anything' in v
+        with pytest.raises(IndexError):
+            v.index2word(17)
+
+    def test_front(self, vocab):
+        v = HashedVocab(8, front=vocab)
+        assert len(v) == len(vocab) + 8
+        for w in vocab:
+            assert v[w] == vocab[w]
+            assert not v.is_hashed(v[w])
+        assert v.is_hashed(v['missing'])
+        assert v.index2word(1) == vocab.index2word(1)
+        assert v.index2word(len(vocab)) == u'<bucket 0>'
+
+        matrix, lengths = v.encode_batch([['one', 'missing'], ['two']])
+        assert matrix.tolist() == [[vocab['one'], v['missing']], [vocab['two'], 0]]
+
+    def test_ngrams(self, vocab):
+        v = HashedVocab(1000, front=vocab)
+        assert v.ngram_indices('one') == [vocab['one']]
+        # '<ab>': 2 trigrams and 1 4-gram, plus the word
+        indices = v.ngram_indices('ab')
+        assert len(indices) == 4
+        assert indices[0] == v['ab']
+        assert indices[1:] == [v.bucket(u'<ab'), v.bucket(u'ab>'), v.bucket(u'<ab>')]
+        assert len(v.ngram_indices('ab', include_word=False)) == 3
+
+    def test_counts(self):
+        v = HashedVocab(4)
+        v.update('a b a'.split())
+        assert v.count('a') >= 2
+        assert v.counts.sum() == 3
+        assert v.counts.shape == (5,)
+
+    def test_subset_and_file(self, vocab):
+        v = HashedVocab(8, front=vocab)
+        v.update('one missing missing'.split())
+        sub, old_to_new = v.subset(['three', 'one'], return_mapping=True)
+        assert list(sub)[:3] == ['unk', 'three', 'one']
+        assert len(sub) == 3 + 8
+        assert old_to_new.tolist() == [0, 0, 2, 0, 1] + list(range(3, 11))
+        assert sub.count('one') == 1
+        assert sub.count('missing') == 2
+        assert v.subset([]).front is not None
+
+        class Writer(list):
+            write = list.append
+        for hashed in [v, HashedVocab(8)]:
+            f = Writer()
+            hashed.to_file(f)
+            loaded = HashedVocab.from_file(f)
+            assert list(loaded) == list(hashed)
+            assert loaded.counts.tolist() == hashed.counts.tolist()
+            assert loaded['missing'] == hashed['missing']
+        with pytest.raises(ValueError):
+            HashedVocab.from_file([b'unk\t0\n', b'a\t1\n'])
+
+
 class TestSenna(TestVocab):
 
     def setUp(self):
@@ -114,3 +409,66 @@ class TestGlove(TestVocab):
 
     def setUp(self):
         self.Vocab = GloveVocab
+
+
+class TestEmbeddingsCache:
+
+    @pytest.fixture
+    def vectors(self):
+        rng = np.random.RandomState(0)
+        return OrderedDict((w, rng.uniform(-1, 1, size=50).astype(np.float32))
+                           for w in ['UNKNOWN', 'the', 'cat', u'caf\xe9', '. .'])
+
+    @staticmethod
+    def format_vector(v):
+        return ' '.join('{:.6f}'.format(x) for x in v)
+
+    def test_glove(self, vectors, tmpdir, monkeypatch):
+        monkeypatch.setattr(stanza, 'DATA_DIR', str(tmpdir))
+        tmpdir.mkdir('glove')
+        lines = [u'{} {}'.format(w, self.format_vector(v)) for w, v in vectors.items()]
+        lines.append(u'the ' + self.format_vector(np.zeros(50)))  # repeated words keep their first vector
+        zip_path = str(tmpdir.join('glove', 'wikipedia_gigaword.zip'))
+        with zipfile.ZipFile(zip_path, 'w') as zf:
+            zf.writestr('glove.6B.50d.txt', u'\n'.join(lines).encode('utf-8'))
+
+        v = GloveVocab()
+        v.update(['cat', 'dog', u'caf\xe9', '. .', 'the'])
+        for i in range(2):
+            if i == 1:
+                # the second call only reads the cache
+                os.remove(zip_path)
+            E = v.get_embeddings(corpus='wikipedia_gigaword', n_dim=50)
+            assert E.shape == (len(v), 50)
+            for w in ['UNKNOWN', 'cat', u'caf\xe9', '. .', 'the']:
+                assert np.allclose(E[v[w]], vectors[w], atol=1e-5)
+            assert np.allclose(E[v['dog']], vectors['UNKNOWN'], atol=1e-5)
+        assert tmpdir.join('glove', 'wikipedia_gigaword.50d.npy').check()
+
+        # the cache is opened once per process
+        prefix = str(tmpdir.join('glove', 'wikipedia_gigaword.50d'))
+        words, matrix = vocab_module._embedding_caches[prefix][1:]
+        assert vocab_module._open_embeddings_cache(prefix) == (words, matrix)
+        assert words._lookup('cat') == 2
+
+    def test_senna(self, vectors, tmpdir, monkeypatch):
+        monkeypatch.setattr(stanza, 'DATA_DIR', str(tmpdir))
+        senna = tmpdir.mkdir('senna')
+        senna.join('words.lst').write(u'\n'.join(vectors).encode('utf-8') + b'\n', 'wb')
+        senna.join('embeddings.txt').write('\n'.join(self.format_vector(v) for v in vectors.values()) + '\n')
+
+        v = SennaVocab()
+        v.update(['cat', 'dog'])
+        E = v.get_embeddings(rand=lambda shape: np.ones(shape))
+        assert np.allclose(E[v['cat']], vectors['cat'], atol=1e-5)
+        assert np.allclose(E[v['dog']], vectors['UNKNOWN'], atol=1e-5)
+
+    def test_backfill(self):
+        v = GloveVocab()
+        v.update(['a', 'b', 'c'])
+        E = np.arange(8.).reshape(4, 2)
+        v.backfill_unk_emb(E, {'a'})
+        assert E.tolist() == [[0, 1], [2, 3], [0, 1], [0, 1]]
+        E = np.arange(8.).reshape(4, 2)
+        v.backfill_unk_emb(E, np.array([False, False, True, False]))
+        assert E.tolist() == [[0, 1], [0, 1], [4, 5], [0, 1]]
@@ -0,0 +1,144 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from stanza.text.vocab import Vocab, CompactVocab
+from stanza.text.dataset import Dataset
+from stanza.text.vocab_builder import StreamingVocabBuilder, build_vocab_from_shards, count_shards, \
+    build_field_vocabs, LengthStats
+
+
+@pytest.fixture
+def tokens():
+    rng = np.random.RandomState(0)
+    # a Zipfian stream over a large vocabulary
+    return ['w{}'.format(i) for i in rng.zipf(1.5, size=20000)]
+
+
+def test_heavy_hitters(tokens):
+    builder = StreamingVocabBuilder(max_words=100, sketch_width=1024, chunk_size=1000)
+    builder.update(iter(tokens))
+    true_counts = Counter(tokens)
+
+    assert builder.n_tokens == len(tokens)
+    assert builder.error <= len(tokens) // 101
+    for w, c in true_counts.items():
+        lower, upper = builder.bounds(w)
+        assert lower <= c <= upper
+        if c > builder.error:
+            assert lower > 0
+
+    vocab = builder.build('unk', top_k=10)
+    assert isinstance(vocab, Vocab)
+    assert list(vocab)[1:] == [w for w, _ in true_counts.most_common(10)]
+
+
+def test_build_min_count(tokens):
+    builder = StreamingVocabBuilder(max_words=100, sketch_width=1024, chunk_size=1000)
+    builder.update(tokens)
+    vocab = builder.build('unk', min_count=200, vocab_cls=CompactVocab)
+    assert isinstance(vocab, CompactVocab)
+    assert len(vocab) > 1
+    assert all(vocab.count(w) >= 200 for w in list(vocab)[1:])
+
+
+def test_exact_when_small():
+    builder = StreamingVocabBuilder(max_words=10)
+    builder.update('a b b c c c'.split())
+    assert builder.error == 0
+    assert builder.bounds('c') == (3, 3)
+    assert builder.bounds('d') == (0, 0)
+    vocab = builder.build('unk')
+    assert list(vocab) == ['unk', 'c', 'b', 'a']
+    assert vocab.count('c') == 3
+
+
+def test_sketch_rows_independent():
+    builder = StreamingVocabBuilder(sketch_width=2 ** 20)
+    # same-length words that collided in every row when the rows were crc32 with different seeds
+    columns = builder._columns(['afbwl', 'ahaaa'])
+    assert (columns[0] != columns[1]).any()
+
+    words = ['w{}'.format(i) for i in range(20000)]
+    columns = builder._columns(words)
+    assert columns.shape == (20000, 4)
+    assert 0 <= columns.min() and columns.max() < 2 ** 20
+    order = np.argsort(columns[:, 0], kind='mergesort')
+    same_row0 = np.flatnonzero(np.diff(columns[order, 0]) == 0)
+    assert len(same_row0) > 0
+    for i in same_row0:
+        assert (columns[order[i], 1:] != columns[order[i + 1], 1:]).any()
+
+
+def test_memory_budget():
+    builder = StreamingVocabBuilder.from_memory_budget(1024 ** 2)
+    assert builder.sketch.nbytes <= 1024 ** 2 // 4
+    assert builder.max_words * StreamingVocabBuilder.BYTES_PER_WORD * 2 <= 1024 ** 2
+
+
+@pytest.fixture
+def shards(tmpdir):
+    texts = ['b a a\nc c', 'a d\nd d', '', 'e b']
+    paths = []
+    for i, text in enumerate(texts):
+        path = str(tmpdir.join('shard{}.txt'.format(i)))
+        with open(path, 'w') as f:
+            f.write(text)
+        paths.append(path)
+    return paths
+
+
+def test_count_shards(shards):
+    counts = count_shards(shards, workers=2)
+    assert counts == Counter({'a': 3, 'd': 3, 'b': 2, 'c': 2, 'e': 1})
+    assert count_shards(shards, workers=1) == counts
+    assert count_shards([], workers=1) == Counter()
+    # more workers than shards
+    assert count_shards(shards, workers=8) == counts
+    assert count_shards([]) == Counter()
+
+
+@pytest.mark.parametrize('vocab_cls', [Vocab, CompactVocab])
+def test_build_vocab_from_shards(shards, vocab_cls):
+    vocab = build_vocab_from_shards(shards, 'unk', workers=2, vocab_cls=vocab_cls)
+    assert isinstance(vocab, vocab_cls)
+    assert list(vocab) == ['unk', 'a', 'd', 'b', 'c', 'e']
+    assert vocab.count('d') == 3
+    assert list(build_vocab_from_shards(shards[::-1], 'unk', workers=1, vocab_cls=vocab_cls)) == list(vocab)
+
+
+@pytest.fixture
+def dataset():
+    return Dataset({'words': [['a', 'cat'], ['a', 'dog', 'ate'], ['the', 'cat', 'ate', 'a', 'bone']],
+                    'tags': [['D', 'N'], ['D', 'N', 'V'], ['D', 'N', 'V', 'D', 'N']],
+                    'label': ['x', 'y', 'x']})
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_field_vocabs(dataset, workers):
+    result = build_field_vocabs(dataset, ['words', 'tags', 'label'], unk='unk', char_fields=['words'],
+                                workers=workers)
+    assert list(result.vocabs['words']) == ['unk', 'a', 'ate', 'cat', 'bone', 'dog', 'the']
+    assert result.vocabs['words'].count('a') == 3
+    assert list(result.vocabs['tags']) == ['unk', 'D', 'N', 'V']
+    assert list(result.vocabs['label']) == ['unk', 'x', 'y']
+    assert set(result.char_vocabs) == {'words'}
+    assert result.char_vocabs['words'].count('a') == 7
+    assert result.lengths['words'] == LengthStats(3, 2, 5, 10 / 3., 3, 5, 5)
+    assert result.lengths['label'].max == 1
+
+
+def test_field_vocabs_defaults(dataset):
+    result = build_field_vocabs(dataset, vocab_cls=CompactVocab)
+    assert set(result.vocabs) == {'words', 'tags', 'label'}
+    assert isinstance(result.vocabs['tags'], CompactVocab)
+    with pytest.raises(ValueError):
+        build_field_vocabs(dataset, ['tags'], char_fields=['words'])
+
+
+def test_length_stats():
+    stats = LengthStats.from_histogram(np.bincount([1] * 90 + [10] * 9 + [50]))
+    assert (stats.count, stats.min, stats.max, stats.p50, stats.p95, stats.p99) == (100, 1, 50, 1, 10, 10)
+    assert stats.mean == (90 + 90 + 50) / 100.
+    assert LengthStats.from_histogram(np.zeros(1)).count == 0
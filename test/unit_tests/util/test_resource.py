@@ -0,0 +1,221 @@
+import hashlib
+import os
+import re
+import threading
+import zlib
+
+import pytest
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+import stanza
+from stanza.util.resource import download, file_checksum, get_data_or_download
+
+
+CONTENT = os.urandom(300000)
+LARGE = os.urandom(3 * 1024 ** 2)
+_compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+GZIPPED = _compressor.compress(b'text ' * 100000) + _compressor.flush()
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serves `content` at any path, with optional support for Range requests.
+
+    If `gzip` is set, it serves GZIPPED instead, with a gzip Content-Encoding. If `honors_ranges` is not set, it
+    advertises range support but answers every GET with the whole content.
+    """
+
+    content = CONTENT
+    supports_ranges = True
+    honors_ranges = True
+    gzip = False
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def send_content(self, body):
+        content = GZIPPED if self.gzip else self.content
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range') or '')
+        if match and self.supports_ranges and (self.honors_ranges or self.command == 'HEAD'):
+            begin = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) else len(content) - 1
+            if begin >= len(content):
+                self.send_response(416)
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(begin, end, len(content)))
+            data = content[begin:end + 1]
+        else:
+            self.send_response(200)
+            data = content
+        self.send_header('Content-Length', str(len(data)))
+        if self.gzip:
+            self.send_header('Content-Encoding', 'gzip')
+        if self.supports_ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        if body:
+            self.wfile.write(data)
+
+    def do_HEAD(self):
+        self.send_content(body=False)
+
+    def do_GET(self):
+        self.requests.append(self.headers.get('Range'))
+        self.send_content(body=True)
+
+
+@pytest.fixture
+def server():
+    RangeHandler.content = CONTENT
+    RangeHandler.supports_ranges = True
+    RangeHandler.honors_ranges = True
+    RangeHandler.gzip = False
+    RangeHandler.requests = []
+    httpd = HTTPServer(('127.0.0.1', 0), RangeHandler)
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield 'http://127.0.0.1:{}/data.bin'.format(httpd.server_port)
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_download(server, tmpdir):
+    path = str(tmpdir.join('data.bin'))
+    checksum = hashlib.sha256(CONTENT).hexdigest()
+    assert download(server, path, checksum=checksum, show_progress=False) == path
+    assert read(path) == CONTENT
+    assert not os.path.exists(path + '.part')
+    assert file_checksum(path) == checksum
+
+
+def test_resume(server, tmpdir):
+    path = str(tmpdir.join('data.bin'))
+    with open(path + '.part', 'wb') as f:
+        f.write(CONTENT[:1000])
+    download(server, path, show_progress=False)
+    assert read(path) == CONTENT
+    assert RangeHandler.requests == ['bytes=1000-']
+
+
+def test_resume_without_ranges(server, tmpdir):
+    RangeHandler.supports_ranges = False
+    path = str(tmpdir.join('data.bin'))
+    with open(path + '.part', 'wb') as f:
+        f.write(b'stale')
+    download(server, path, show_progress=False)
+    assert read(path) == CONTENT
+
+
+def test_resume_oversized_part(server, tmpdir):
+    path = str(tmpdir.join('data.bin'))
+    with open(path + '.part', 'wb') as f:
+        f.write(CONTENT + b'stale')
+    download(server, path, show_progress=False)
+    assert read(path) == CONTENT
+
+
+def test_gzip_encoding(server, tmpdir):
+    # the encoded bytes are saved as sent, so that resumed ranges line up with them
+    RangeHandler.gzip = True
+    path = str(tmpdir.join('data.bin'))
+    with open(path + '.part', 'wb') as f:
+        f.write(GZIPPED[:100])
+    download(server, path, show_progress=False)
+    assert read(path) == GZIPPED
+    assert RangeHandler.requests == ['bytes=100-']
+
+    os.remove(path)
+    download(server, path, segments=3, show_progress=False)
+    assert read(path) == GZIPPED
+
+
+def test_bad_checksum(server, tmpdir):
+    path = str(tmpdir.join('data.bin'))
+    with pytest.raises(IOError):
+        download(server, path, checksum='0' * 64, show_progress=False)
+    assert not os.path.exists(path)
+    assert not os.path.exists(path + '.part')
+
+
+def test_segments(server, tmpdir):
+    path = str(tmpdir.join('data.bin'))
+    download(server, path, segments=4, show_progress=False)
+    assert read(path) == CONTENT
+    assert sorted(RangeHandler.requests) == ['bytes=0-74999', 'bytes=150000-224999', 'bytes=225000-299999',
+                                             'bytes=75000-149999']
+    assert not tmpdir.join('data.bin.part.0').check()
+
+    # a part longer than its range is downloaded again
+    os.remove(path)
+    with open(path + '.part.1', 'wb') as f:
+        f.write(CONTENT)
+    download(server, path, segments=4, show_progress=False)
+    assert read(path) == CONTENT
+
+
+def test_segments_ranges_ignored(server, tmpdir):
+    # ranges are advertised, but every GET gets the whole content
+    RangeHandler.honors_ranges = False
+    path = str(tmpdir.join('data.bin'))
+    download(server, path, segments=4, show_progress=False)
+    assert read(path) == CONTENT
+    assert not tmpdir.join('data.bin.part.0').check()
+    assert not tmpdir.join('data.bin.part.1').check()
+
+
+def test_progress_resumed(server, tmpdir, monkeypatch):
+    from stanza.monitoring import progress
+    reported = []
+    monkeypatch.setattr(progress, 'start_task', lambda name, size: reported.append(('start', size)))
+    monkeypatch.setattr(progress, 'progress', reported.append)
+    monkeypatch.setattr(progress, 'end_task', lambda: None)
+    RangeHandler.content = LARGE
+    path = str(tmpdir.join('data.bin'))
+    mb = 1024 ** 2
+
+    # progress starts from the bytes already downloaded
+    with open(path + '.part', 'wb') as f:
+        f.write(LARGE[:2 * mb + 5])
+    download(server, path)
+    assert reported[:2] == [('start', 3), 2]
+    assert reported[-1] == 3
+
+    # and from those of the parts, when downloading segments
+    os.remove(path)
+    del reported[:]
+    for i in range(2):
+        with open('{}.part.{}'.format(path, i), 'wb') as f:
+            f.write(LARGE[i * 3 * mb // 4:(i + 1) * 3 * mb // 4])
+    download(server, path, segments=4)
+    assert read(path) == LARGE
+    assert reported[:2] == [('start', 3), 1]
+    assert reported[-1] == 3
+
+    # discarded bytes are taken off again, so that progress doesn't overshoot
+    os.remove(path)
+    del reported[:]
+    RangeHandler.honors_ranges = False
+    with open(path + '.part.0', 'wb') as f:
+        f.write(LARGE[:mb])
+    download(server, path, segments=4)
+    assert read(path) == LARGE
+    assert max(reported[1:]) == 3
+    assert reported[-1] == 3
+
+
+def test_get_data_or_download(server, tmpdir, monkeypatch):
+    monkeypatch.setattr(stanza, 'DATA_DIR', str(tmpdir))
+    path = get_data_or_download('resource', 'data.bin', server)
+    assert path == str(tmpdir.join('resource', 'data.bin'))
+    assert read(path) == CONTENT
+    # already present: no request is made
+    get_data_or_download('resource', 'data.bin', server)
+    assert len(RangeHandler.requests) == 1